@@ -0,0 +1,207 @@
+""" book search client behind lib.BookSearch (the Google Books API).
+
+    The reading list form searches as the author types, so a search comes
+    in on almost every keystroke. To keep those from holding a waitress
+    thread for a full remote round trip each, the client keeps:
+
+        - one requests Session per process with a pool of keep-alive
+          connections, so only the first search pays for the TCP and TLS
+          handshakes
+        - connect and read timeouts; a search that fails or times out
+          returns no books instead of hanging the request
+        - an in-process LRU cache of results, keyed by the normalized
+          keywords, whose entries expire after BOOK_SEARCH_CACHE_TTL
+        - prefix reuse: keywords that extend a cached search are answered
+          from its books that still match (see search_prefixes)
+"""
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+BOOK_SEARCH_URL = getattr(settings, 'BOOK_SEARCH_URL', 'https://www.googleapis.com/books/v1/volumes')
+
+# (connect, read) timeouts in seconds
+BOOK_SEARCH_TIMEOUT = getattr(settings, 'BOOK_SEARCH_TIMEOUT', (3.05, 5))
+
+# keep-alive connections per process (one per waitress thread is plenty)
+BOOK_SEARCH_POOL_SIZE = getattr(settings, 'BOOK_SEARCH_POOL_SIZE', 8)
+
+BOOK_SEARCH_CACHE_SIZE = getattr(settings, 'BOOK_SEARCH_CACHE_SIZE', 1000)
+BOOK_SEARCH_CACHE_TTL = getattr(settings, 'BOOK_SEARCH_CACHE_TTL', 60 * 60)
+
+# books asked for per search (the API allows up to 40). More than are shown
+# so a longer search has some left to pick from.
+BOOK_SEARCH_FETCH_SIZE = 20
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """ the process wide client, made the first time it is needed
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = BookSearchClient()
+        return _client
+
+
+###############################################################################
+# helper functions
+###############################################################################
+def normalize_keywords(keywords):
+    """ cache key for a search: lower case, single spaced
+    """
+    return " ".join(keywords.lower().split())
+
+
+def get_words(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def book_matches(book, words):
+    """ True if every one of the words starts a word of the book's title or
+        author (the last word is usually only partly typed)
+    """
+    book_words = get_words(book['title'] + " " + book['author'])
+    return all(any(w.startswith(word) for w in book_words) for word in words)
+
+
+def parse_book(item):
+    """ the fields the reading list uses from an API volume, or None if any
+        of them is missing
+    """
+    try:
+        info = item["volumeInfo"]
+        return {
+            'url': info["infoLink"],
+            'cover': info["imageLinks"]["smallThumbnail"],
+            'title': info["title"],
+            'author': info["authors"][0],
+        }
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+###############################################################################
+# cache
+###############################################################################
+class ResultCache(object):
+    """ thread safe LRU cache whose entries expire 'ttl' seconds after they
+        were stored
+    """
+    def __init__(self, size=BOOK_SEARCH_CACHE_SIZE, ttl=BOOK_SEARCH_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+###############################################################################
+# client
+###############################################################################
+class BookSearchClient(object):
+    def __init__(self, url=BOOK_SEARCH_URL, timeout=BOOK_SEARCH_TIMEOUT, pool_size=BOOK_SEARCH_POOL_SIZE,
+                 cache=None):
+        self.url = url
+        self.timeout = timeout
+        self.cache = cache if cache is not None else ResultCache()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, keywords):
+        """ ask the API. Returns (books, complete) where complete is True if
+            the API has no more books for these keywords than it returned.
+        """
+        response = self.session.get(
+            self.url,
+            params={'q': keywords, 'maxResults': BOOK_SEARCH_FETCH_SIZE},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+        data = response.json()
+        items = data.get('items', [])
+        books = [book for book in (parse_book(item) for item in items) if book]
+        return books, data.get('totalItems', 0) <= len(items)
+
+    def search_prefixes(self, key, max_len):
+        """ answer a search from a cached search for a prefix of its
+            keywords (e.g. 'war and pe' from 'war and'). The prefix's books
+            that match the longer keywords are used if there are at least
+            max_len of them, or if the prefix search found every book there
+            was. Returns None if no cached prefix can answer.
+        """
+        words = get_words(key)
+        for end in range(len(key) - 1, 0, -1):
+            entry = self.cache.get(key[:end])
+            if entry is None:
+                continue
+
+            books, complete = entry
+            matches = [book for book in books if book_matches(book, words)]
+            if complete or len(matches) >= max_len:
+                return matches
+
+            # the longest cached prefix is the closest search there is
+            break
+        return None
+
+    def search(self, keywords, max_len):
+        """ the first max_len books found for the keywords (copies, callers
+            can change them). Returns an empty list if the API can't be
+            reached.
+        """
+        key = normalize_keywords(keywords)
+        if not key:
+            return []
+
+        entry = self.cache.get(key)
+        if entry is None:
+            books = self.search_prefixes(key, max_len)
+            if books is not None:
+                return [dict(book) for book in books[:max_len]]
+
+            try:
+                entry = self.fetch(key)
+            except (requests.RequestException, ValueError):
+                return []
+            self.cache.set(key, entry)
+
+        books, complete = entry
+        return [dict(book) for book in books[:max_len]]
@@ -0,0 +1,430 @@
+""" set based versions of the dashboard bulk actions (see dashboard_backend).
+
+    Going through Model.save() and Model.delete() one item at a time costs a
+    handful of queries per checked item. Each action here instead:
+
+        - loads every selected row with one query
+        - changes them with one UPDATE ... WHERE slug IN (...) (or one
+          DELETE), inside a single transaction
+        - logs the Activity rows with one bulk_create
+        - does the bookkeeping save() and delete() would have done (the
+          Statistic counters, the page cache and the pagination counts)
+          once for the whole batch; nothing listens for post_delete on
+          these models, so the DELETE stays a single statement
+
+    Media files are left behind; blog.media collects the ones nothing
+    refers to anymore.
+
+    publish_scheduled is the same idea run by the worker instead of the
+    dashboard: it publishes every Highlight and draft whose publish_at has
+    passed.
+
+    Every action returns a list of (status, tokens) tuples, one for each
+    requested item in the order they were given, in the same format as the
+    single item helpers in blog.views so they can go straight into a
+    lib.FlashMessageManager.
+"""
+import copy
+import datetime
+
+import pytz
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, Value, F, DateTimeField, TextField
+from django.core.urlresolvers import reverse
+
+from blog import lib, pagecache
+from blog.pagination import get_table_group, tables_changed
+from blog.models import Idea, Thought, Highlight, ReadingListItem, Note, Activity, Statistic, SearchEntry
+
+
+###############################################################################
+# helpers
+###############################################################################
+def get_now():
+    """ the current time the way Thought.save() stamps it
+    """
+    return pytz.timezone(settings.TIME_ZONE).localize(datetime.datetime.now())
+
+
+def get_activity(author, type_name, tokens, url):
+    """ unsaved Activity for bulk_create. bulk_create skips Activity.save(),
+        so the message is rendered here.
+    """
+    activity = Activity(author=author, type=Activity.get_type_id(type_name), url=url)
+    activity.store_tokens(tokens)
+    activity.message = activity.generate_message()
+    return activity
+
+
+def get_stat_names(objects):
+    """ the Statistic counters a list of objects counts towards, with one
+        entry per object (see Statistic.adjust)
+    """
+    return [name for obj in objects for name in obj.get_stat_names()]
+
+
+def parse_ids(ids):
+    """ integer primary keys from the posted ids. Anything that isn't a
+        number can't match a row and is dropped.
+    """
+    parsed = []
+    for i in ids:
+        try:
+            parsed.append(int(i))
+        except (TypeError, ValueError):
+            pass
+    return lib.remove_duplicates(parsed)
+
+
+def missing(name, key):
+    return False, {'error': "%s '%s' does not exist" % (name, key)}
+
+
+def thoughts_updated(originals, thoughts):
+    """ bookkeeping Thought.save() does after an UPDATE that skipped it
+    """
+    Statistic.adjust(removed=get_stat_names(originals), added=get_stat_names(thoughts))
+    SearchEntry.update_visibility(thoughts)
+    pagecache.thoughts_changed(originals, thoughts)
+    pagecache.invalidate(get_table_group(Thought))
+
+
+def get_thoughts(slugs, select_idea=False):
+    """ return the requested slugs (cleaned up) and a dictionary of slug ->
+        Thought for the ones that exist
+    """
+    slugs = lib.remove_duplicates([lib.slugify(s) for s in slugs])
+
+    thoughts = Thought.objects.all()
+    if select_idea:
+        thoughts = thoughts.select_related('idea')
+    return slugs, thoughts.in_bulk(slugs)
+
+
+###############################################################################
+# Thoughts
+###############################################################################
+def trash_thoughts(slugs, author, trash=True):
+    """ move Thoughts to (or out of) the trash
+    """
+    slugs, found = get_thoughts(slugs)
+    results = []
+
+    with transaction.atomic():
+        originals = list(found.values())
+        thoughts = [copy.copy(t) for t in originals]
+        now = get_now()
+
+        Thought.objects.filter(slug__in=found.keys()).update(is_trash=trash, date_edited=now)
+
+        activities = []
+        for t in thoughts:
+            t.is_trash = trash
+            t.date_edited = now
+
+            if trash:
+                activities.append(get_activity(
+                    author,
+                    'Trashed Draft' if t.is_draft else 'Trashed Thought',
+                    {'length': 1, 'title': t.title, 'slug': t.slug},
+                    reverse('dashboard-trash'),
+                ))
+            else:
+                activities.append(get_activity(
+                    author,
+                    'Untrashed Draft' if t.is_draft else 'Untrashed Thought',
+                    {'length': 1, 'title': t.title, 'slug': t.slug},
+                    reverse('dashboard-author') + "?id=" + t.slug,
+                ))
+        Activity.objects.bulk_create(activities)
+
+        thoughts_updated(originals, thoughts)
+
+    for slug in slugs:
+        results.append((True, {'thought': slug}) if slug in found else missing('Thought', slug))
+    return results
+
+
+def publish_thoughts(slugs, author, publish=True, auto_update=False):
+    """ publish Thoughts (or move them back to the drafts). With auto_update
+        Drafts that get published have their date_published set to now, like
+        Thought.save(auto_update=True).
+    """
+    slugs, found = get_thoughts(slugs, select_idea=True)
+    results = []
+
+    with transaction.atomic():
+        originals = list(found.values())
+        thoughts = [copy.copy(t) for t in originals]
+        now = get_now()
+
+        changes = {'is_draft': not publish, 'date_edited': now}
+        if publish:
+            changes['publish_at'] = None
+        if publish and auto_update:
+            changes['date_published'] = Case(
+                When(is_draft=True, then=Value(now)),
+                default=F('date_published'),
+                output_field=DateTimeField(),
+            )
+        Thought.objects.filter(slug__in=found.keys()).update(**changes)
+
+        activities = []
+        for t in thoughts:
+            if publish and auto_update and t.is_draft:
+                t.date_published = now
+
+            if not publish:
+                activities.append(get_activity(
+                    author,
+                    'Unpublished Thought',
+                    {'length': 1, 'title': t.title, 'slug': t.slug},
+                    reverse('dashboard-author') + "?id=" + t.slug,
+                ))
+            elif t.is_draft:
+                activities.append(get_activity(
+                    author,
+                    'Published Draft',
+                    {'length': 1, 'title': t.title, 'slug': t.slug},
+                    reverse('dashboard-author') + "?id=" + t.slug,
+                ))
+
+            t.is_draft = not publish
+            t.date_edited = now
+            if publish:
+                t.publish_at = None
+        Activity.objects.bulk_create(activities)
+
+        thoughts_updated(originals, thoughts)
+
+    for slug in slugs:
+        if slug in found:
+            results.append((True, {'thought': slug, 'page': 'Drafts' if not publish else found[slug].idea.name}))
+        else:
+            results.append(missing('Thought', slug))
+    return results
+
+
+def move_thoughts(slugs, author, idea_slug):
+    """ move Thoughts to another Idea
+    """
+    slugs, found = get_thoughts(slugs, select_idea=True)
+
+    try:
+        idea = Idea.objects.get(slug=lib.slugify(idea_slug))
+    except Idea.DoesNotExist:
+        return [missing('Idea', idea_slug) for slug in slugs]
+
+    with transaction.atomic():
+        originals = list(found.values())
+        thoughts = [copy.copy(t) for t in originals]
+        now = get_now()
+
+        activities = []
+        for t in thoughts:
+            activities.append(get_activity(
+                author,
+                'Moved Draft' if t.is_draft else 'Moved Thought',
+                {'title': t.title, 'slug': t.slug, 'old_idea': t.idea.name, 'new_idea': idea_slug},
+                reverse('dashboard-author') + "?id=" + t.slug,
+            ))
+
+            t.idea = idea
+            t.date_edited = now
+
+            # the "(Read More)" link has the Idea in it
+            t.update_excerpts()
+
+        if thoughts:
+            Thought.objects.filter(slug__in=found.keys()).update(
+                idea=idea,
+                date_edited=now,
+                excerpt_link=Case(
+                    *[When(slug=t.slug, then=Value(t.excerpt_link)) for t in thoughts],
+                    output_field=TextField()
+                ),
+            )
+        Activity.objects.bulk_create(activities)
+
+        thoughts_updated(originals, thoughts)
+
+    return [(True, {'thought': slug, 'idea': idea.name}) if slug in found else missing('Thought', slug)
+            for slug in slugs]
+
+
+def delete_thoughts(slugs, author):
+    """ delete Thoughts (their images are collected later by blog.media)
+    """
+    slugs, found = get_thoughts(slugs)
+
+    with transaction.atomic():
+        thoughts = list(found.values())
+
+        activities = []
+        for t in thoughts:
+            activities.append(get_activity(
+                author,
+                'Deleted Draft' if t.is_draft else 'Deleted Thought',
+                {'length': 1, 'title': t.title, 'idea': t.idea_id},
+                reverse('dashboard-thoughts') + "?id=" + t.idea_id,
+            ))
+
+        pagecache.thoughts_changed(thoughts)
+        Thought.objects.filter(slug__in=found.keys()).delete()
+        Activity.objects.bulk_create(activities)
+        Statistic.adjust(removed=get_stat_names(thoughts))
+
+    tables_changed(Thought)
+
+    return [(True, {'thought': slug}) if slug in found else missing('Thought', slug) for slug in slugs]
+
+
+###############################################################################
+# Highlights, Books and Notes
+###############################################################################
+def delete_highlights(ids, author):
+    """ delete Highlights (their icons are collected later by blog.media)
+    """
+    ids = parse_ids(ids)
+    results = []
+
+    with transaction.atomic():
+        found = Highlight.objects.in_bulk(ids)
+        highlights = list(found.values())
+
+        Highlight.objects.filter(id__in=found.keys()).delete()
+        Activity.objects.bulk_create([
+            get_activity(author, 'Deleted Highlight', {'title': h.title, 'id': h.id}, reverse('dashboard-highlights'))
+            for h in highlights
+        ])
+        Statistic.adjust(removed=get_stat_names(highlights))
+
+    if highlights:
+        pagecache.highlight_changed(highlights[0])
+        tables_changed(Highlight)
+
+    for i in ids:
+        if i in found:
+            results.append((True, {'highlight_title': found[i].title, 'highlight_id': i}))
+        else:
+            results.append((False, {'highlight': i, 'error': "Highlight does not exist"}))
+    return results
+
+
+def delete_books(ids, author):
+    """ delete books from the reading list
+    """
+    ids = parse_ids(ids)
+    results = []
+
+    with transaction.atomic():
+        found = ReadingListItem.objects.in_bulk(ids)
+        books = list(found.values())
+
+        ReadingListItem.objects.filter(id__in=found.keys()).delete()
+        Activity.objects.bulk_create([
+            get_activity(author, 'Deleted Book', {'title': b.title, 'id': b.id}, reverse('dashboard-books'))
+            for b in books
+        ])
+        Statistic.adjust(removed=get_stat_names(books))
+
+    if books:
+        pagecache.reading_list_changed(books[0])
+        tables_changed(ReadingListItem)
+
+    for i in ids:
+        if i in found:
+            results.append((True, {'book_title': "'%s' (#%d)" % (found[i].title, i)}))
+        else:
+            results.append(missing('Book', i))
+    return results
+
+
+def delete_notes(ids, author):
+    """ delete Notes
+    """
+    ids = parse_ids(ids)
+
+    with transaction.atomic():
+        found = Note.objects.in_bulk(ids)
+
+        Note.objects.filter(id__in=found.keys()).delete()
+        Activity.objects.bulk_create([
+            get_activity(author, 'Deleted Note', {'id': n.id, 'title': n.title}, reverse('dashboard-notes'))
+            for n in found.values()
+        ])
+
+    tables_changed(Note)
+
+    return [(True, {'title': found[i].title}) if i in found else missing('Note', i) for i in ids]
+
+
+###############################################################################
+# Scheduled publishing
+###############################################################################
+def publish_due_highlights(now):
+    """ publish the Highlights whose publish_at has passed. Returns how many
+        were published.
+    """
+    with transaction.atomic():
+        count = Highlight.objects.filter(is_published=False, publish_at__lte=now).update(
+            is_published=True,
+            date_published=F('publish_at'),
+            publish_at=None,
+        )
+        Statistic.adjust(added=['highlight_count'] * count)
+
+    if count:
+        pagecache.highlight_changed(None)
+        pagecache.invalidate(get_table_group(Highlight))
+    return count
+
+
+def publish_due_thoughts(now):
+    """ publish the drafts whose publish_at has passed, dated when they were
+        due. Returns how many were published.
+    """
+    with transaction.atomic():
+        due = Thought.objects.select_for_update().select_related('author').filter(
+            is_draft=True, is_trash=False, publish_at__lte=now,
+        )
+        originals = list(due)
+        if not originals:
+            return 0
+        thoughts = [copy.copy(t) for t in originals]
+
+        Thought.objects.filter(slug__in=[t.slug for t in originals]).update(
+            is_draft=False,
+            date_published=F('publish_at'),
+            date_edited=now,
+            publish_at=None,
+        )
+
+        activities = []
+        for t in thoughts:
+            activities.append(get_activity(
+                t.author,
+                'Published Draft',
+                {'length': 1, 'title': t.title, 'slug': t.slug},
+                reverse('dashboard-author') + "?id=" + t.slug,
+            ))
+
+            t.is_draft = False
+            t.date_published = t.publish_at
+            t.date_edited = now
+            t.publish_at = None
+        Activity.objects.bulk_create(activities)
+
+        thoughts_updated(originals, thoughts)
+
+    return len(thoughts)
+
+
+def publish_scheduled(now=None):
+    """ publish everything that is due. Returns the number of Highlights and
+        Thoughts published.
+    """
+    now = now or get_now()
+    return publish_due_highlights(now), publish_due_thoughts(now)
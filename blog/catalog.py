@@ -0,0 +1,304 @@
+""" local book catalog that lib.BookSearch answers from before it asks the
+    remote API (see blog.books).
+
+    The catalog is a separate read-only SQLite file (BOOK_CATALOG_PATH)
+    built by the import_book_catalog management command from a bulk dump of
+    book metadata, so it is the same file whatever database the site runs
+    on. It holds the books and two FTS5 indexes over their titles and
+    authors:
+
+        - books_fts (unicode61 words, with prefix indexes) answers prefix
+          searches: every keyword has to start a word of the title or
+          author. The import stores the books most popular first, so the
+          index can hand over the CATALOG_PREFIX_CANDIDATES most popular
+          matches without looking at the rest (a one letter search matches
+          a good part of the catalog). Those are ranked by how well the
+          keywords match (see score_prefix), then by popularity.
+        - books_trigram (trigram tokens) answers fuzzy searches when no
+          book matches by prefix, e.g. a misspelled title. Only the rarest
+          trigrams of the keywords are looked up (CATALOG_TRIGRAM_POSTINGS
+          books in all), the books sharing the most of them are the
+          candidates, and those are ranked by the share of the keywords'
+          trigrams they contain, like pg_trgm's word_similarity.
+
+    SQLite builds without the trigram tokenizer (older than 3.34) get a
+    catalog without books_trigram; searches then only match prefixes.
+"""
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+import paths
+
+BOOK_CATALOG_PATH = getattr(settings, 'BOOK_CATALOG_PATH', os.path.join(paths.DATABASE_DIR, 'book_catalog.sqlite3'))
+
+# most popular prefix matches that are ranked, and how much a book's
+# popularity (the log of e.g. its ratings count) adds to its match score
+CATALOG_PREFIX_CANDIDATES = 200
+CATALOG_POPULARITY_WEIGHT = 0.25
+
+# fuzzy matches have to contain at least this share of the keywords'
+# trigrams. The trigram lookups stop before they'd go over
+# CATALOG_TRIGRAM_POSTINGS books, so a search made of common trigrams only
+# is left to the remote API.
+CATALOG_TRIGRAM_THRESHOLD = 0.5
+CATALOG_TRIGRAM_POSTINGS = 5000
+CATALOG_TRIGRAM_CANDIDATES = 50
+
+CATALOG_BATCH_SIZE = 10000
+
+SCHEMA = [
+    """CREATE TABLE books (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        author TEXT NOT NULL,
+        url TEXT NOT NULL,
+        cover TEXT NOT NULL,
+        boost REAL NOT NULL
+    )""",
+    """CREATE VIRTUAL TABLE books_fts USING fts5(
+        title, author, content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )""",
+]
+TRIGRAM_SCHEMA = [
+    """CREATE VIRTUAL TABLE books_trigram USING fts5(
+        title, author, content='books', content_rowid='id', tokenize='trigram'
+    )""",
+    "CREATE VIRTUAL TABLE books_trigram_vocab USING fts5vocab(books_trigram, 'row')",
+]
+
+_local = threading.local()
+
+
+###############################################################################
+# helper functions
+###############################################################################
+def get_words(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def get_trigrams(text):
+    """ the trigrams of each word of the text (words shorter than three
+        letters have none)
+    """
+    return set(w[i:i + 3] for w in get_words(text) for i in range(len(w) - 2))
+
+
+def get_connection(path=None):
+    """ a read-only connection to the catalog for this thread, or None if
+        there is no catalog. A catalog imported since the last search is
+        picked up on the next one.
+    """
+    path = path or BOOK_CATALOG_PATH
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    key = (path, stat.st_ino, stat.st_mtime)
+    if getattr(_local, 'key', None) != key:
+        if getattr(_local, 'connection', None) is not None:
+            _local.connection.close()
+        _local.connection = sqlite3.connect('file:%s?mode=ro' % path, uri=True)
+        _local.key = key
+    return _local.connection
+
+
+def to_book(row):
+    return {'title': row[0], 'author': row[1], 'url': row[2], 'cover': row[3]}
+
+
+def score_prefix(words, title, author):
+    """ how well the keywords match a book: a whole title word is worth
+        more than the start of one, and the title more than the author
+    """
+    title_words = get_words(title)
+    author_words = get_words(author)
+
+    score = 0
+    for word in words:
+        if word in title_words:
+            score += 4
+        elif any(w.startswith(word) for w in title_words):
+            score += 3
+        elif word in author_words:
+            score += 2
+        else:
+            score += 1
+    return score
+
+
+###############################################################################
+# search
+###############################################################################
+def search_prefix(connection, words, max_len):
+    rows = connection.execute(
+        """SELECT b.title, b.author, b.url, b.cover, b.boost
+           FROM books_fts f JOIN books b ON b.id = f.rowid
+           WHERE books_fts MATCH ?
+           ORDER BY f.rowid
+           LIMIT ?""",
+        (" ".join('"%s"*' % w for w in words), CATALOG_PREFIX_CANDIDATES),
+    )
+
+    scored = [(score_prefix(words, row[0], row[1]) + CATALOG_POPULARITY_WEIGHT * row[4], row) for row in rows]
+    scored.sort(key=lambda s: -s[0])
+    return [to_book(row) for score, row in scored[:max_len]]
+
+
+def search_trigram(connection, keywords, max_len):
+    trigrams = get_trigrams(keywords)
+    if not trigrams:
+        return []
+
+    try:
+        counts = connection.execute(
+            "SELECT term, doc FROM books_trigram_vocab WHERE term IN (%s) ORDER BY doc" % ",".join("?" * len(trigrams)),
+            list(trigrams),
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # built without the trigram tokenizer
+        return []
+
+    # count how many of the rarest trigrams each book has
+    shared = Counter()
+    postings = 0
+    for trigram, count in counts:
+        postings += count
+        if postings > CATALOG_TRIGRAM_POSTINGS:
+            break
+        rows = connection.execute("SELECT rowid FROM books_trigram WHERE books_trigram MATCH ?", ('"%s"' % trigram,))
+        shared.update(rowid for rowid, in rows)
+
+    candidates = [rowid for rowid, count in shared.most_common(CATALOG_TRIGRAM_CANDIDATES)]
+    if not candidates:
+        return []
+
+    rows = connection.execute(
+        "SELECT title, author, url, cover, boost FROM books WHERE id IN (%s)" % ",".join("?" * len(candidates)),
+        candidates,
+    )
+
+    scored = []
+    for row in rows:
+        score = len(trigrams & get_trigrams(row[0] + " " + row[1])) / len(trigrams)
+        if score >= CATALOG_TRIGRAM_THRESHOLD:
+            scored.append((score, row[4], row))
+
+    scored.sort(key=lambda s: (-s[0], -s[1]))
+    return [to_book(row) for score, boost, row in scored[:max_len]]
+
+
+def search(keywords, max_len, path=None):
+    """ up to max_len books from the catalog, best match first, in the
+        BookSearch format. Returns an empty list if nothing matches or there
+        is no catalog.
+    """
+    words = get_words(keywords)
+    if not words:
+        return []
+
+    connection = get_connection(path)
+    if connection is None:
+        return []
+
+    return search_prefix(connection, words, max_len) or search_trigram(connection, keywords, max_len)
+
+
+###############################################################################
+# import
+###############################################################################
+def parse_record(record):
+    """ a book dict for build from a record of a metadata dump (a JSON
+        object or a CSV row). The author can be an 'author' string or the
+        first of an 'authors' list.
+    """
+    author = record.get('author')
+    if not author:
+        authors = record.get('authors') or ['']
+        author = authors if isinstance(authors, str) else authors[0]
+
+    return {
+        'title': (record.get('title') or '').strip(),
+        'author': (author or '').strip(),
+        'url': record.get('url') or '',
+        'cover': record.get('cover') or '',
+        'popularity': record.get('popularity'),
+    }
+
+
+def get_boost(popularity):
+    try:
+        return math.log1p(max(float(popularity or 0), 0))
+    except ValueError:
+        return 0.0
+
+
+def build(records, path=None, batch_size=CATALOG_BATCH_SIZE):
+    """ build a new catalog from an iterable of dump records (see
+        parse_record) and swap it in for the old one. Books without a title
+        are skipped. Returns the number of books.
+
+        The books are loaded into a temporary table first and copied over
+        most popular first (see search_prefix).
+    """
+    path = path or BOOK_CATALOG_PATH
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("PRAGMA temp_store = FILE")
+        connection.execute("CREATE TEMP TABLE staging (title, author, url, cover, boost)")
+        for statement in SCHEMA:
+            connection.execute(statement)
+        try:
+            for statement in TRIGRAM_SCHEMA:
+                connection.execute(statement)
+            indexes = ['books_fts', 'books_trigram']
+        except sqlite3.OperationalError:
+            indexes = ['books_fts']
+
+        count = 0
+        batch = []
+        for record in records:
+            record = parse_record(record)
+            if not record['title']:
+                continue
+            batch.append((record['title'], record['author'], record['url'], record['cover'],
+                          get_boost(record['popularity'])))
+            if len(batch) >= batch_size:
+                count += insert_books(connection, batch)
+                batch = []
+        count += insert_books(connection, batch)
+
+        connection.execute(
+            "INSERT INTO books (title, author, url, cover, boost) "
+            "SELECT title, author, url, cover, boost FROM staging ORDER BY boost DESC"
+        )
+        connection.execute("DROP TABLE staging")
+
+        # indexing everything at once is much faster than row by row
+        for index in indexes:
+            connection.execute("INSERT INTO %s(%s) VALUES('rebuild')" % (index, index))
+            connection.execute("INSERT INTO %s(%s) VALUES('optimize')" % (index, index))
+        connection.commit()
+    finally:
+        connection.close()
+
+    os.replace(tmp_path, path)
+    return count
+
+
+def insert_books(connection, batch):
+    connection.executemany("INSERT INTO staging VALUES (?, ?, ?, ?, ?)", batch)
+    return len(batch)
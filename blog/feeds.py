@@ -0,0 +1,99 @@
+""" Atom and RSS feeds of the latest published Thoughts, for the whole site
+    and for each Idea.
+
+    The items come from the precomputed excerpts (see
+    Thought.update_excerpts), so building a feed is one query. The feed
+    views are wrapped in pagecache.cache_feed, which keeps the serialized
+    XML until a Thought in the feed is published, edited or trashed and
+    answers conditional GETs from feed readers with a 304.
+"""
+from django.contrib.syndication.views import Feed
+from django.core.urlresolvers import reverse
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+
+from blog import pagecache
+from blog.models import Idea, Thought
+
+FEED_TITLE = "Slacker Paradise"
+FEED_DESCRIPTION = "The latest Thoughts from Slacker Paradise."
+FEED_ITEMS = 20
+
+
+class ThoughtFeed(Feed):
+    """ RSS feed of the latest Thoughts on the site
+    """
+    feed_type = Rss201rev2Feed
+    title = FEED_TITLE
+    description = FEED_DESCRIPTION
+
+    def link(self):
+        return reverse('index')
+
+    def get_thoughts(self):
+        return Thought.objects.filter(is_draft=False, is_trash=False)\
+            .select_related('idea', 'author').defer('content')
+
+    def items(self):
+        return self.get_thoughts().order_by('-date_published', '-slug')[:FEED_ITEMS]
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.excerpt
+
+    def item_link(self, item):
+        return item.get_absolute_url()
+
+    def item_pubdate(self, item):
+        return item.date_published
+
+    def item_updateddate(self, item):
+        return item.date_edited
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_categories(self, item):
+        return [item.idea.name]
+
+
+class AtomThoughtFeed(ThoughtFeed):
+    """ Atom version of ThoughtFeed
+    """
+    feed_type = Atom1Feed
+    subtitle = FEED_DESCRIPTION
+
+
+class IdeaFeed(ThoughtFeed):
+    """ RSS feed of the latest Thoughts in one Idea
+    """
+    def get_object(self, request, idea_slug):
+        return Idea.objects.get(slug=idea_slug)
+
+    def title(self, idea):
+        return "%s :: %s" % (FEED_TITLE, idea.name)
+
+    def link(self, idea):
+        return reverse('idea-page', kwargs={'idea_slug': idea.slug})
+
+    def description(self, idea):
+        return idea.strip_tags()
+
+    def items(self, idea):
+        return self.get_thoughts().filter(idea=idea).order_by('-date_published', '-slug')[:FEED_ITEMS]
+
+
+class AtomIdeaFeed(IdeaFeed):
+    """ Atom version of IdeaFeed
+    """
+    feed_type = Atom1Feed
+
+    def subtitle(self, idea):
+        return idea.strip_tags()
+
+
+rss = pagecache.cache_feed(ThoughtFeed())
+atom = pagecache.cache_feed(AtomThoughtFeed())
+idea_rss = pagecache.cache_feed(IdeaFeed())
+idea_atom = pagecache.cache_feed(AtomIdeaFeed())
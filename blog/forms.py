@@ -64,7 +64,10 @@ class ThoughtForm(forms.ModelForm):
 
     class Meta:
         model = Thought
-        fields = ['title', 'slug', 'author', 'content', 'idea', 'preview', 'is_draft']
+        fields = ['title', 'slug', 'author', 'content', 'idea', 'preview', 'is_draft', 'publish_at']
+        labels = {
+            'publish_at': 'Publish at',
+        }
         widgets = {
             # tinymce textarea (when js is enabled)
             'content': forms.Textarea(attrs={
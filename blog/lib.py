@@ -1,36 +1,75 @@
 import os
 import re
 import io
+import hashlib
 import datetime
+from urllib.parse import urlparse, unquote
 
-import requests
-import boto
 import pytz
 import PIL
-from PIL import Image
-from lxml import etree
-from lxml.html.clean import Cleaner
+from PIL import Image, ImageOps, features
 
 from django.conf import settings
 from django.contrib import messages
-from django.template import defaultfilters
+from django.core.files import File
 from django.core.files.storage import default_storage
+from django.db import transaction, IntegrityError
+from django.db.models import Q
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils import timezone
 from django.utils.http import urlunquote_plus
 
 import paths
+from blog import books, catalog, sanitizer
 
 ###############################################################################
 # app level defines
 ###############################################################################
 MAX_UPLOAD_SIZE = 104857600  # (1024 * 1024 bits * 100)
 
+# how upload_file names files: 'hash' (content hash), 'name-hash' (original
+# name and content hash) or 'name' (original name, numbered on collision)
+UPLOAD_FILENAME_MODE = getattr(settings, 'UPLOAD_FILENAME_MODE', 'name-hash')
+UPLOAD_HASH_LENGTH = 16
+
+# uploads are read UPLOAD_CHUNK_SIZE bytes at a time and sent to S3 in parts
+# of S3_PART_SIZE (S3 needs every part but the last to be at least 5 MB)
+UPLOAD_CHUNK_SIZE = 64 * 1024
+S3_PART_SIZE = 8 * 1024 * 1024
+
 THOUGHT_PREVIEW_IMAGE_SIZE = (600, 300)
 IDEA_PREVIEW_IMAGE_SMALL_SIZE = (600, 150)
 IDEA_PREVIEW_IMAGE_SIZE = (600, 300)
 HIGHLIGHT_PREVIEW_IMAGE_SIZE = (200, 150)
 
+# resize_image decodes and box-filters big images down to no less than
+# IMAGE_REDUCE_GAP times the target size before the final LANCZOS resample.
+# Images that would still be more than IMAGE_MAX_DECODE_PIXELS pixels after
+# that are refused instead of decoded (None for no limit).
+IMAGE_REDUCE_GAP = 2
+IMAGE_MAX_DECODE_PIXELS = getattr(settings, 'IMAGE_MAX_DECODE_PIXELS', None)
+EXIF_ORIENTATION_TAG = 0x0112
+
+# narrower copies of every resized image for srcset (only the widths below
+# the image's own width are made), and the WebP quality for all of them
+IMAGE_VARIANT_WIDTHS = (150, 300, 450)
+IMAGE_WEBP_QUALITY = 80
+
+# resized images are encoded as JPEG if they look like photos and as PNG if
+# they are graphics (no more than IMAGE_GRAPHIC_MAX_COLORS colours) or have
+# any transparency (see choose_image_format)
+IMAGE_JPEG_QUALITY = 85
+IMAGE_GRAPHIC_MAX_COLORS = 256
+
+# image_widths of an image that couldn't be processed start with this (see
+# failed_image_widths)
+IMAGE_FAILED_MARK = '!'
+
+IMAGE_ENCODINGS = {
+    'JPEG': ('image/jpeg', {'quality': IMAGE_JPEG_QUALITY, 'optimize': True, 'progressive': True}),
+    'PNG': ('image/png', {'optimize': True}),
+}
+
 DEFAULT_TRUNCATE_LENGTH = 70
 ALLOWED_TAGS = [
     'abbr', 'ul', 'blockquote', 'code', 'em', 'strong', 'li', 'ol',
@@ -70,6 +109,7 @@ PAGINATION_DASHBOARD_TRASH_PAGES_TO_LEAD = 2
 NUM_RECENT_IDEAS = 3
 
 NUM_IDEAS_FOOTER = 3
+NUM_THOUGHT_NAV = 3  # thoughts fetched on each side of a thought for thought_nav
 
 MAX_NUM_BOOK_RESULTS = 5
 NUM_READ_LIST = 3
@@ -81,11 +121,11 @@ NUM_NOTE_LIST = 5
 # classes
 ###############################################################################
 class BookSearch:
-    google_book_api_get_string = "https://www.googleapis.com/books/v1/volumes?q="
-
     def search(self, keywords, max_len=MAX_NUM_BOOK_RESULTS):
         """ given a string containing keywords, make a call to an external
-            API and return a list of results
+            API and return a list of results. The local catalog is searched
+            first (see blog.catalog); the remote API (see blog.books) only
+            gets the searches it has nothing for.
 
             Each result is a dictionary with the following keys:
               'url' => url to book page
@@ -93,32 +133,11 @@ class BookSearch:
               'author' => author of the book
               'cover' => thumbnail url of image
         """
-        if not keywords:
-            return []
-
-        # this implementation uses public google books api
-        query = self.google_book_api_get_string + keywords
-        http_resp = requests.get(query)
+        found = catalog.search(keywords, max_len)
+        if found:
+            return found
+        return books.get_client().search(keywords, max_len)
 
-        books = []
-        book_idx = 0
-        for book in http_resp.json()["items"]:
-            if book_idx >= max_len:
-                break
-
-            book_idx += 1
-
-            try:
-                books.append({
-                    'url' : book["volumeInfo"]["infoLink"],
-                    'cover' : book["volumeInfo"]["imageLinks"]["smallThumbnail"],
-                    'title' : book["volumeInfo"]["title"],
-                    'author' : book["volumeInfo"]["authors"][0],
-                })
-            except KeyError:
-                book_idx -= 1
-
-        return books
 
 class FlashMessageManager:
     def __init__(self):
@@ -178,6 +197,19 @@ class FlashMessageManager:
                     )
             else:
                 msg = msg_data['action'] + ': %s.' % msg_data['tokens'][0]['error']
+        elif msg_data['action'] == 'idea_move':
+            if msg_data['status']:
+                if len(msg_data['tokens']) > 1:
+                    msg = "%d Ideas were moved." % len(msg_data['tokens'])
+                else:
+                    msg = "Idea %s was moved to position %d." % (msg_data['tokens'][0]['idea'], msg_data['tokens'][0]['position'])
+            else:
+                msg = msg_data['action'] + ': %s.' % msg_data['tokens'][0]['error']
+        elif msg_data['action'] == 'idea_reorder':
+            if msg_data['status']:
+                msg = "Reordered %d Ideas." % len(msg_data['tokens'])
+            else:
+                msg = msg_data['action'] + ': %s.' % msg_data['tokens'][0]['error']
         elif msg_data['action'] == 'thought_trash' or msg_data['action'] == 'thought_untrash':
             if msg_data['status']:
                 if len(msg_data['tokens']) > 1:
@@ -324,50 +356,92 @@ def slugify(source_str, max_len=30):
     return slug
 
 
+def find_unique_slug(unsafe_slug, model):
+    """ take a string and generate a slug using the slugify function and
+        make sure it does not collide with anything in the database.
+        Collisions get a numbered suffix ('slug-2', 'slug-3', ...).
+
+        specify a model to search for collisions against. Every taken
+        'slug' / 'slug-N' is fetched with one (indexed) prefix query and the
+        first free suffix is worked out from that.
+    """
+    base = slugify(unsafe_slug)
+
+    taken = set(model.objects.filter(
+        Q(slug=base) | Q(slug__startswith=base + '-')
+    ).values_list('slug', flat=True))
+
+    if base not in taken:
+        return base
+
+    suffixes = set()
+    for slug in taken:
+        suffix = slug[len(base) + 1:]
+        if suffix.isdigit():
+            suffixes.add(int(suffix))
+
+    collision_idx = 2
+    while collision_idx in suffixes:
+        collision_idx += 1
+    return "%s-%d" % (base, collision_idx)
+
+
+def save_with_unique_slug(instance, unsafe_slug, attempts=5):
+    """ save a new model instance under a unique slug made from unsafe_slug
+        (see find_unique_slug). If someone else takes the slug between
+        finding it and saving, the insert fails on the slug's unique
+        constraint and the next free slug is tried.
+    """
+    model = type(instance)
+    for attempt in range(attempts):
+        instance.slug = find_unique_slug(unsafe_slug, model)
+        try:
+            with transaction.atomic():
+                # force_insert, so a taken slug fails instead of updating
+                # the row that has it
+                instance.save(force_insert=True)
+            return instance
+        except IntegrityError:
+            if attempt == attempts - 1 or not model.objects.filter(slug=instance.slug).exists():
+                # out of attempts, or the error wasn't about the slug
+                raise
+
+
 def truncate(content, max_length=DEFAULT_TRUNCATE_LENGTH, allowed_tags=ALLOWED_TAGS, full_link=None):
     """ truncate a body of text to the expected 'max_length' and strip
         the body of text of all html tags that are not in 'allowed tags'. You
         can also specify a 'strip' value (True -> strip html tags, False ->
         escape html tags and leave them in text)
     """
-    if not content:
-        return ''
-
-    cleaner = Cleaner(
-        page_structure=False,
-        links=True,
-        safe_attrs_only=True,
-        remove_unknown_tags=False,
-        allow_tags=allowed_tags
+    return sanitizer.sanitize(
+        content,
+        allowed_tags=allowed_tags,
+        max_length=max_length,
+        full_link=full_link,
     )
 
-    content = defaultfilters.truncatechars_html(cleaner.clean_html(content), max_length)
-    if full_link:
-        try:
-            insert_point = content.rindex('</p>')
-        except ValueError:
-            insert_point = content.rindex('<')
 
-        ending = content[insert_point:]
-        content = content[:insert_point]
+def get_upload_dir(filename):
+    """ media directory for an uploaded file, by its extension
+    """
+    ext = os.path.splitext(filename)[1].lower()
 
-        content += '&nbsp;<a href="' + full_link + '">(Read More)</a>' + ending
-    return content
+    if ext in ['.bmp', '.png', '.gif', '.jpg', '.jpeg', '.tiff']:
+        return paths.MEDIA_IMAGE_DIR
+    elif ext in ['.mp4', '.mpg', '.avi', '.xvid', '.divx', '.ogm']:
+        return paths.MEDIA_VIDEO_DIR
+    return paths.MEDIA_FILE_DIR
 
 
 def generate_upload_filename(filename, full_path=None):
     """ given a string (presumably an original filename with extension),
-        generate a non-conflicting filename for user uploads
+        generate a non-conflicting filename for user uploads. This probes
+        the storage for every candidate name, which on S3 is a request
+        each; upload_file only uses it in the 'name' UPLOAD_FILENAME_MODE.
     """
     filename = os.path.basename(filename)
     basename, ext = os.path.splitext(filename)
-
-    if ext.lower() in ['.bmp', '.png', '.gif', '.jpg', '.jpeg', '.tiff']:
-        file_dir = paths.MEDIA_IMAGE_DIR
-    elif ext.lower() in ['.mp4', '.mpg', '.avi', '.xvid', '.divx', '.ogm']:
-        file_dir = paths.MEDIA_VIDEO_DIR
-    else:
-        file_dir = paths.MEDIA_FILE_DIR
+    file_dir = get_upload_dir(filename)
 
     # check for existence
     file_idx = 1
@@ -383,17 +457,43 @@ def generate_upload_filename(filename, full_path=None):
     return name + ext
 
 
+def hash_upload_filename(f, keep_name=False):
+    """ filename for an uploaded file made from a hash of its contents (and
+        the original name with keep_name, e.g. 'cat-3f2a9c0e51d7b6a4.png').
+        The same upload always gets the same name, so no existence checks
+        are needed and identical uploads are stored only once.
+    """
+    sha = hashlib.sha1()
+    for chunk in f.chunks():
+        sha.update(chunk)
+    f.seek(0)
+
+    basename, ext = os.path.splitext(os.path.basename(f.name))
+    digest = sha.hexdigest()[:UPLOAD_HASH_LENGTH]
+
+    name = slugify(basename) if keep_name else ''
+    if name:
+        return "%s-%s%s" % (name, digest, ext.lower())
+    return digest + ext.lower()
+
+
 def upload_file(f):
     """ Given file post data, place filedata into media directory
 
-        Watch out. This function will return True, file_url if the
-        file already exists. This will point to the right url, but
-        maybe not be the file you were expecting.
+        The filename depends on UPLOAD_FILENAME_MODE: 'hash' and
+        'name-hash' name the file after its contents (see
+        hash_upload_filename), so uploading the same file again writes
+        over the copy that is already there. 'name' keeps the original
+        name and numbers it until it doesn't collide with an existing file.
 
         Returns 2-tuple (Boolean, String)
           success -> True, file_url of newly created file
           failure -> False, error message
     """
+    # enforce file size limit
+    if f.size > MAX_UPLOAD_SIZE:
+        return False, "%s exceeds maximum upload size!" % f.name
+
     # determine correct folder depending on content_type
     content_category = f.content_type.split("/")[0]
     if content_category == "image":
@@ -403,34 +503,125 @@ def upload_file(f):
     else:
         file_dir = paths.MEDIA_FILE_DIR
 
-    file_url = os.path.join(file_dir, generate_upload_filename(f.name))
-
-    # enforce file size limit
-    if f.size > MAX_UPLOAD_SIZE:
-        return False, "%s exceeds maximum upload size!" % f.name
+    if UPLOAD_FILENAME_MODE == 'name':
+        filename = generate_upload_filename(f.name)
+    else:
+        filename = hash_upload_filename(f, keep_name=(UPLOAD_FILENAME_MODE == 'name-hash'))
+    file_url = os.path.join(file_dir, filename)
 
     try:
-        uploaded_file = default_storage.open(file_url, 'wb')
-        uploaded_file.write(f.read())
-        uploaded_file.close()
-
-        # if we are on Amazon S3, preserve the content type
-        if os.environ['DJANGO_SETTINGS_MODULE'].endswith('production'):
-            boto_url = os.path.join(paths.MEDIA_DIR, file_url)
-            key = boto.connect_s3().get_bucket(os.environ['S3_BUCKET_NAME']).lookup(boto_url)
-            key.copy(key.bucket, key.name, preserve_acl=True,
-                     metadata={'Content-Type': f.content_type})
+        write_file(file_url, f, f.content_type)
     except Exception as e:
-        return False, e.message
+        return False, str(e)
 
     return True, file_url
 
 
-def delete_file(filename):
-    """ given a url (relative to the media url), delete the file
-        from the server.
+def write_file(filename, f, content_type):
+    """ write a django File to the media storage under exactly this name,
+        replacing any file already there. On S3 the file is streamed
+        straight to the bucket with its Content-Type set on the upload
+        itself (see stream_to_s3).
+    """
+    bucket = get_s3_bucket()
+    if bucket is not None:
+        stream_to_s3(f, bucket, get_s3_key_name(filename), content_type,
+                     acl=getattr(default_storage, 'default_acl', None))
+        return
+
+    out_file = default_storage.open(filename, 'wb')
+    for chunk in f.chunks(UPLOAD_CHUNK_SIZE):
+        out_file.write(chunk)
+    out_file.close()
+
+
+def get_s3_bucket():
+    """ the boto bucket behind default_storage, or None if media files are
+        not stored on S3. Point the storage at a local S3 stand-in with the
+        usual django-storages settings (AWS_S3_HOST, AWS_S3_PORT, ...).
     """
-    if filename and default_storage.exists(filename):
+    bucket = getattr(default_storage, 'bucket', None)
+    if bucket is not None and hasattr(bucket, 'initiate_multipart_upload'):
+        return bucket
+    return None
+
+
+def get_s3_key_name(filename):
+    """ S3 key of a media file (S3BotoStorage keeps the media files under
+        its location prefix)
+    """
+    return default_storage._normalize_name(default_storage._clean_name(filename))
+
+
+def stream_to_s3(f, bucket, key_name, content_type, acl=None, part_size=S3_PART_SIZE):
+    """ upload a django File to an S3 bucket chunk by chunk, holding at most
+        one part in memory however big the file is. A file that fits in one
+        part is a single PUT; anything bigger is a multipart upload, which
+        is cancelled if a part fails so no orphaned parts are left behind.
+    """
+    headers = {'Content-Type': content_type}
+    part = io.BytesIO()
+    part_num = 0
+    upload = None
+
+    try:
+        for chunk in f.chunks(UPLOAD_CHUNK_SIZE):
+            part.write(chunk)
+            if part.tell() < part_size:
+                continue
+
+            if upload is None:
+                upload = bucket.initiate_multipart_upload(key_name, headers=headers, policy=acl)
+            part_num += 1
+            part.seek(0)
+            upload.upload_part_from_file(part, part_num)
+
+            part.seek(0)
+            part.truncate()
+
+        part.seek(0)
+        if upload is None:
+            bucket.new_key(key_name).set_contents_from_file(part, headers=headers, policy=acl)
+        else:
+            if part.getbuffer().nbytes:
+                part_num += 1
+                upload.upload_part_from_file(part, part_num)
+            upload.complete_upload()
+    except Exception:
+        if upload is not None:
+            upload.cancel_upload()
+        raise
+
+
+def get_media_filename(url):
+    """ given the url of a media file (absolute or relative to the site),
+        return its name in the media storage (e.g. images/cat.png), or None
+        if the url doesn't point into MEDIA_URL.
+    """
+    url, media_url = urlparse(url or ''), urlparse(settings.MEDIA_URL)
+    if url.netloc != media_url.netloc:
+        return None
+    if not url.path.startswith(media_url.path) or url.path == media_url.path:
+        return None
+    return unquote(url.path[len(media_url.path):])
+
+
+def delete_files(filenames):
+    """ delete several files (urls relative to the media url) from the
+        server. Files that are already gone are skipped. On Amazon S3 the
+        keys are removed with one multi-object delete request per 1000
+        files instead of a lookup and a delete request for each file.
+    """
+    filenames = remove_duplicates([f for f in filenames if f])
+
+    bucket = get_s3_bucket()
+    if bucket is not None:
+        names = [get_s3_key_name(f) for f in filenames]
+        for idx in range(0, len(names), 1000):
+            bucket.delete_keys(names[idx:idx + 1000], quiet=True)
+        return
+
+    for filename in filenames:
         default_storage.delete(filename)
 
 
@@ -444,58 +635,270 @@ def get_center_coord(box, rect):
             max(0, int(float(rect[1] - box[1]) / 2)))
 
 
-def resize_image(filename, new_size=THOUGHT_PREVIEW_IMAGE_SIZE):
+def get_cover_size(image_size, new_size):
+    """ given the size of an image, return the smallest size with the same
+        aspect ratio that covers new_size in both dimensions.
+    """
+    resize_ratio = max(float(new_size[0]) / image_size[0],
+                       float(new_size[1]) / image_size[1])
+    return (max(new_size[0], int(round(image_size[0] * resize_ratio))),
+            max(new_size[1], int(round(image_size[1] * resize_ratio))))
+
+
+def get_exif_orientation(image):
+    """ the EXIF orientation (1-8, 1 is upright) of an opened image. Images
+        without one (or with a broken EXIF block) are upright.
+    """
+    try:
+        orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+    except Exception:
+        return 1
+    return orientation if orientation in range(1, 9) else 1
+
+
+class ImageDecodeError(Exception):
+    """ an image file that PIL can't (or won't) decode
+    """
+    pass
+
+
+def open_image(fp, new_size, max_pixels=None):
+    """ open an image file to be resized to cover new_size and return a
+        tuple (image, rotated) with the image decoded and turned upright
+        according to its EXIF orientation.
+
+        JPEGs are decoded at a reduced scale (1/2, 1/4 or 1/8, done by the
+        decoder's DCT scaling) as long as that's still IMAGE_REDUCE_GAP times
+        the size they will be resized to, so a phone photo is never fully
+        decoded. If max_pixels is given, images that would decode to more
+        pixels than that raise PIL.Image.DecompressionBombError before any
+        pixel is decoded.
+    """
+    image = Image.open(fp)
+    orientation = get_exif_orientation(image)
+
+    # the pixels are stored before the rotation, and so is the size the
+    # decoder sees. Orientations 5-8 swap width and height.
+    target = tuple(new_size) if orientation < 5 else (new_size[1], new_size[0])
+
+    if image.format == 'JPEG':
+        cover = get_cover_size(image.size, target)
+        image.draft(image.mode, (cover[0] * IMAGE_REDUCE_GAP, cover[1] * IMAGE_REDUCE_GAP))
+
+    if max_pixels and image.size[0] * image.size[1] > max_pixels:
+        raise Image.DecompressionBombError(
+            "%dx%d image is over the %d pixel limit" % (image.size[0], image.size[1], max_pixels))
+
+    image.load()
+    if orientation > 1:
+        return ImageOps.exif_transpose(image), True
+    return image, False
+
+
+def resize_cover(image, new_size):
+    """ resize an image to cover new_size and crop the middle out of it.
+        Large reductions are done in two steps: a cheap box filter by a
+        whole factor down to at least IMAGE_REDUCE_GAP times the size, then
+        LANCZOS for the rest, which looks the same as LANCZOS all the way.
+    """
+    cover = get_cover_size(image.size, new_size)
+
+    factor = min(image.size[0] // (cover[0] * IMAGE_REDUCE_GAP),
+                 image.size[1] // (cover[1] * IMAGE_REDUCE_GAP))
+    if factor > 1:
+        image = image.resize((image.size[0] // factor, image.size[1] // factor), resample=PIL.Image.BOX)
+
+    if image.size != cover:
+        image = image.resize(size=cover, resample=PIL.Image.LANCZOS)
+
+    (offset_x, offset_y) = get_center_coord(new_size, cover)
+    return image.crop((offset_x, offset_y, offset_x + new_size[0], offset_y + new_size[1]))
+
+
+def resize_image(filename, new_size=THOUGHT_PREVIEW_IMAGE_SIZE, max_pixels=IMAGE_MAX_DECODE_PIXELS):
     """ Given a filename to an existing image file, resize the
         file to the given dimensions (new_size). If no dimensions
         are provided, the file will be resized and cropped to the
         value in THOUGHT_PREVIEW_IMAGE_SIZE. The new image will
         be saved over the existing filename.
+
+        The file is read from storage before it is decoded (see open_image
+        for the reduced JPEG decode and the max_pixels limit) and the image
+        is turned upright according to its EXIF orientation. Storage errors
+        come out as they are; a file PIL can't decode (or that is over
+        max_pixels) raises ImageDecodeError, since reading it again won't
+        help.
+
+        Returns the resized image (or the image as it was, if it was already
+        the right size).
     """
+    new_size = tuple(new_size)
+
     # retrieve file
-    fp = io.BytesIO(default_storage.open(filename).read())
-    image = Image.open(fp)
-    image_size = image.size
-
-    if image_size[0] < new_size[0] or image_size[1] < new_size[1]:
-        # find the smallest dimension, upscale, and crop
-        resize_ratio = max(float(new_size[0]) / image_size[0],
-                           float(new_size[1]) / image_size[1])
-        image_size = (int(image_size[0] * resize_ratio),
-                      int(image_size[1] * resize_ratio))
-        image = image.resize(size=image_size, resample=PIL.Image.LANCZOS)
-    elif image_size[0] > new_size[0] or image_size[1] > new_size[1]:
-        # if the image is larger, find smallest edge, and shrink
-        resize_ratio = max(float(new_size[0]) / image_size[0],
-                           float(new_size[1]) / image_size[1])
-        image_size = (int(image_size[0] * resize_ratio),
-                      int(image_size[1] * resize_ratio))
-        image = image.resize(size=image_size, resample=PIL.Image.LANCZOS)
-    else:
+    with default_storage.open(filename) as f:
+        data = io.BytesIO(f.read())
+
+    try:
+        image, rotated = open_image(data, new_size, max_pixels)
+    except (IOError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageDecodeError("could not decode %s: %s" % (filename, e)) from e
+
+    if image.size == new_size and not rotated:
         # image is already the perfect size, don't resize
-        return
+        return image
+
+    cropped_image = resize_cover(image, new_size)
+
+    # save file back to same url. The name stays the same whatever the new
+    # format is (other objects may point at the same upload); the
+    # Content-Type says what it is.
+    out_img, content_type = encode_image(cropped_image)
+    write_file(filename, File(out_img), content_type)
+    return cropped_image
+
+
+###############################################################################
+# image encoding
+###############################################################################
+def has_alpha(image):
+    """ whether any pixel of an image is not fully opaque
+    """
+    if image.mode in ('RGBA', 'LA', 'PA'):
+        return image.getchannel('A').getextrema()[0] < 255
+    return 'transparency' in image.info
+
+
+def is_graphic(image):
+    """ whether an image looks like a graphic (a logo, screenshot or
+        drawing) rather than a photo, going by how few colours it has
+    """
+    return image.getcolors(maxcolors=IMAGE_GRAPHIC_MAX_COLORS) is not None
 
-    (offset_x, offset_y) = get_center_coord(new_size, image_size)
-    crop_box = (offset_x, offset_y, offset_x + new_size[0], offset_y + new_size[1])
 
-    cropped_image = image.crop(crop_box)
+def choose_image_format(image):
+    """ the format to encode an image in (a key of IMAGE_ENCODINGS): JPEG
+        for photos, PNG for graphics and anything with transparency
+    """
+    if has_alpha(image) or is_graphic(image):
+        return 'PNG'
+    return 'JPEG'
+
+
+def guess_image_format(filename):
+    """ the format (a key of IMAGE_ENCODINGS) to encode a copy of an image
+        in, going by its file name alone: PNG for PNGs and GIFs, which are
+        likely graphics or transparent, JPEG for anything else
+    """
+    if os.path.splitext(filename)[1].lower() in ['.png', '.gif']:
+        return 'PNG'
+    return 'JPEG'
+
+
+def get_webp_options(image_format):
+    """ WebP save options for an image encoded as image_format (see
+        choose_image_format): lossless for graphics, lossy for photos
+    """
+    if image_format == 'PNG':
+        return {'lossless': True}
+    return {'quality': IMAGE_WEBP_QUALITY}
+
+
+def encode_image(image, image_format=None):
+    """ encode an image in the given format, or the one choose_image_format
+        picks for it, and return a tuple (BytesIO, content type)
+    """
+    image_format = image_format or choose_image_format(image)
+    content_type, options = IMAGE_ENCODINGS[image_format]
+
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
 
-    # save file back to same url
     out_img = io.BytesIO()
-    cropped_image.save(out_img, 'PNG')
-    image_file = default_storage.open(filename, 'wb')
-    image_file.write(out_img.getvalue())
-    image_file.close()
+    image.save(out_img, image_format, **options)
+    return out_img, content_type
+
+
+###############################################################################
+# responsive image variants
+###############################################################################
+def get_variant_name(filename, width=None, ext=None):
+    """ name of a variant of an image: images/cat.png at 300 pixels wide is
+        images/cat-300w.png, and its WebP version images/cat-300w.png.webp.
+        No width means the full size image. The original extension is kept
+        in every name, so the variants of cat.png and cat.jpg never collide.
+    """
+    root, orig_ext = os.path.splitext(filename)
+    if width:
+        root += '-%dw' % width
+    return root + orig_ext + (ext or '')
+
 
-    # instead of the Amazon S3 stanza, give this a try:
-    # if hasattr(image_file, "_storage"):
-    #   image_file._storage.headers['Content-Type'] = ''
+def parse_image_widths(value):
+    """ the widths stored in an image_widths field ("150,300,600") as a list
+        of ints, narrowest first. The last one is the full size image. An
+        image that couldn't be processed (see failed_image_widths) has none.
+    """
+    if (value or '').startswith(IMAGE_FAILED_MARK):
+        return []
+    return sorted(int(w) for w in (value or '').split(',') if w.strip().isdigit())
 
-    # if we are on Amazon S3, set the content type
-    if os.environ['DJANGO_SETTINGS_MODULE'].endswith('production'):
-        boto_url = os.path.join(paths.MEDIA_DIR, filename)
-        key = boto.connect_s3().get_bucket(os.environ['S3_BUCKET_NAME']).lookup(boto_url)
-        key.copy(key.bucket, key.name, preserve_acl=True,
-                 metadata={'Content-Type': 'image/png'})
+
+def failed_image_widths(width):
+    """ the image_widths value for an image that couldn't be resized to
+        'width': no variants, but the width it was tried at ("!600")
+    """
+    return IMAGE_FAILED_MARK + str(width)
+
+
+def get_processed_width(value):
+    """ the width an image_widths value says the image was last processed
+        for, whether that worked or not. None if it never was.
+    """
+    widths = [w for w in (value or '').lstrip(IMAGE_FAILED_MARK).split(',') if w.strip().isdigit()]
+    return max(int(w) for w in widths) if widths else None
+
+
+def get_variant_names(filename, widths):
+    """ every file save_image_variants made for an image with these widths
+        (not including the image itself)
+    """
+    if not filename or not widths:
+        return []
+
+    names = [get_variant_name(filename, w) for w in widths[:-1]]
+    if features.check('webp'):
+        names += [get_variant_name(filename, w, '.webp') for w in widths[:-1]]
+        names.append(get_variant_name(filename, ext='.webp'))
+    return names
+
+
+def save_image_variants(filename, image, widths=IMAGE_VARIANT_WIDTHS):
+    """ write narrower copies of a resized image next to it, and a WebP
+        version of each (and of the full size image) if Pillow was built
+        with WebP support. Returns the list of widths that are now
+        available, narrowest first, ending with the image's own width.
+    """
+    widths = sorted(w for w in set(widths) if w < image.size[0]) + [image.size[0]]
+
+    # every variant is encoded like the full size image (see resize_image)
+    image_format = choose_image_format(image)
+
+    for width in widths:
+        if width == image.size[0]:
+            variant, name = image, filename
+        else:
+            height = max(1, int(round(image.size[1] * float(width) / image.size[0])))
+            variant, name = image.resize((width, height), resample=PIL.Image.LANCZOS), get_variant_name(filename, width)
+
+            out_img, content_type = encode_image(variant, image_format)
+            write_file(name, File(out_img), content_type)
+
+        if features.check('webp'):
+            out_img = io.BytesIO()
+            variant.save(out_img, 'WEBP', **get_webp_options(image_format))
+            write_file(get_variant_name(name, ext='.webp'), File(out_img), 'image/webp')
+
+    return widths
 
 
 def create_pagination(queryset, current_page, per_page=PAGINATION_THOUGHTS_PER_PAGE, page_lead=PAGINATION_THOUGHTS_PAGES_TO_LEAD):
@@ -622,15 +1025,4 @@ def display_fancy_date(dt=None):
 def strip_tags(unsafe_html):
     """ strip all tags from this string which may contain html
     """
-    if not unsafe_html:
-        return ''
-
-    cleaner = Cleaner(
-        page_structure=True,
-        links=True,
-        safe_attrs_only=True,
-        remove_unknown_tags=False,
-        allow_tags=['']
-    )
-
-    return etree.fromstring(cleaner.clean_html(unsafe_html)).text
+    return sanitizer.strip_tags(unsafe_html)
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Idea, Thought, Highlight, Note
+
+
+class Command(BaseCommand):
+    """ recompute the precomputed excerpt columns for every Idea, Thought,
+        Highlight and Note. Run this after adding a new excerpt field or
+        changing the truncate settings of an existing one.
+
+        Usage: python manage.py backfill_excerpts [--model thought]
+    """
+    help = "Recompute stored excerpts for Ideas, Thoughts, Highlights and Notes"
+
+    models = {
+        'idea': Idea,
+        'thought': Thought,
+        'highlight': Highlight,
+        'note': Note,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            action='append',
+            choices=sorted(self.models.keys()),
+            help="only backfill this model (can be given more than once)",
+        )
+
+    def handle(self, *args, **options):
+        model_names = options['model'] or sorted(self.models.keys())
+
+        for name in model_names:
+            model = self.models[name]
+            count = 0
+
+            for instance in model.objects.all().iterator():
+                instance.update_excerpts()
+
+                # write the excerpt columns directly; the model save() methods
+                # have side effects (image resizing, publish dates) that a
+                # backfill should not trigger
+                model.objects.filter(pk=instance.pk).update(**{
+                    field: getattr(instance, field) for field in model.excerpt_fields
+                })
+                count += 1
+
+            self.stdout.write("Updated excerpts for %d %s instance(s)." % (count, model.__name__))
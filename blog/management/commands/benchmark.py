@@ -0,0 +1,246 @@
+import io
+import os
+import sys
+import shutil
+import timeit
+import resource
+import tempfile
+import subprocess
+
+import PIL
+from PIL import Image
+from lxml import etree
+from lxml.html.clean import Cleaner
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import defaultfilters
+
+import paths
+from blog import lib
+
+# how many times each truncate implementation runs per measurement
+TRUNCATE_RUNS = 200
+
+
+###############################################################################
+# resize_image
+###############################################################################
+def sample_image(size, fmt='JPEG', orientation=None):
+    """ encoded photo-ish test image (smooth gradients, like most photos)
+    """
+    red = Image.linear_gradient('L').resize(size)
+    green = Image.radial_gradient('L').resize(size)
+    blue = red.transpose(Image.FLIP_LEFT_RIGHT)
+    image = Image.merge('RGB', (red, green, blue))
+
+    kwargs = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[lib.EXIF_ORIENTATION_TAG] = orientation
+        kwargs['exif'] = exif.tobytes()
+
+    out = io.BytesIO()
+    image.save(out, fmt, **kwargs)
+    return out.getvalue()
+
+
+def write_resize_corpus(corpus_dir):
+    """ write a small corpus of photo sized images to corpus_dir. Making
+        them takes more memory than resizing them, so it is done before the
+        measuring processes start.
+    """
+    corpus = [
+        ((4000, 3000), 'JPEG', None),
+        ((3000, 4000), 'JPEG', 6),
+        ((1920, 1080), 'JPEG', None),
+        ((1600, 1200), 'PNG', None),
+    ]
+    for idx, (size, fmt, orientation) in enumerate(corpus):
+        with open(os.path.join(corpus_dir, '%d.%s' % (idx, fmt.lower())), 'wb') as f:
+            f.write(sample_image(size, fmt, orientation))
+    return len(corpus)
+
+
+def legacy_resize_image(data, new_size):
+    """ the original implementation of lib.resize_image (a full decode and a
+        single LANCZOS resize), minus the storage round trip. Kept as a
+        reference for the speed and memory use of the reduced decode.
+    """
+    fp = io.BytesIO(data)
+    image = Image.open(fp)
+    image_size = image.size
+
+    resize_ratio = max(float(new_size[0]) / image_size[0],
+                       float(new_size[1]) / image_size[1])
+    image_size = (int(image_size[0] * resize_ratio),
+                  int(image_size[1] * resize_ratio))
+    image = image.resize(size=image_size, resample=PIL.Image.LANCZOS)
+
+    (offset_x, offset_y) = lib.get_center_coord(new_size, image_size)
+    return image.crop((offset_x, offset_y, offset_x + new_size[0], offset_y + new_size[1]))
+
+
+def current_resize_image(data, new_size):
+    image, rotated = lib.open_image(io.BytesIO(data), new_size)
+    return lib.resize_cover(image, new_size)
+
+
+def measure_resize(implementation, corpus_dir):
+    """ resize every image in the corpus with one implementation and return
+        the time taken and how far the peak RSS (in KB) rose doing it
+    """
+    resize = {'legacy': legacy_resize_image, 'current': current_resize_image}[implementation]
+    corpus = []
+    for name in sorted(os.listdir(corpus_dir)):
+        with open(os.path.join(corpus_dir, name), 'rb') as f:
+            corpus.append(f.read())
+    new_size = lib.THOUGHT_PREVIEW_IMAGE_SIZE
+
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    seconds = timeit.timeit(lambda: [resize(data, new_size) for data in corpus], number=1)
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+
+
+###############################################################################
+# truncate and strip_tags
+###############################################################################
+SAMPLE_HTML = [
+    "plain text with no tags at all",
+    "<p>short</p>",
+    "<p>" + "word " * 80 + "</p>",
+    "<p>one <em>two three four</em> five</p><p>six seven eight nine ten eleven</p>" * 5,
+    "<h1>Title</h1><p>Some <strong>bold <em>nested</em></strong> text <script>alert(1)</script> and "
+    "<a href='x' onclick='y'>link</a></p><ul><li>a</li><li>b</li></ul>" * 3,
+    "<p>image <img src='/media/images/x.png'> then " + "x" * 300 + "</p>",
+    "<blockquote><p>quote " + "q" * 100 + "</p></blockquote><p>after</p>",
+]
+
+
+def legacy_truncate(content, max_length=lib.DEFAULT_TRUNCATE_LENGTH, allowed_tags=lib.ALLOWED_TAGS, full_link=None):
+    """ the original implementation of lib.truncate (a new Cleaner per call
+        and a second parse in truncatechars_html). Kept as a reference for the
+        output and speed of the sanitizer module.
+    """
+    if not content:
+        return ''
+
+    cleaner = Cleaner(
+        page_structure=False,
+        links=True,
+        safe_attrs_only=True,
+        remove_unknown_tags=False,
+        allow_tags=allowed_tags
+    )
+
+    content = defaultfilters.truncatechars_html(cleaner.clean_html(content), max_length)
+    if full_link:
+        try:
+            insert_point = content.rindex('</p>')
+        except ValueError:
+            insert_point = content.rindex('<')
+
+        ending = content[insert_point:]
+        content = content[:insert_point]
+
+        content += '&nbsp;<a href="' + full_link + '">(Read More)</a>' + ending
+    return content
+
+
+def legacy_strip_tags(unsafe_html):
+    """ the original implementation of lib.strip_tags (three parses)
+    """
+    if not unsafe_html:
+        return ''
+
+    cleaner = Cleaner(
+        page_structure=True,
+        links=True,
+        safe_attrs_only=True,
+        remove_unknown_tags=False,
+        allow_tags=['']
+    )
+
+    return etree.fromstring(cleaner.clean_html(unsafe_html)).text
+
+
+def measure_truncate(number=TRUNCATE_RUNS, repeat=5):
+    """ best time of a few runs of truncate and strip_tags over the sample
+        html, for each implementation: {'truncate': (legacy, current), ...}
+    """
+    html = "".join(SAMPLE_HTML)
+
+    def best(func):
+        return min(timeit.repeat(func, number=number, repeat=repeat))
+
+    return {
+        'truncate': (best(lambda: legacy_truncate(html, 250, lib.ALLOWED_TAGS, '/more/')),
+                     best(lambda: lib.truncate(html, 250, lib.ALLOWED_TAGS, '/more/'))),
+        'strip_tags': (best(lambda: legacy_strip_tags(html)), best(lambda: lib.strip_tags(html))),
+    }
+
+
+class Command(BaseCommand):
+    """ compare the speed (and memory use) of reworked code with the
+        original implementation it replaced. Timings depend on the machine
+        and what else it is doing, which is why they aren't part of the
+        test suite.
+
+        resize -> lib.resize_image's reduced decode against a full decode.
+            Each implementation runs in a fresh process, so its peak RSS
+            isn't hidden by memory an earlier run already took.
+        truncate -> the sanitizer's truncate and strip_tags against the
+            original Cleaner + truncatechars_html functions
+
+        Usage: python manage.py benchmark resize|truncate
+    """
+    help = "Compare reworked code with the original implementation"
+
+    benchmarks = ['resize', 'truncate']
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmark', choices=self.benchmarks)
+        parser.add_argument(
+            '--implementation',
+            choices=['legacy', 'current'],
+            help="only measure this implementation, in this process, and print the raw numbers",
+        )
+        parser.add_argument('--corpus', help="directory the corpus was written to (with --implementation)")
+
+    def run_fresh(self, benchmark, implementation, corpus_dir):
+        """ measure one implementation in a new process
+        """
+        manage = os.path.join(paths.BASE_DIR, 'manage.py')
+        try:
+            out = subprocess.check_output(
+                [sys.executable, manage, 'benchmark', benchmark,
+                 '--implementation', implementation, '--corpus', corpus_dir],
+                universal_newlines=True,
+            )
+        except subprocess.CalledProcessError as e:
+            raise CommandError("%s %s benchmark failed: %s" % (implementation, benchmark, e))
+        seconds, peak = out.split()
+        return float(seconds), int(peak)
+
+    def handle(self, *args, **options):
+        benchmark = options['benchmark']
+
+        if benchmark == 'truncate':
+            for name, (legacy, current) in sorted(measure_truncate().items()):
+                self.stdout.write("%s x%d: legacy %.3fs, sanitizer %.3fs" % (name, TRUNCATE_RUNS, legacy, current))
+            return
+
+        if options['implementation']:
+            seconds, peak = measure_resize(options['implementation'], options['corpus'])
+            self.stdout.write("%f %d" % (seconds, peak))
+            return
+
+        corpus_dir = tempfile.mkdtemp()
+        try:
+            count = write_resize_corpus(corpus_dir)
+            legacy = self.run_fresh(benchmark, 'legacy', corpus_dir)
+            current = self.run_fresh(benchmark, 'current', corpus_dir)
+        finally:
+            shutil.rmtree(corpus_dir)
+
+        self.stdout.write("resize_image x%d: legacy %.3fs %dKB peak, current %.3fs %dKB peak" % (
+            count, legacy[0], legacy[1], current[0], current[1]))
@@ -0,0 +1,39 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from blog import media
+
+
+class Command(BaseCommand):
+    """ delete the uploaded media files nothing refers to anymore (see
+        blog.media). With --dry-run the orphans are only listed. The
+        collect_orphaned_media task does the same thing periodically.
+
+        Usage: python manage.py collect_media [--dry-run] [--min-age HOURS]
+    """
+    help = "Delete media files no Idea, Thought, Highlight or Note refers to"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="list the orphaned files without deleting them",
+        )
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=media.MEDIA_GC_MIN_AGE.total_seconds() / 3600,
+            help="only collect files older than this many hours",
+        )
+
+    def handle(self, *args, **options):
+        min_age = datetime.timedelta(hours=options['min_age'])
+        orphans = media.collect_orphans(dry_run=options['dry_run'], min_age=min_age)
+
+        for filename, size in orphans:
+            self.stdout.write("%s: %d bytes" % (filename, size))
+
+        verb = "would be deleted" if options['dry_run'] else "deleted"
+        total = sum(size for filename, size in orphans)
+        self.stdout.write("%d orphaned file(s), %d bytes %s" % (len(orphans), total, verb))
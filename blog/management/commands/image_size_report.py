@@ -0,0 +1,65 @@
+from PIL import Image
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from blog import lib
+from blog.models import Idea, Thought, Highlight
+
+
+class Command(BaseCommand):
+    """ report how big the stored Idea icons, Thought previews and Highlight
+        icons are now and how big they would be encoded the way
+        resize_image encodes them (see lib.encode_image). Nothing is
+        written.
+
+        Usage: python manage.py image_size_report [--verbose]
+    """
+    help = "Compare stored image sizes with the format-aware encoder"
+
+    fields = [
+        (Idea, 'icon'),
+        (Thought, 'preview'),
+        (Highlight, 'icon'),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help="list every image, not just the totals",
+        )
+
+    def get_filenames(self):
+        filenames = []
+        for model, field_name in self.fields:
+            filenames += model.objects.exclude(**{field_name: ''}).exclude(**{field_name + '__isnull': True})\
+                .values_list(field_name, flat=True)
+        return lib.remove_duplicates(filenames)
+
+    def handle(self, *args, **options):
+        before_total = after_total = count = 0
+
+        for filename in self.get_filenames():
+            try:
+                with default_storage.open(filename) as f:
+                    before = f.size
+                    image = Image.open(f)
+                    image.load()
+            except IOError as e:
+                self.stderr.write("%s: %s" % (filename, e))
+                continue
+
+            image_format = lib.choose_image_format(image)
+            out_img, content_type = lib.encode_image(image, image_format)
+            after = out_img.getbuffer().nbytes
+
+            before_total += before
+            after_total += after
+            count += 1
+
+            if options['verbose']:
+                self.stdout.write("%s: %s %d bytes -> %s %d bytes" % (filename, image.format, before, image_format, after))
+
+        saved = 100.0 * (before_total - after_total) / before_total if before_total else 0
+        self.stdout.write("%d image(s): %d bytes -> %d bytes (%.1f%% smaller)" % (count, before_total, after_total, saved))
@@ -0,0 +1,64 @@
+import csv
+import gzip
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import catalog
+
+
+class Command(BaseCommand):
+    """ build the local book catalog (see blog.catalog) from a bulk dump of
+        book metadata, either JSON lines or CSV with a header row, optionally
+        gzipped. Each record needs a title and should have an author (or
+        authors), url, cover and popularity (e.g. a ratings count). The new
+        catalog replaces the old one once it is complete.
+
+        Usage: python manage.py import_book_catalog <dump> [--format jsonl|csv] [--output PATH]
+    """
+    help = "Import a book metadata dump into the local book catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dump', help="JSON lines or CSV file (.gz is unzipped)")
+        parser.add_argument(
+            '--format',
+            choices=['jsonl', 'csv'],
+            help="format of the dump (by default from its extension)",
+        )
+        parser.add_argument(
+            '--output',
+            default=catalog.BOOK_CATALOG_PATH,
+            help="catalog file to write",
+        )
+
+    def get_format(self, filename):
+        name = filename[:-3] if filename.endswith('.gz') else filename
+        if name.endswith('.csv'):
+            return 'csv'
+        if name.endswith('.jsonl') or name.endswith('.json'):
+            return 'jsonl'
+        raise CommandError("can't tell the format of %s, use --format" % filename)
+
+    def read_records(self, f, dump_format):
+        if dump_format == 'csv':
+            for row in csv.DictReader(f):
+                yield row
+            return
+
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                self.stderr.write("line %d: not valid JSON, skipped" % line_num)
+
+    def handle(self, *args, **options):
+        filename = options['dump']
+        dump_format = options['format'] or self.get_format(filename)
+
+        opener = gzip.open if filename.endswith('.gz') else open
+        with opener(filename, 'rt', encoding='utf-8', newline='') as f:
+            count = catalog.build(self.read_records(f, dump_format), options['output'])
+
+        self.stdout.write("imported %d book(s) into %s" % (count, options['output']))
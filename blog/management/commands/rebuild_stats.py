@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Statistic
+
+
+class Command(BaseCommand):
+    """ recount the dashboard statistics from the content tables and
+        overwrite the Statistic counter table. The counters are maintained
+        by the model save and delete methods; run this if they ever drift
+        (e.g. after editing rows outside of the ORM).
+
+        Usage: python manage.py rebuild_stats
+    """
+    help = "Recount the dashboard statistics counter table"
+
+    def handle(self, *args, **options):
+        stats = Statistic.rebuild()
+
+        for name in Statistic.names:
+            self.stdout.write("%s: %d" % (name, stats[name]))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.models import Activity
+
+
+class Command(BaseCommand):
+    """ re-render the stored message of every Activity from its type and
+        tokens. Run this after changing the wording in Activity.MESSAGES.
+
+        Usage: python manage.py render_activity_messages
+    """
+    help = "Re-render the stored messages of the Activity feed"
+
+    def handle(self, *args, **options):
+        updated = 0
+        failed = 0
+
+        with transaction.atomic():
+            for activity in Activity.objects.all().iterator():
+                try:
+                    message = activity.generate_message()
+                except (IndexError, KeyError, TypeError, ValueError) as e:
+                    self.stderr.write("Could not render Activity #%d: %r" % (activity.id, e))
+                    failed += 1
+                    continue
+
+                if message != activity.message:
+                    Activity.objects.filter(id=activity.id).update(message=message)
+                    updated += 1
+
+        self.stdout.write("Re-rendered %d Activity message(s), %d failed." % (updated, failed))
@@ -0,0 +1,137 @@
+""" garbage collection of media files nothing refers to anymore.
+
+    Saving and deleting Ideas, Thoughts and Highlights never deletes media
+    files. Instead collect_orphans (run by the collect_media management
+    command and the periodic collect_orphaned_media task) lists the upload
+    directories, works out every file the database still refers to and
+    deletes the rest, on S3 with one multi-object delete request per 1000
+    files (see lib.delete_files). A delete that fails is simply picked up
+    again by the next run.
+
+    Files younger than MEDIA_GC_MIN_AGE are left alone: uploads are stored
+    before the form that refers to them is saved, and the image worker
+    writes variants before it records their widths.
+"""
+import datetime
+
+from boto.utils import parse_ts
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+import paths
+from blog import lib, sanitizer
+from blog.models import Idea, Thought, ThoughtImage, Highlight, Note, get_image_files
+
+MEDIA_GC_MIN_AGE = getattr(settings, 'MEDIA_GC_MIN_AGE', datetime.timedelta(days=1))
+
+# the directories uploads go to. imagekit's CACHE directory is not in here,
+# imagekit keeps track of its own files.
+MEDIA_GC_DIRS = [paths.MEDIA_IMAGE_DIR, paths.MEDIA_VIDEO_DIR, paths.MEDIA_FILE_DIR]
+
+# image fields and html fields that can refer to media files. The html
+# fields come with the tags whose references are listed elsewhere, which the
+# scan leaves out: inline Thought images are in the ThoughtImage table.
+IMAGE_FIELDS = [
+    (Idea, 'icon'),
+    (Thought, 'preview'),
+    (Highlight, 'icon'),
+]
+HTML_FIELDS = [
+    (Idea, 'description', []),
+    (Thought, 'content', ['img']),
+    (Highlight, 'description', []),
+    (Note, 'content', []),
+]
+
+
+###############################################################################
+# references
+###############################################################################
+def get_referenced_files():
+    """ the names of every media file an image field (with its variants) or
+        a link or embed in user content refers to
+    """
+    referenced = set()
+
+    for model, field_name in IMAGE_FIELDS:
+        instances = model.objects.exclude(**{field_name: ''}).exclude(**{field_name + '__isnull': True})\
+            .only(field_name, 'image_widths')
+        for instance in instances.iterator():
+            referenced.update(get_image_files(instance, field_name))
+
+    # the html of a Thought is still scanned for its other references
+    # (videos, links, posters)
+    referenced.update(ThoughtImage.objects.values_list('filename', flat=True).distinct())
+
+    for model, field_name, indexed_tags in HTML_FIELDS:
+        for content in model.objects.values_list(field_name, flat=True).iterator():
+            for url in sanitizer.get_media_urls(content, skip_tags=indexed_tags):
+                referenced.add(lib.get_media_filename(url))
+
+    referenced.discard(None)
+    return referenced
+
+
+###############################################################################
+# storage listing
+###############################################################################
+def list_s3_files(bucket, directory):
+    prefix = lib.get_s3_key_name(directory) + '/'
+    for key in bucket.list(prefix=prefix):
+        modified = timezone.make_aware(parse_ts(key.last_modified), timezone.utc)
+        yield directory + '/' + key.name[len(prefix):], key.size, modified
+
+
+def list_storage_files(directory):
+    if not default_storage.exists(directory):
+        return
+
+    dirs, files = default_storage.listdir(directory)
+    for name in files:
+        filename = directory + '/' + name
+        yield filename, default_storage.size(filename), default_storage.get_modified_time(filename)
+    for name in dirs:
+        for f in list_storage_files(directory + '/' + name):
+            yield f
+
+
+def list_media_files():
+    """ yield (filename, size in bytes, last modified) for every file in the
+        upload directories. On S3 this is one request per 1000 files.
+    """
+    bucket = lib.get_s3_bucket()
+    for directory in MEDIA_GC_DIRS:
+        if bucket is not None:
+            files = list_s3_files(bucket, directory)
+        else:
+            files = list_storage_files(directory)
+        for f in files:
+            yield f
+
+
+###############################################################################
+# collection
+###############################################################################
+def find_orphans(min_age=MEDIA_GC_MIN_AGE):
+    """ (filename, size) of every stored media file older than min_age that
+        nothing refers to
+    """
+    # references are gathered before the listing, so a file that gets
+    # referenced in between is either in the set or too young to collect
+    referenced = get_referenced_files()
+    cutoff = timezone.now() - min_age
+
+    return [(filename, size) for filename, size, modified in list_media_files()
+            if filename not in referenced and modified < cutoff]
+
+
+def collect_orphans(dry_run=False, min_age=MEDIA_GC_MIN_AGE):
+    """ delete every orphaned media file (see find_orphans) and return the
+        (filename, size) of each one. With dry_run nothing is deleted.
+    """
+    orphans = find_orphans(min_age)
+    if not dry_run:
+        lib.delete_files([filename for filename, size in orphans])
+    return orphans
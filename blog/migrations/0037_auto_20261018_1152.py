@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 18:52
+from __future__ import unicode_literals
+
+from django.core.urlresolvers import reverse, NoReverseMatch
+from django.db import migrations, models
+from django.template import defaultfilters
+from lxml.html.clean import Cleaner
+
+# the allowed_tags of each model when the excerpts were added
+THOUGHT_TAGS = IDEA_TAGS = [
+    'abbr', 'ul', 'code', 'em', 'strong', 'li', 'ol', 'p',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'br'
+]
+HIGHLIGHT_TAGS = ['br', 'em', 'strong', 'blockquote', 'quote', 'hr', 'p']
+NOTE_TAGS = ['br', 'em', 'strong', 'blockquote', 'quote', 'hr', 'ul', 'li', 'ol', 'p']
+
+
+def truncate(content, max_length, allowed_tags, full_link=None):
+    """ lib.truncate as of this migration; the models' update_excerpts
+        recompute the excerpts on every save (and backfill_excerpts for
+        every row), so this only needs to fill in the existing rows once
+    """
+    if not content:
+        return ''
+
+    cleaner = Cleaner(
+        page_structure=False,
+        links=True,
+        safe_attrs_only=True,
+        remove_unknown_tags=False,
+        allow_tags=allowed_tags
+    )
+
+    content = defaultfilters.truncatechars_html(cleaner.clean_html(content), max_length)
+    if full_link:
+        try:
+            insert_point = content.rindex('</p>')
+        except ValueError:
+            insert_point = content.rindex('<')
+
+        ending = content[insert_point:]
+        content = content[:insert_point]
+
+        content += '&nbsp;<a href="' + full_link + '">(Read More)</a>' + ending
+    return content
+
+
+def fill_excerpts(apps, schema_editor):
+    """ what update_excerpts would have stored for the existing rows
+    """
+    Idea = apps.get_model('blog', 'Idea')
+    Thought = apps.get_model('blog', 'Thought')
+    Highlight = apps.get_model('blog', 'Highlight')
+    Note = apps.get_model('blog', 'Note')
+
+    for slug, description in Idea.objects.values_list('slug', 'description').iterator():
+        Idea.objects.filter(slug=slug).update(
+            excerpt=truncate(description, 270, IDEA_TAGS),
+            excerpt_short=truncate(description, 50, IDEA_TAGS),
+        )
+
+    for slug, idea_slug, content in Thought.objects.values_list('slug', 'idea_id', 'content').iterator():
+        try:
+            full_link = reverse('thought-page', kwargs={'idea_slug': idea_slug, 'thought_slug': slug})
+        except NoReverseMatch:
+            full_link = None
+
+        Thought.objects.filter(slug=slug).update(
+            excerpt=truncate(content, 250, THOUGHT_TAGS),
+            excerpt_lead=truncate(content, 240, THOUGHT_TAGS),
+            excerpt_link=truncate(content, 175, THOUGHT_TAGS, full_link=full_link),
+            excerpt_media=truncate(content, 250, THOUGHT_TAGS + ['img']),
+        )
+
+    highlights_link = reverse('highlights')
+    for pk, description in Highlight.objects.values_list('pk', 'description').iterator():
+        Highlight.objects.filter(pk=pk).update(
+            excerpt_link=truncate(description, 90, HIGHLIGHT_TAGS, full_link=highlights_link),
+            excerpt_short=truncate(description, 75, ['a']),
+        )
+
+    for pk, content in Note.objects.values_list('pk', 'content').iterator():
+        Note.objects.filter(pk=pk).update(excerpt=truncate(content, 150, NOTE_TAGS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0036_auto_20190323_1401'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='highlight',
+            name='excerpt_link',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='highlight',
+            name='excerpt_short',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='idea',
+            name='excerpt',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='idea',
+            name='excerpt_short',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='excerpt',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='thought',
+            name='excerpt',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='thought',
+            name='excerpt_lead',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='thought',
+            name='excerpt_link',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='thought',
+            name='excerpt_media',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 19:07
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0038_statistic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='message',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 19:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F
+
+ORDER_GAP = 1024
+
+
+def spread_orders(apps, schema_editor):
+    """ leave room between the existing order values (see Idea.move_to)
+    """
+    Idea = apps.get_model('blog', 'Idea')
+    Idea.objects.update(order=F('order') * ORDER_GAP)
+
+
+def unspread_orders(apps, schema_editor):
+    Idea = apps.get_model('blog', 'Idea')
+    for idx, slug in enumerate(Idea.objects.order_by('order', 'slug').values_list('slug', flat=True)):
+        Idea.objects.filter(slug=slug).update(order=idx + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0039_activity_message'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='idea',
+            name='order',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterIndexTogether(
+            name='idea',
+            index_together=set([('order', 'slug')]),
+        ),
+        migrations.RunPython(spread_orders, unspread_orders),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 19:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0040_idea_order_gaps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='highlight',
+            name='image_pending',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='idea',
+            name='image_pending',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='thought',
+            name='image_pending',
+            field=models.BooleanField(default=False),
+        ),
+    ]
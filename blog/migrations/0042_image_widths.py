@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 19:28
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0041_image_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='highlight',
+            name='image_widths',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='idea',
+            name='image_widths',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='thought',
+            name='image_widths',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
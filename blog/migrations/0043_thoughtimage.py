@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 19:34
+from __future__ import unicode_literals
+
+from urllib.parse import urlparse, unquote
+
+import lxml.html
+from lxml import etree
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# copies of sanitizer.get_image_srcs and lib.get_media_filename as they
+# were when the table was added, so later changes to the app don't change
+# what this migration does
+
+
+def get_image_srcs(content):
+    """ the src of every img tag in an html string
+    """
+    if not content:
+        return []
+
+    try:
+        root = lxml.html.fromstring(content)
+    except etree.ParserError:
+        return []
+    return [img.get('src') for img in root.iter('img') if img.get('src')]
+
+
+def get_media_filename(url):
+    """ the name in the media storage of a url into MEDIA_URL, or None
+    """
+    url, media_url = urlparse(url or ''), urlparse(settings.MEDIA_URL)
+    if url.netloc != media_url.netloc:
+        return None
+    if not url.path.startswith(media_url.path) or url.path == media_url.path:
+        return None
+    return unquote(url.path[len(media_url.path):])
+
+
+def fill_thought_images(apps, schema_editor):
+    """ record the inline images of the existing Thoughts
+    """
+    Thought = apps.get_model('blog', 'Thought')
+    ThoughtImage = apps.get_model('blog', 'ThoughtImage')
+
+    images = []
+    for slug, content in Thought.objects.values_list('slug', 'content').iterator():
+        filenames = set(get_media_filename(src) for src in get_image_srcs(content)) - {None}
+        images += [ThoughtImage(thought_id=slug, filename=f) for f in sorted(filenames)]
+    ThoughtImage.objects.bulk_create(images, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0042_image_widths'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThoughtImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(db_index=True, max_length=300)),
+                ('thought', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='blog.Thought')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='thoughtimage',
+            unique_together=set([('thought', 'filename')]),
+        ),
+        migrations.RunPython(fill_thought_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 19:48
+from __future__ import unicode_literals
+
+import lxml.html
+from lxml import etree
+from lxml.html.clean import Cleaner
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# the full text index over blog_searchentry (see SearchEntry and
+# blog.search), kept up to date by triggers. Postgres gets a weighted
+# tsvector column with a GIN index, SQLite an external content FTS5 table.
+#
+# Note: SQLite rebuilds a table for most ALTERs, which drops its triggers;
+# a later migration that alters blog_searchentry has to create them again.
+INDEX_SQL = {
+    'postgresql': [
+        "ALTER TABLE blog_searchentry ADD COLUMN document tsvector",
+        """CREATE FUNCTION blog_searchentry_document() RETURNS trigger AS $$
+           BEGIN
+               NEW.document := setweight(to_tsvector('pg_catalog.english', coalesce(NEW.title, '')), 'A') ||
+                               setweight(to_tsvector('pg_catalog.english', coalesce(NEW.body, '')), 'B');
+               RETURN NEW;
+           END
+           $$ LANGUAGE plpgsql""",
+        """CREATE TRIGGER blog_searchentry_document BEFORE INSERT OR UPDATE OF title, body ON blog_searchentry
+           FOR EACH ROW EXECUTE PROCEDURE blog_searchentry_document()""",
+        "CREATE INDEX blog_searchentry_document_idx ON blog_searchentry USING gin(document)",
+    ],
+    'sqlite': [
+        """CREATE VIRTUAL TABLE blog_searchentry_fts USING fts5(
+               title, body, content='blog_searchentry', content_rowid='id',
+               tokenize='porter unicode61 remove_diacritics 2'
+           )""",
+        """CREATE TRIGGER blog_searchentry_ai AFTER INSERT ON blog_searchentry BEGIN
+               INSERT INTO blog_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+           END""",
+        """CREATE TRIGGER blog_searchentry_ad AFTER DELETE ON blog_searchentry BEGIN
+               INSERT INTO blog_searchentry_fts(blog_searchentry_fts, rowid, title, body)
+                   VALUES ('delete', old.id, old.title, old.body);
+           END""",
+        """CREATE TRIGGER blog_searchentry_au AFTER UPDATE OF title, body ON blog_searchentry BEGIN
+               INSERT INTO blog_searchentry_fts(blog_searchentry_fts, rowid, title, body)
+                   VALUES ('delete', old.id, old.title, old.body);
+               INSERT INTO blog_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+           END""",
+    ],
+}
+
+DROP_INDEX_SQL = {
+    'postgresql': [
+        "DROP TRIGGER blog_searchentry_document ON blog_searchentry",
+        "DROP FUNCTION blog_searchentry_document()",
+    ],
+    'sqlite': [
+        "DROP TABLE blog_searchentry_fts",
+    ],
+}
+
+
+def run_sql(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+# SearchEntry.get_text (with sanitizer.get_text) as it was when the index
+# was added, so later changes to the app don't change what this migration
+# does
+TEXT_BLOCK_TAGS = [
+    'p', 'div', 'br', 'hr', 'li', 'ul', 'ol', 'blockquote', 'pre', 'table', 'tr', 'td', 'th',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+]
+
+
+def get_text(html):
+    """ the words of an html string, without the match marks of blog.search
+    """
+    if not html:
+        return ''
+
+    try:
+        root = lxml.html.fromstring(html)
+    except etree.ParserError:
+        return ''
+    Cleaner(page_structure=True, links=True, safe_attrs_only=False, remove_unknown_tags=False)(root)
+
+    for el in root.iter(*TEXT_BLOCK_TAGS):
+        el.text = " " + (el.text or "")
+        el.tail = " " + (el.tail or "")
+    return " ".join(root.text_content().replace('\x02', ' ').replace('\x03', ' ').split())
+
+
+def fill_search_entries(apps, schema_editor):
+    """ index the existing Thoughts, Notes and Ideas (see
+        SearchEntry.update_for)
+    """
+    SearchEntry = apps.get_model('blog', 'SearchEntry')
+    Thought = apps.get_model('blog', 'Thought')
+    Note = apps.get_model('blog', 'Note')
+    Idea = apps.get_model('blog', 'Idea')
+
+    entries = []
+    for t in Thought.objects.only('slug', 'title', 'content', 'is_draft', 'is_trash').iterator():
+        entries.append(SearchEntry(thought_id=t.slug, title=t.title, body=get_text(t.content),
+                                   is_public=not t.is_draft and not t.is_trash))
+    for n in Note.objects.only('id', 'title', 'content').iterator():
+        entries.append(SearchEntry(note_id=n.id, title=n.title, body=get_text(n.content), is_public=False))
+    for i in Idea.objects.only('slug', 'name', 'description').iterator():
+        entries.append(SearchEntry(idea_id=i.slug, title=i.name, body=get_text(i.description), is_public=True))
+    SearchEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0043_thoughtimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('body', models.TextField(blank=True, default='')),
+                ('is_public', models.BooleanField(db_index=True, default=False)),
+                ('idea', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='blog.Idea')),
+                ('note', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='blog.Note')),
+                ('thought', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='blog.Thought')),
+            ],
+        ),
+        migrations.RunPython(run_sql(INDEX_SQL), run_sql(DROP_INDEX_SQL)),
+        migrations.RunPython(fill_search_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 19:52
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0044_searchentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='highlight',
+            name='publish_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='thought',
+            name='publish_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.23 on 2026-10-18 20:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0045_publish_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idea',
+            name='icon_format',
+            field=models.CharField(blank=True, default='', max_length=4),
+        ),
+    ]
@@ -1,21 +1,100 @@
-import os
 import json
 import datetime
 import urllib
 
 import pytz
+from imagekit import ImageSpec
 from imagekit.models import ImageSpecField
 from imagekit.processors import Crop
-from bs4 import BeautifulSoup
 
-from django.db import models
-from django.db.models import Max
+from django.db import models, connection, transaction
+from django.db.models import Max, F, Q, Case, When, Value, Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from django.db.models.query import QuerySet
 from django.conf import settings
+from django.core.urlresolvers import reverse, NoReverseMatch
 from django.contrib.auth.models import User
 
 import paths
-from blog import lib
+from blog import lib, pagecache, pagination, sanitizer
+
+
+###############################################################################
+# image processing
+###############################################################################
+def queue_image_resize(instance, field_name, new_size):
+    """ resize an uploaded image (Idea icon, Thought preview, Highlight icon)
+        in a celery worker instead of while the save waits. The instance's
+        image_pending flag is set until the worker is done (see
+        blog.tasks.process_image), and the task is only queued once the save
+        has committed so the worker doesn't read the old row.
+    """
+    from blog.tasks import process_image
+
+    args = (instance._meta.model_name, instance.pk, field_name, list(new_size))
+    transaction.on_commit(lambda: process_image.delay(*args))
+
+
+def update_image_state(instance, original, field_name, new_size):
+    """ called from save() before the row is written: work out whether the
+        image in field_name needs resizing and set the instance's
+        image_pending and image_widths fields to match. 'original' is the
+        instance as it is in the database (None for new ones). Returns True
+        if queue_image_resize should be called after the save.
+
+        The image is only processed when it is new or replaced, or when it
+        was last processed for a different width (image_widths ends with
+        the width it was resized to, or records the width it failed at; see
+        lib.get_processed_width). Saving an unchanged image keeps the flags
+        as they are in the database, since the instance being saved may
+        have been loaded before the worker finished.
+    """
+    image = getattr(instance, field_name)
+    if not image:
+        instance.image_pending, instance.image_widths = False, ''
+        return False
+
+    if original is not None and getattr(original, field_name).name == image.name:
+        instance.image_pending, instance.image_widths = original.image_pending, original.image_widths
+
+        if original.image_pending or lib.get_processed_width(original.image_widths) == new_size[0]:
+            # already queued, or done (or failed; trying again won't help)
+            return False
+
+    instance.image_pending, instance.image_widths = True, ''
+    return True
+
+
+def get_image_files(instance, field_name):
+    """ the names of an image and every variant made of it (see
+        lib.save_image_variants)
+    """
+    filename = getattr(instance, field_name).name
+    return [filename] + lib.get_variant_names(filename, lib.parse_image_widths(instance.image_widths))
+
+
+class IdeaIconSmall(ImageSpec):
+    """ the banner on the Idea page, cut out of the middle of the icon and
+        encoded in the format the worker picked for it (Idea.icon_format,
+        see lib.choose_image_format), so icons with transparency stay PNGs.
+        Until the worker is done the format is guessed from the file name;
+        nothing here reads the icon from storage.
+    """
+    processors = [Crop(
+        width=lib.IDEA_PREVIEW_IMAGE_SMALL_SIZE[0],
+        height=lib.IDEA_PREVIEW_IMAGE_SMALL_SIZE[1],
+        anchor=(0.5, 0.5),
+    )]
+
+    @property
+    def format(self):
+        return self.source.instance.icon_format or lib.guess_image_format(self.source.name)
+
+    @property
+    def options(self):
+        if self.format == 'JPEG':
+            return {'quality': 70, 'optimize': True, 'progressive': True}
+        return lib.IMAGE_ENCODINGS[self.format][1]
 
 
 ###############################################################################
@@ -31,46 +110,117 @@ class Idea(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(primary_key=True)
     description = models.TextField()
-    order = models.IntegerField(unique=True)
+    order = models.IntegerField()
     icon = models.ImageField(
         upload_to=paths.MEDIA_IMAGE_DIR,
         blank=False,
         null=False,
     )
-    icon_small = ImageSpecField(
-        source='icon',
-        processors=[Crop(
-            width=lib.IDEA_PREVIEW_IMAGE_SMALL_SIZE[0],
-            height=lib.IDEA_PREVIEW_IMAGE_SMALL_SIZE[1],
-            anchor=(0.5, 0.5),
-        )],
-        format='png',
-        options={'quality': '70'},
-    )
+    icon_small = ImageSpecField(source='icon', spec=IdeaIconSmall)
+
+    # the icon is still being resized (see queue_image_resize) and the
+    # widths it is available in once it is done
+    image_pending = models.BooleanField(default=False)
+    image_widths = models.CharField(max_length=100, blank=True, default='')
+
+    # the format the resized icon was encoded in (set by image_resized)
+    icon_format = models.CharField(max_length=4, blank=True, default='')
+
+    # precomputed excerpts (see update_excerpts)
+    excerpt = models.TextField(blank=True, default='')
+    excerpt_short = models.TextField(blank=True, default='')
 
     # non field members
     allowed_tags = [
         'abbr', 'ul', 'code', 'em', 'strong', 'li', 'ol', 'p',
         'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'br'
     ]
+    excerpt_fields = ['excerpt', 'excerpt_short']
+
+    # Ideas are ordered by (order, slug). New Ideas and moved Ideas get an
+    # order value in the gap between their neighbours, so moving an Idea is
+    # a single UPDATE of its own row; the gaps are only spread out again
+    # (see apply_ordering) when two neighbours have run out of room.
+    ORDER_GAP = 1024
+
+    class Meta:
+        index_together = [['order', 'slug']]
 
     def get_next(self):
         """ get the next Idea by order column or return
             None if this Idea instance is the latest
         """
-        try:
-            return Idea.objects.filter(order__gt=self.order).order_by('order')[0]
-        except IndexError:
-            return None
+        return Idea.objects.filter(
+            Q(order__gt=self.order) | Q(order=self.order, slug__gt=self.slug)
+        ).order_by('order', 'slug').first()
 
     def get_prev(self):
         """ get the previous Idea by order column or return
             None if this Idea instance is the first
         """
-        try:
-            return Idea.objects.filter(order__lt=self.order).order_by('-order')[0]
-        except IndexError:
-            return None
+        return Idea.objects.filter(
+            Q(order__lt=self.order) | Q(order=self.order, slug__lt=self.slug)
+        ).order_by('-order', '-slug').first()
+
+    def get_position(self):
+        """ position of this Idea in the ordering (0 is first)
+        """
+        return Idea.objects.filter(Q(order__lt=self.order) | Q(order=self.order, slug__lt=self.slug)).count()
+
+    def move_to(self, position):
+        """ move this Idea to 'position' (0 is first) in the ordering. A
+            position past the end moves it to the end.
+        """
+        others = Idea.objects.exclude(slug=self.slug).order_by('order', 'slug')
+        position = max(int(position), 0)
+
+        # the order values of the Ideas that will be either side of it
+        neighbours = list(others.values_list('order', flat=True)[max(position - 1, 0):position + 1])
+        if position == 0:
+            low, high = None, neighbours[0] if neighbours else None
+        elif neighbours:
+            low, high = neighbours[0], neighbours[1] if len(neighbours) > 1 else None
+        else:
+            low, high = others.aggregate(Max('order'))['order__max'], None
+
+        if low is None and high is None:
+            order = Idea.ORDER_GAP
+        elif low is None:
+            order = high - Idea.ORDER_GAP
+        elif high is None:
+            order = low + Idea.ORDER_GAP
+        elif high - low > 1:
+            order = (low + high) // 2
+        else:
+            # no room left between the neighbours
+            slugs = list(others.values_list('slug', flat=True))
+            slugs.insert(position, self.slug)
+            self.order = Idea.apply_ordering(slugs)[self.slug]
+            return
+
+        Idea.objects.filter(slug=self.slug).update(order=order)
+        self.order = order
+        pagecache.ideas_reordered()
+
+    @staticmethod
+    def apply_ordering(slugs):
+        """ put the Ideas in the order of the given list of slugs, spaced
+            ORDER_GAP apart, with a single UPDATE. Ideas missing from the list
+            keep their relative order after the listed ones. Returns a
+            dictionary of slug -> new order value.
+        """
+        slugs = lib.remove_duplicates([lib.slugify(s) for s in slugs])
+        slugs += list(Idea.objects.exclude(slug__in=slugs).order_by('order', 'slug').values_list('slug', flat=True))
+
+        orders = dict((slug, (idx + 1) * Idea.ORDER_GAP) for idx, slug in enumerate(slugs))
+        Idea.objects.update(order=Case(
+            *[When(slug=slug, then=Value(order)) for slug, order in orders.items()],
+            default=F('order'),
+            output_field=models.IntegerField()
+        ))
+
+        pagecache.ideas_reordered()
+        return orders
 
     def strip_tags(self):
         """ strip all html tags from content field and return the content field
@@ -89,27 +239,81 @@ class Idea(models.Model):
             full_link=full_link,
         )
 
+    def update_excerpts(self):
+        """ fill in the excerpt fields from the description field. These are
+            the truncated versions the list views display, so they don't need
+            to sanitize html on every request.
+
+            excerpt -> idea catalog
+            excerpt_short -> dashboard idea list
+        """
+        self.excerpt = self.truncate()
+        self.excerpt_short = self.truncate(max_length=50)
+
+    def get_stat_names(self):
+        """ dashboard statistics (see Statistic) this Idea counts towards
+        """
+        return ['idea_count']
+
+    def get_search_document(self):
+        """ title, text and visibility for the search index (see SearchEntry)
+        """
+        return self.name, self.description, True
+
     def save(self, *args, **kwargs):
-        """ if order field is None, add value (1 + maximum existing value)
+        """ if order field is None, put the Idea at the end of the ordering
+            (ORDER_GAP past the maximum existing value). Two Ideas created at
+            the same time can get the same value; ties are broken by slug.
         """
-        if not self.order:
+        is_new = self._state.adding
+        orig = None if is_new else Idea.objects.filter(slug=self.slug).only('icon', 'image_pending', 'image_widths', 'icon_format').first()
+
+        if self.order is None:
             idea_idx = Idea.objects.all().aggregate(Max('order'))['order__max']
-            if idea_idx:
-                idea_idx += 1
-            else:
-                idea_idx = 1
-            self.order = idea_idx
+            self.order = (idea_idx or 0) + Idea.ORDER_GAP
+
+        self.update_excerpts()
+        resize = update_image_state(self, orig, 'icon', lib.IDEA_PREVIEW_IMAGE_SIZE)
+        if resize:
+            self.icon_format = ''
 
         # "real" save method
         super(Idea, self).save(*args, **kwargs)
 
-        if self.icon:
-            lib.resize_image(self.icon.name, new_size=lib.IDEA_PREVIEW_IMAGE_SIZE)
+        if is_new:
+            Statistic.adjust(added=self.get_stat_names())
+        pagecache.idea_changed(self)
+        SearchEntry.update_for(self)
+
+        if resize:
+            queue_image_resize(self, 'icon', lib.IDEA_PREVIEW_IMAGE_SIZE)
+
+    def image_resized(self, image=None):
+        """ called by the worker once the icon has been resized ('image',
+            None if that failed)
+        """
+        if image is not None:
+            self.icon_format = lib.choose_image_format(image)
+            Idea.objects.filter(slug=self.slug, icon=self.icon.name).update(icon_format=self.icon_format)
+
+        # the small icon is cut out of the full size one
+        self.icon_small.generate(force=True)
+        pagecache.idea_changed(self)
 
     def delete(self, *args, **kwargs):
-        lib.delete_file(self.icon.name)
+        has_thoughts = Thought.objects.filter(idea=self).exists()
+
         super(Idea, self).delete(*args, **kwargs)
 
+        # deleting an Idea cascades to its Thoughts without calling their
+        # delete methods, so the thought counters have to be recounted
+        if has_thoughts:
+            Statistic.rebuild()
+        else:
+            Statistic.adjust(removed=self.get_stat_names())
+        pagecache.idea_changed(self)
+        pagination.tables_changed(Idea, Thought, Task)
+
     def __str__(self):
         return self.__unicode__()
 
@@ -136,17 +340,39 @@ class Thought(models.Model):
     is_trash = models.BooleanField(default=False)
     date_published = models.DateTimeField(auto_now_add=True)
     date_edited = models.DateTimeField(auto_now=True)
+
+    # when a draft is due to be published (see bulk.publish_scheduled)
+    publish_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
     preview = models.ImageField(
         upload_to=paths.MEDIA_IMAGE_DIR,
         blank=True,
         null=True,
     )
 
+    # the preview is still being resized (see queue_image_resize) and the
+    # widths it is available in once it is done
+    image_pending = models.BooleanField(default=False)
+    image_widths = models.CharField(max_length=100, blank=True, default='')
+
+    # precomputed excerpts (see update_excerpts)
+    excerpt = models.TextField(blank=True, default='')
+    excerpt_lead = models.TextField(blank=True, default='')
+    excerpt_link = models.TextField(blank=True, default='')
+    excerpt_media = models.TextField(blank=True, default='')
+
     # non field members
     allowed_tags = [
         'abbr', 'ul', 'code', 'em', 'strong', 'li', 'ol', 'p',
         'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'br'
     ]
+    excerpt_fields = ['excerpt', 'excerpt_lead', 'excerpt_link', 'excerpt_media']
+
+    def get_absolute_url(self):
+        return reverse('thought-page', kwargs={
+            'idea_slug': self.idea_id,
+            'thought_slug': self.slug,
+        })
 
     def strip_tags(self):
         """ strip all html tags from content field and return the content field
@@ -165,6 +391,27 @@ class Thought(models.Model):
             full_link=full_link,
         )
 
+    def update_excerpts(self):
+        """ fill in the excerpt fields from the content field. These are the
+            truncated versions the list views display, so they don't need to
+            sanitize html on every request.
+
+            excerpt -> front page story list
+            excerpt_lead -> front page showcase (latest thought)
+            excerpt_link -> idea page, with a "(Read More)" link
+            excerpt_media -> idea catalog sidebar, inline images allowed
+        """
+        try:
+            full_link = self.get_absolute_url()
+        except NoReverseMatch:
+            # slugs that can't make a url (e.g. empty) get no "(Read More)" link
+            full_link = None
+
+        self.excerpt = self.truncate()
+        self.excerpt_lead = self.truncate(max_length=240)
+        self.excerpt_link = self.truncate(max_length=175, full_link=full_link)
+        self.excerpt_media = self.truncate(allowed_tags=list(self.allowed_tags) + ['img'])
+
     def get_preview(self):
         """ safe way to get preview url for this thought. Will return None if
             there is no preview picture. Use template tag |default_if_none:
@@ -174,11 +421,55 @@ class Thought(models.Model):
             return self.preview.url
         return self.idea.icon.url
 
+    def get_preview_image(self):
+        """ the image field behind get_preview (the preview or the Idea icon)
+            for the responsive_image template tag
+        """
+        return self.preview if self.preview else self.idea.icon
+
+    def get_neighbour_thoughts(self, num=lib.NUM_THOUGHT_NAV):
+        """ get up to "num" published thoughts on either side of this one in
+            the same Idea, in one query (with their Ideas), and return a tuple
+            of lists (next thoughts, oldest first; previous thoughts, newest
+            first).
+
+            The result is kept on the instance, so the thought_nav tags on a
+            page share one query.
+        """
+        cached = getattr(self, '_neighbour_thoughts', None)
+        if cached and cached[0] >= num:
+            return cached[1], cached[2]
+
+        thoughts = Thought.objects.filter(idea=self.idea_id, is_draft=False, is_trash=False).exclude(slug=self.slug)
+
+        # date of the num'th thought in each direction bounds the window; if
+        # there aren't that many, the window is open on that side
+        next_bound = thoughts.filter(date_published__gt=self.date_published)\
+            .order_by('date_published').values('date_published')[num - 1:num]
+        prev_bound = thoughts.filter(date_published__lt=self.date_published)\
+            .order_by('-date_published').values('date_published')[num - 1:num]
+
+        window = thoughts.filter(
+            date_published__lte=Coalesce(Subquery(next_bound), F('date_published')),
+            date_published__gte=Coalesce(Subquery(prev_bound), F('date_published')),
+        ).select_related('idea').defer('content', 'idea__description').order_by('date_published')
+        window = list(window)
+
+        next_thoughts = [t for t in window if t.date_published > self.date_published][:num]
+        prev_thoughts = [t for t in reversed(window) if t.date_published < self.date_published][:num]
+
+        self._neighbour_thoughts = (num, next_thoughts, prev_thoughts)
+        return next_thoughts, prev_thoughts
+
     def get_next_thoughts(self, num=1, include_drafts=False, include_trash=False):
         """ get the next "num" thoughts in the same Idea and return a list
             of Thought objects. This list will be padded with None types such
             that it will be of length "num" always.
         """
+        if not include_drafts and not include_trash:
+            adjacent_thoughts = self.get_neighbour_thoughts(max(num, lib.NUM_THOUGHT_NAV))[0][:num]
+            return adjacent_thoughts + [None] * (num - len(adjacent_thoughts))
+
         query_params = {
             'idea': self.idea,
             'is_draft': include_drafts,
@@ -202,6 +493,10 @@ class Thought(models.Model):
             of Thought objects. This list will be padded with None types such
             that it will be of length "num" always.
         """
+        if not include_drafts and not include_trash:
+            adjacent_thoughts = self.get_neighbour_thoughts(max(num, lib.NUM_THOUGHT_NAV))[1][:num]
+            return adjacent_thoughts + [None] * (num - len(adjacent_thoughts))
+
         query_params = {
             'idea': self.idea,
             'is_draft': include_drafts,
@@ -231,45 +526,83 @@ class Thought(models.Model):
 
     def get_image_urls(self):
         """ parse the html in the content field and return a list of
-            image urls (relative to media url) for processing
+            image urls (the src of every img tag)
         """
-        soup = BeautifulSoup(self.content)
-        return [image['src'] for image in soup.findAll('img')]
+        return sanitizer.get_image_srcs(self.content)
+
+    def update_image_references(self):
+        """ bring the ThoughtImage rows of this Thought in line with the img
+            tags in its content
+        """
+        filenames = set(lib.get_media_filename(src) for src in self.get_image_urls()) - {None}
+        current = set(self.images.values_list('filename', flat=True))
+
+        if current - filenames:
+            self.images.filter(filename__in=current - filenames).delete()
+        ThoughtImage.objects.bulk_create([ThoughtImage(thought=self, filename=f) for f in filenames - current])
 
     def display_compact_date(self):
         return lib.display_compact_date(self.date_published)
 
+    def get_stat_names(self):
+        """ dashboard statistics (see Statistic) this Thought counts towards
+        """
+        if self.is_trash:
+            return ['trash_count']
+        elif self.is_draft:
+            return ['draft_count']
+        return ['thought_count']
+
+    def get_search_document(self):
+        """ title, text and visibility for the search index (see SearchEntry)
+        """
+        return self.title, self.content, not self.is_draft and not self.is_trash
+
     def save(self, *args, **kwargs):
         # check to see if this save means a draft is being published and
         # change date_published to now
-        auto_update = kwargs['auto_update'] if 'auto_update' in kwargs else True
+        auto_update = kwargs.pop('auto_update', True)
         try:
-            if auto_update:
-                orig = Thought.objects.get(slug=self.slug)
-                if orig.is_draft and not self.is_draft:
-                    self.date_published = pytz.timezone(settings.TIME_ZONE).localize(datetime.datetime.now())
+            orig = Thought.objects.get(slug=self.slug)
         except Thought.DoesNotExist:
-            pass
+            orig = None
+
+        if auto_update and orig and orig.is_draft and not self.is_draft:
+            self.date_published = pytz.timezone(settings.TIME_ZONE).localize(datetime.datetime.now())
+
+        # only drafts wait to be published
+        if not self.is_draft:
+            self.publish_at = None
+
+        self.update_excerpts()
+        resize = update_image_state(self, orig, 'preview', lib.THOUGHT_PREVIEW_IMAGE_SIZE)
 
         # "real" save method
-        super(Thought, self).save()
+        super(Thought, self).save(*args, **kwargs)
 
-        # crop picture if necessary
-        if not self.preview:
-            return
+        if orig is None or orig.content != self.content:
+            self.update_image_references()
+        if orig is None or orig.get_search_document() != self.get_search_document():
+            SearchEntry.update_for(self)
 
-        lib.resize_image(self.preview.name, lib.THOUGHT_PREVIEW_IMAGE_SIZE)
+        Statistic.adjust(removed=orig.get_stat_names() if orig else None, added=self.get_stat_names())
+        pagecache.thought_changed(self, original=orig)
 
-    def delete(self, *args, **kwargs):
-        lib.delete_file(self.preview.name)
+        # crop picture if necessary
+        if resize:
+            queue_image_resize(self, 'preview', lib.THOUGHT_PREVIEW_IMAGE_SIZE)
 
-        # remove inline images
-        for image in self.get_image_urls():
-            image = os.path.basename(image)
-            image = os.path.join(paths.MEDIA_IMAGE_DIR, image)
-            lib.delete_file(image)
+    def image_resized(self, image=None):
+        """ called by the worker once the preview has been resized
+        """
+        pagecache.thought_changed(self, original=self)
 
+    def delete(self, *args, **kwargs):
+        # find the pages showing this thought while it's still in the table
+        pagecache.thought_changed(self, original=self, deleted=True)
         super(Thought, self).delete(*args, **kwargs)
+        Statistic.adjust(removed=self.get_stat_names())
+        pagination.tables_changed(Thought)
 
     def __str__(self):
         return self.__unicode__()
@@ -278,6 +611,25 @@ class Thought(models.Model):
         return '"' + self.title + '"' + " (" + self.slug + ")"
 
 
+class ThoughtImage(models.Model):
+    """ an image a Thought shows inline (an img tag in its content), by its
+        name in the media storage. Thought.save keeps these up to date, so
+        finding the images of a Thought (see blog.media) doesn't need its
+        html parsed.
+    """
+    thought = models.ForeignKey(Thought, related_name='images')
+    filename = models.CharField(max_length=300, db_index=True)
+
+    class Meta:
+        unique_together = [['thought', 'filename']]
+
+    def __str__(self):
+        return self.__unicode__()
+
+    def __unicode__(self):
+        return self.filename + " (" + self.thought_id + ")"
+
+
 ###############################################################################
 # Highlight Model
 ###############################################################################
@@ -290,16 +642,31 @@ class Highlight(models.Model):
     url = models.URLField(max_length=1000, blank=False, null=False)
     date_published = models.DateTimeField(auto_now_add=True)
     is_published = models.BooleanField(default=False)
+
+    # when an unpublished Highlight is due to be published (see
+    # bulk.publish_scheduled)
+    publish_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
     icon = models.ImageField(
         upload_to=paths.MEDIA_IMAGE_DIR,
         blank=True,
         null=True,
     )
 
+    # the icon is still being resized (see queue_image_resize) and the
+    # widths it is available in once it is done
+    image_pending = models.BooleanField(default=False)
+    image_widths = models.CharField(max_length=100, blank=True, default='')
+
+    # precomputed excerpts (see update_excerpts)
+    excerpt_link = models.TextField(blank=True, default='')
+    excerpt_short = models.TextField(blank=True, default='')
+
     # non field members
     allowed_tags = [
         'br', 'em', 'strong', 'blockquote', 'quote', 'hr', 'p'
     ]
+    excerpt_fields = ['excerpt_link', 'excerpt_short']
 
     def strip_tags(self):
         """ strip all html tags from content field and return the content field
@@ -318,20 +685,53 @@ class Highlight(models.Model):
             full_link=full_link,
         )
 
+    def update_excerpts(self):
+        """ fill in the excerpt fields from the description field so the
+            list views don't need to sanitize html on every request.
+
+            excerpt_link -> front page highlight, with a "(Read More)" link
+            excerpt_short -> dashboard highlight list
+        """
+        self.excerpt_link = self.truncate(max_length=90, full_link=reverse('highlights'))
+        self.excerpt_short = self.truncate(max_length=75, allowed_tags=['a'])
+
     def display_compact_date(self):
         return lib.display_compact_date(self.date_published)
 
+    def get_stat_names(self):
+        """ dashboard statistics (see Statistic) this Highlight counts towards
+        """
+        return ['highlight_count'] if self.is_published else []
+
     def save(self, *args, **kwargs):
+        orig = Highlight.objects.filter(pk=self.pk).first() if self.pk else None
+
+        if self.is_published:
+            self.publish_at = None
+
+        self.update_excerpts()
+        resize = update_image_state(self, orig, 'icon', lib.HIGHLIGHT_PREVIEW_IMAGE_SIZE)
+
         # "real" save method
         super(Highlight, self).save(*args, **kwargs)
 
+        Statistic.adjust(removed=orig.get_stat_names() if orig else None, added=self.get_stat_names())
+        pagecache.highlight_changed(self)
+
         # crop picture if necessary
-        if self.icon:
-            lib.resize_image(self.icon.name, lib.HIGHLIGHT_PREVIEW_IMAGE_SIZE)
+        if resize:
+            queue_image_resize(self, 'icon', lib.HIGHLIGHT_PREVIEW_IMAGE_SIZE)
+
+    def image_resized(self, image=None):
+        """ called by the worker once the icon has been resized
+        """
+        pagecache.highlight_changed(self)
 
     def delete(self, *args, **kwargs):
-        lib.delete_file(self.icon.name)
         super(Highlight, self).delete(*args, **kwargs)
+        Statistic.adjust(removed=self.get_stat_names())
+        pagecache.highlight_changed(self)
+        pagination.tables_changed(Highlight)
 
 
 ###############################################################################
@@ -357,13 +757,29 @@ class ReadingListItem(models.Model):
     def display_compact_date(self):
         return lib.display_compact_date(self.date_published)
 
+    def get_stat_names(self):
+        """ dashboard statistics (see Statistic) this book counts towards
+        """
+        return ['total_book_count', 'wish_book_count' if self.wishlist else 'read_book_count']
+
     def save(self, *args, **kwargs):
+        orig = ReadingListItem.objects.filter(pk=self.pk).first() if self.pk else None
+
         if self.date_published:
             self.date_published = datetime.datetime.now()
 
         # "real" save method
         super(ReadingListItem, self).save(*args, **kwargs)
 
+        Statistic.adjust(removed=orig.get_stat_names() if orig else None, added=self.get_stat_names())
+        pagecache.reading_list_changed(self)
+
+    def delete(self, *args, **kwargs):
+        super(ReadingListItem, self).delete(*args, **kwargs)
+        Statistic.adjust(removed=self.get_stat_names())
+        pagecache.reading_list_changed(self)
+        pagination.tables_changed(ReadingListItem)
+
 
 ###############################################################################
 # Task (To Do list items)
@@ -389,30 +805,72 @@ class Task(models.Model):
     is_completed = models.BooleanField(default=False)
     priority = models.IntegerField(choices=PRIORITY, default=PRIORITY[1][0], blank=True)
 
-    @staticmethod
-    def reorder_child_tasks(task_list, show_complete=False):
-        """ give a Queryset (or list) of Task instances, reorder
-            child tasks to come after their parent tasks. The subtasks will
-            also be ordered in order of priority then date added.
+    # guards the task tree query against a parent_task cycle
+    MAX_DEPTH = 50
 
-            NOTE: this is not tested for task lists that have nesting of more
-                  than one level
+    @staticmethod
+    def reorder_child_tasks(task_list, show_complete=False, limit=None):
+        """ give a Queryset (or list) of Task instances, return a list of the
+            top level tasks in it with all of their subtasks (at any depth)
+            following their parent tasks. Tasks are ordered by priority then
+            date added at every level. Completed subtasks are left out unless
+            show_complete is True.
+
+            The whole tree is loaded with one recursive query. Every task in
+            the result gets a 'depth' attribute (0 for top level tasks) and an
+            'open_subtask_count' attribute, and its parent_task is filled in
+            from the tree, so templates don't run a query per row.
+
+            limit -> only load the first "limit" top level tasks
         """
-        if not task_list or not isinstance(task_list, QuerySet):
+        if not isinstance(task_list, QuerySet):
             return task_list
 
-        reordered_tasks = list(task_list.filter(parent_task__isnull=True).order_by("-priority", "-date_added"))
-        for t in task_list:
-            if show_complete:
-                subtasks = Task.objects.filter(parent_task=t)
-            else:
-                subtasks = Task.objects.filter(is_completed=False, parent_task=t)
-            if not subtasks:
-                continue
-            subtasks = subtasks.order_by("-priority", "-date_added")
-
-            insert_idx = reordered_tasks.index(t)
-            reordered_tasks = reordered_tasks[:insert_idx + 1] + list(subtasks) + reordered_tasks[insert_idx + 1:]
+        roots = task_list.filter(parent_task__isnull=True).order_by("-priority", "-date_added")
+        if limit is not None:
+            roots = roots[:limit]
+        roots_sql, roots_params = roots.values('id').query.sql_with_params()
+        params = list(roots_params) + [Task.MAX_DEPTH]
+
+        child_filter = ''
+        if not show_complete:
+            child_filter = 'AND child.is_completed = %s'
+            params.append(False)
+
+        sql = """
+            WITH RECURSIVE tree (id, depth) AS (
+                SELECT id, 0 FROM {task} WHERE id IN ({roots})
+                UNION ALL
+                SELECT child.id, tree.depth + 1 FROM {task} child
+                    JOIN tree ON child.parent_task_id = tree.id
+                    WHERE tree.depth < %s {child_filter}
+            )
+            SELECT task.*, tree.depth FROM {task} task JOIN tree ON task.id = tree.id
+        """.format(task=Task._meta.db_table, roots=roots_sql, child_filter=child_filter)
+
+        tasks = list(Task.objects.raw(sql, params))
+        prefetch_related_objects(tasks, 'idea')
+
+        # group the tasks by parent and walk the tree depth first, ordering
+        # siblings by priority then date added
+        children = {}
+        for task in tasks:
+            children.setdefault(task.parent_task_id if task.depth else None, []).append(task)
+        for siblings in children.values():
+            siblings.sort(key=lambda t: (t.priority, t.date_added, t.id), reverse=True)
+
+        reordered_tasks = []
+        stack = list(reversed(children.get(None, [])))
+        while stack:
+            task = stack.pop()
+            subtasks = children.get(task.id, [])
+
+            task.open_subtask_count = len([t for t in subtasks if not t.is_completed])
+            for subtask in subtasks:
+                subtask.parent_task = task
+
+            reordered_tasks.append(task)
+            stack.extend(reversed(subtasks))
 
         return reordered_tasks
 
@@ -420,6 +878,8 @@ class Task(models.Model):
         """ check to see if this task has subtasks. NOTE: this function will
             return fals if this task has subtasks, but they are all complete
         """
+        if hasattr(self, 'open_subtask_count'):
+            return self.open_subtask_count > 0
         return Task.objects.filter(is_completed=False, parent_task=self).count() > 0
 
     def display_date_added(self):
@@ -443,6 +903,10 @@ class Task(models.Model):
         # "real" save method
         super(Task, self).save()
 
+    def delete(self, *args, **kwargs):
+        super(Task, self).delete(*args, **kwargs)
+        pagination.tables_changed(Task)
+
     def __unicode__(self):
         return self.__str__()
 
@@ -467,10 +931,14 @@ class Note(models.Model):
     content = models.TextField(max_length=5000)
     date_published = models.DateTimeField(auto_now_add=True)
 
+    # precomputed excerpt (see update_excerpts)
+    excerpt = models.TextField(blank=True, default='')
+
     # non field members
     allowed_tags = [
         'br', 'em', 'strong', 'blockquote', 'quote', 'hr', 'ul', 'li', 'ol', 'p'
     ]
+    excerpt_fields = ['excerpt']
 
     def add_idea(self, idea_slug):
         """ add an idea instance to list of associated Ideas. Note: duplicate
@@ -520,12 +988,99 @@ class Note(models.Model):
             full_link=full_link,
         )
 
+    def update_excerpts(self):
+        """ fill in the excerpt field from the content field so the sidebar
+            note list doesn't need to sanitize html on every request
+        """
+        self.excerpt = self.truncate()
+
     def display_fancy_date(self):
         return lib.display_fancy_date(self.date_published)
 
     def display_compact_date(self):
         return lib.display_compact_date(self.date_published)
 
+    def get_search_document(self):
+        """ title, text and visibility for the search index (see SearchEntry).
+            Notes are only searchable from the dashboard.
+        """
+        return self.title, self.content, False
+
+    def save(self, *args, **kwargs):
+        self.update_excerpts()
+
+        # "real" save method
+        super(Note, self).save(*args, **kwargs)
+        SearchEntry.update_for(self)
+
+    def delete(self, *args, **kwargs):
+        super(Note, self).delete(*args, **kwargs)
+        pagination.tables_changed(Note)
+
+
+###############################################################################
+# Search index
+###############################################################################
+class SearchEntry(models.Model):
+    """ the searchable text of a Thought, Note or Idea: its title and its
+        content with the html stripped (see blog.search). The save methods
+        of those models keep their entry up to date and deleting them
+        deletes it.
+
+        The database keeps a full text index over the title and body that
+        the ORM doesn't know about (created in migration 0044): a weighted
+        tsvector column with a GIN index on Postgres, an FTS5 table on
+        SQLite. Both are filled by triggers on this table.
+    """
+    thought = models.OneToOneField(Thought, null=True, related_name='search_entry')
+    note = models.OneToOneField(Note, null=True, related_name='search_entry')
+    idea = models.OneToOneField(Idea, null=True, related_name='search_entry')
+    title = models.CharField(max_length=200)
+    body = models.TextField(blank=True, default='')
+
+    # shown to visitors (published Thoughts and Ideas)
+    is_public = models.BooleanField(default=False, db_index=True)
+
+    @staticmethod
+    def get_text(html):
+        """ the words of an html string for the index. The control
+            characters blog.search marks matches with are taken out.
+        """
+        text = sanitizer.get_text(html)
+        return " ".join(text.replace('\x02', ' ').replace('\x03', ' ').split())
+
+    @staticmethod
+    def update_for(instance):
+        """ index a Thought, Note or Idea after it was saved
+        """
+        title, html, is_public = instance.get_search_document()
+        SearchEntry.objects.update_or_create(
+            defaults={'title': title, 'body': SearchEntry.get_text(html), 'is_public': is_public},
+            **{type(instance).__name__.lower(): instance}
+        )
+
+    @staticmethod
+    def update_visibility(thoughts):
+        """ bring is_public in line for Thoughts that were published, drafted
+            or trashed with an UPDATE (see blog.bulk)
+        """
+        public = [t.slug for t in thoughts if t.get_search_document()[2]]
+        hidden = [t.slug for t in thoughts if not t.get_search_document()[2]]
+
+        if public:
+            SearchEntry.objects.filter(thought__in=public).update(is_public=True)
+        if hidden:
+            SearchEntry.objects.filter(thought__in=hidden).update(is_public=False)
+
+    def get_object(self):
+        return self.thought or self.note or self.idea
+
+    def __str__(self):
+        return self.__unicode__()
+
+    def __unicode__(self):
+        return self.title
+
 
 ###############################################################################
 # Activity (activity feed item)
@@ -577,6 +1132,72 @@ class Activity(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     tokens = models.CharField(max_length=2000, blank=True, null=True)
     url = models.URLField(max_length=500, blank=True, null=True)
+    message = models.TextField(blank=True, default='')
+
+    # message for each Activity type; "%(token)s" placeholders are filled in
+    # from the tokens. Types that log several items at once have a tuple of
+    # (one item, several items) messages, picked by the 'length' token.
+    MESSAGES = {
+        'Create Idea': "created a new <span class='excerpt'>Idea</span> <span class='idea'>%(name)s</span>",
+        'Edited Idea': "edited <span class='excerpt'>Idea</span> <span class='idea'>%(name)s</span>",
+        'Deleted Idea': "deleted <span class='excerpt'>Idea</span> <span class='idea'>%(name)s</span>",
+        'Started Draft': "started a new <span class='excerpt'>Draft</span> titled <span class='draft'>%(title)s</span>",
+        'Published Draft': (
+            "published <span class='excerpt'>Draft</span> <span class='draft'>%(title)s</span>",
+            "published %(length)d <span class='draft'>Drafts</span>",
+        ),
+        'Edited Draft': "edited <span class='excerpt'>Draft</span> <span class='draft'>%(title)s</span>",
+        'Moved Draft': "moved <span class='excerpt'>Draft</span> <span class='draft'>%(title)s</span> from <span class='excerpt'>Idea</span> <span class='idea'>%(old_idea)s</span> to <span class='idea'>%(new_idea)s</span>",
+        'Trashed Draft': (
+            "moved <span class='excerpt'>Draft</span> <span class='draft'>%(title)s</span> to the trash",
+            "moved %(length)d <span class='draft'>Drafts</span> to the trash",
+        ),
+        'Untrashed Draft': (
+            "untrashed <span class='excerpt'>Draft</span> <span class='draft'>%(title)s</span>",
+            "untrashed %(length)d <span class='draft'>Drafts</span>",
+        ),
+        'Deleted Draft': (
+            "deleted <span class='excerpt'>Draft</span> <span class='draft'>%(title)s</span>",
+            "deleted %(length)d <span class='draft'>Drafts</span>",
+        ),
+        # created a thought and published it without saving as a draft
+        'Published Thought': "published a new <span class='excerpt'>Thought</span> <span class='thought'>%(title)s</span>",
+        'Unpublished Thought': (
+            "unpublished <span class='excerpt'>Thought</span> <span class='thought'>%(title)s</span>",
+            "unpublished %(length)d <span class='thought'>Thoughts</span>",
+        ),
+        'Edited Thought': "edited <span class='excerpt'>Thought</span> <span class='thought'>%(title)s</span>",
+        'Moved Thought': "moved <span class='excerpt'>Thought</span> <span class='thought'>%(title)s</span> from <span class='excerpt'>Idea</span> <span class='idea'>%(old_idea)s</span> to <span class='idea'>%(new_idea)s</span>",
+        'Trashed Thought': (
+            "moved <span class='excerpt'>Thought</span> <span class='thought'>%(title)s</span> to the trash",
+            "moved %(length)d <span class='thought'>Thoughts</span> to the trash",
+        ),
+        'Untrashed Thought': (
+            "untrashed <span class='excerpt'>Thought</span> <span class='thought'>%(title)s</span>",
+            "untrashed %(length)d <span class='thought'>Thoughts</span>",
+        ),
+        'Deleted Thought': (
+            "deleted <span class='excerpt'>Thought</span> <span class='thought'>%(title)s</span> from trash",
+            "deleted %(length)d <span class='thought'>Thoughts</span> from trash",
+        ),
+        'Added New Highlight': "added new <span class='excerpt'>Highlight</span> <span class='highlight'>%(title)s</span>",
+        'Edited Highlight': "edited <span class='excerpt'>Highlight</span> <span class='highlight'>%(title)s</span>",
+        'Deleted Highlight': "deleted <span class='excerpt'>Highlight</span> <span class='highlight'>%(title)s</span>",
+        'Added Book to Recently Read List': "added <span class='book'>%(title)s</span> to the recently read list",
+        'Added Book to Wish List': "added <span class='book'>%(title)s</span> to the wish list",
+        'Edited Book': "edited <span class='excerpt'>Reading List Book</span> <span class='book'>%(title)s</span>",
+        'Moved Book to Recently Read List': "Moved <span class='book'>%(title)s</span> from wish list to recently read list",
+        'Deleted Book': "deleted <span class='book'>%(title)s</span> from the reading list",
+        'Added New Task Item': "added new <span class='excerpt'>Task #%(id)d:</span> <span class='task'>%(content)s</span>",
+        'Edited Task Item': "edited <span class='excerpt'>Task #%(id)d:</span> <span class='task'>%(content)s</span>",
+        'Deleted Task Item': "deleted <span class='excerpt'>Task #%(id)d:</span> <span class='task'>%(content)s</span>",
+        'Marked Task Item as Completed': "marked <span class='excerpt'>Task #%(id)d:</span> <span class='task'>%(content)s</span> as completed",
+        'Changed Task Priority': lambda t: "changed priority of <span class='excerpt'>Task #%d:</span> <span class='task'>%s</span> from <span class='excerpt'>%s</span> to <span class='excerpt'>%s</span>" %
+                                           (t['id'], t['content'], Task.PRIORITY[t['old_priority']][1], Task.PRIORITY[t['new_priority']][1]),
+        'Started New Note': "started new <span class='excerpt'>Note #%(id)d:</span> <span class='note'>%(title)s</span>",
+        'Edited Note': "edited <span class='excerpt'>Note #%(id)d:</span> <span class='note'>%(title)s</span>",
+        'Deleted Note': "deleted <span class='excerpt'>Note #%(id)d:</span> <span class='note'>%(title)s</span>",
+    }
 
     @staticmethod
     def get_type_id(type_string):
@@ -600,126 +1221,143 @@ class Activity(models.Model):
     def generate_message(self):
         """ generate output string for this Activity item. Uses information
             from type field as well as any optional data stored in the
-            tokens field.
-        """
-        if Activity.TYPE[int(self.type)][1] == 'Create Idea':
-            msg = "created a new <span class='excerpt'>Idea</span> <span class='idea'>%s</span>" % self.get_tokens()['name']
-        elif Activity.TYPE[int(self.type)][1] == 'Edited Idea':
-            msg = "edited <span class='excerpt'>Idea</span> <span class='idea'>%s</span>" % self.get_tokens()['name']
-        elif Activity.TYPE[int(self.type)][1] == 'Deleted Idea':
-            msg = "deleted <span class='excerpt'>Idea</span> <span class='idea'>%s</span>" % self.get_tokens()['name']
-        elif Activity.TYPE[int(self.type)][1] == 'Started Draft':
-            msg = "started a new <span class='excerpt'>Draft</span> titled <span class='draft'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Published Draft':
-            # took draft(s) that were already saved and published it/them
-            t = self.get_tokens()
-            if int(t['length']) > 1:
-                msg = "published %d <span class='draft'>Drafts</span>" % int(t['length'])
-            else:
-                msg = "published <span class='excerpt'>Draft</span> <span class='draft'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Edited Draft':
-            msg = "edited <span class='excerpt'>Draft</span> <span class='draft'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Moved Draft':
-            t = self.get_tokens()
-            msg = "moved <span class='excerpt'>Draft</span> <span class='draft'>%s</span> from <span class='excerpt'>Idea</span> <span class='idea'>%s</span> to <span class='idea'>%s</span>"\
-                  % (t['title'], t['old_idea'], t['new_idea'])
-        elif Activity.TYPE[int(self.type)][1] == 'Trashed Draft':
-            t = self.get_tokens()
-            if int(t['length']) > 1:
-                msg = "moved %d <span class='draft'>Drafts</span> to the trash" % int(t['length'])
-            else:
-                msg = "moved <span class='excerpt'>Draft</span> <span class='draft'>%s</span> to the trash" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Untrashed Draft':
-            t = self.get_tokens()
-            if int(t['length']) > 1:
-                msg = "untrashed %d <span class='draft'>Drafts</span>" % int(t['length'])
-            else:
-                msg = "untrashed <span class='excerpt'>Draft</span> <span class='draft'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Deleted Draft':
-            t = self.get_tokens()
-            if int(t['length']) > 1:
-                msg = "deleted %d <span class='draft'>Drafts</span>" % int(t['length'])
-            else:
-                msg = "deleted <span class='excerpt'>Draft</span> <span class='draft'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Published Thought':
-            # created a thought and published it without saving as a draft
-            msg = "published a new <span class='excerpt'>Thought</span> <span class='thought'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Unpublished Thought':
-            t = self.get_tokens()
-            if int(t['length']) > 1:
-                msg = "unpublished %d <span class='thought'>Thoughts</span>" % int(t['length'])
-            else:
-                msg = "unpublished <span class='excerpt'>Thought</span> <span class='thought'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Edited Thought':
-            msg = "edited <span class='excerpt'>Thought</span> <span class='thought'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Moved Thought':
-            t = self.get_tokens()
-            msg = "moved <span class='excerpt'>Thought</span> <span class='thought'>%s</span> from <span class='excerpt'>Idea</span> <span class='idea'>%s</span> to <span class='idea'>%s</span>"\
-                  % (t['title'], t['old_idea'], t['new_idea'])
-        elif Activity.TYPE[int(self.type)][1] == 'Trashed Thought':
-            t = self.get_tokens()
-            if int(t['length']) > 1:
-                msg = "moved %d <span class='thought'>Thoughts</span> to the trash" % int(t['length'])
-            else:
-                msg = "moved <span class='excerpt'>Thought</span> <span class='thought'>%s</span> to the trash" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Untrashed Thought':
-            t = self.get_tokens()
-            if int(t['length']) > 1:
-                msg = "untrashed %d <span class='thought'>Thoughts</span>" % int(t['length'])
-            else:
-                msg = "untrashed <span class='excerpt'>Thought</span> <span class='thought'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Deleted Thought':
-            t = self.get_tokens()
-            if int(t['length']) > 1:
-                msg = "deleted %d <span class='thought'>Thoughts</span> from trash" % int(t['length'])
-            else:
-                msg = "deleted <span class='excerpt'>Thought</span> <span class='thought'>%s</span> from trash" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Added New Highlight':
-            msg = "added new <span class='excerpt'>Highlight</span> <span class='highlight'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Edited Highlight':
-            msg = "edited <span class='excerpt'>Highlight</span> <span class='highlight'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Deleted Highlight':
-            msg = "deleted <span class='excerpt'>Highlight</span> <span class='highlight'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Added Book to Recently Read List':
-            msg = "added <span class='book'>%s</span> to the recently read list" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Added Book to Wish List':
-            msg = "added <span class='book'>%s</span> to the wish list" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Edited Book':
-            msg = "edited <span class='excerpt'>Reading List Book</span> <span class='book'>%s</span>" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Moved Book to Recently Read List':
-            msg = "Moved <span class='book'>%s</span> from wish list to recently read list" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Deleted Book':
-            msg = "deleted <span class='book'>%s</span> from the reading list" % self.get_tokens()['title']
-        elif Activity.TYPE[int(self.type)][1] == 'Added New Task Item':
-            t = self.get_tokens()
-            msg = "added new <span class='excerpt'>Task #%d:</span> <span class='task'>%s</span>" % (t['id'], t['content'])
-        elif Activity.TYPE[int(self.type)][1] == 'Edited Task Item':
-            t = self.get_tokens()
-            msg = "edited <span class='excerpt'>Task #%d:</span> <span class='task'>%s</span>" % (t['id'], t['content'])
-        elif Activity.TYPE[int(self.type)][1] == 'Deleted Task Item':
-            t = self.get_tokens()
-            msg = "deleted <span class='excerpt'>Task #%d:</span> <span class='task'>%s</span>" % (t['id'], t['content'])
-        elif Activity.TYPE[int(self.type)][1] == 'Marked Task Item as Completed':
-            t = self.get_tokens()
-            msg = "marked <span class='excerpt'>Task #%d:</span> <span class='task'>%s</span> as completed" % (t['id'], t['content'])
-        elif Activity.TYPE[int(self.type)][1] == 'Changed Task Priority':
-            t = self.get_tokens()
-            msg = "changed priority of <span class='excerpt'>Task #%d:</span> <span class='task'>%s</span> from <span class='excerpt'>%s</span> to <span class='excerpt'>%s</span>" %\
-                  (t['id'], t['content'], Task.PRIORITY[t['old_priority']][1], Task.PRIORITY[t['new_priority']][1])
-        elif Activity.TYPE[int(self.type)][1] == 'Started New Note':
-            t = self.get_tokens()
-            msg = "started new <span class='excerpt'>Note #%d:</span> <span class='note'>%s</span>" % (t['id'], t['title'])
-        elif Activity.TYPE[int(self.type)][1] == 'Edited Note':
-            t = self.get_tokens()
-            msg = "edited <span class='excerpt'>Note #%d:</span> <span class='note'>%s</span>" % (t['id'], t['title'])
-        elif Activity.TYPE[int(self.type)][1] == 'Deleted Note':
-            t = self.get_tokens()
-            msg = "deleted <span class='excerpt'>Note #%d:</span> <span class='note'>%s</span>" % (t['id'], t['title'])
-        #elif Activity.TYPE[int(self.type)][1] == 'Tweet':
-        else:
+            tokens field. See Activity.MESSAGES for the wording.
+        """
+        return Activity.render_message(self.type, self.get_tokens())
+
+    @staticmethod
+    def render_message(type_id, tokens):
+        """ render the message for an Activity of the given type from its
+            (unserialized) tokens. Raises IndexError for types that don't
+            have a message.
+        """
+        try:
+            message = Activity.MESSAGES[Activity.TYPE[int(type_id)][1]]
+        except (KeyError, IndexError):
             raise IndexError("Invalid Activity Type")
 
-        return msg
+        tokens = dict(tokens)
+        if 'length' in tokens:
+            tokens['length'] = int(tokens['length'])
+
+        if isinstance(message, tuple):
+            # (one item, several items)
+            message = message[1] if tokens.get('length', 1) > 1 else message[0]
+        if callable(message):
+            return message(tokens)
+        return message % tokens
+
+    def get_message(self):
+        """ return the stored message, rendering it if it was never stored
+        """
+        return self.message or self.generate_message()
+
+    def save(self, *args, **kwargs):
+        # activities are a log; render the message once, when it's written
+        if not self.message:
+            self.message = self.generate_message()
+
+        # "real" save method
+        super(Activity, self).save(*args, **kwargs)
 
     def display_date(self):
         return lib.display_fancy_date(self.date)
+
+
+###############################################################################
+# Dashboard statistics (counter table)
+###############################################################################
+class Statistic(models.Model):
+    """ Running counts shown in the dashboard stat box. One row per
+        statistic; the Thought, Idea, Highlight and ReadingListItem save and
+        delete methods adjust the rows they affect, so reading the stats is
+        a single primary key lookup no matter how big the tables get.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.IntegerField(default=0)
+
+    names = [
+        'thought_count', 'draft_count', 'trash_count', 'idea_count',
+        'highlight_count', 'read_book_count', 'wish_book_count', 'total_book_count',
+    ]
+
+    @classmethod
+    def get_stats(cls):
+        """ return a dictionary of statistic name -> value. The table is
+            rebuilt if any of the counters is missing.
+        """
+        stats = dict(cls.objects.filter(name__in=cls.names).values_list('name', 'value'))
+        if len(stats) != len(cls.names):
+            stats = cls.rebuild()
+        return stats
+
+    @classmethod
+    def count_all(cls):
+        """ compute every statistic from the content tables in one query
+            (a conditional aggregate per table) and return a dictionary.
+        """
+        sql = """
+            SELECT thoughts.*, ideas.*, highlights.*, books.* FROM
+                (SELECT COUNT(CASE WHEN is_draft = %%s AND is_trash = %%s THEN 1 END),
+                        COUNT(CASE WHEN is_draft = %%s AND is_trash = %%s THEN 1 END),
+                        COUNT(CASE WHEN is_trash = %%s THEN 1 END)
+                    FROM %(thought)s) thoughts,
+                (SELECT COUNT(*) FROM %(idea)s) ideas,
+                (SELECT COUNT(CASE WHEN is_published = %%s THEN 1 END) FROM %(highlight)s) highlights,
+                (SELECT COUNT(CASE WHEN wishlist = %%s THEN 1 END),
+                        COUNT(CASE WHEN wishlist = %%s THEN 1 END),
+                        COUNT(*)
+                    FROM %(book)s) books
+        """ % {
+            'thought': Thought._meta.db_table,
+            'idea': Idea._meta.db_table,
+            'highlight': Highlight._meta.db_table,
+            'book': ReadingListItem._meta.db_table,
+        }
+        params = [False, False, True, False, True, True, False, True]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+
+        return dict(zip(cls.names, row))
+
+    @classmethod
+    def rebuild(cls):
+        """ recount everything and overwrite the counter table. Returns the
+            new statistics.
+        """
+        stats = cls.count_all()
+        with transaction.atomic():
+            for name, value in stats.items():
+                cls.objects.update_or_create(name=name, defaults={'value': value})
+        return stats
+
+    @classmethod
+    def adjust(cls, removed=None, added=None):
+        """ move an object between counters. 'removed' is the list of
+            statistics the object counted towards before the change and
+            'added' the list it counts towards now (either one can be empty
+            for creates and deletes).
+        """
+        deltas = {}
+        for name in removed or []:
+            deltas[name] = deltas.get(name, 0) - 1
+        for name in added or []:
+            deltas[name] = deltas.get(name, 0) + 1
+
+        for name, delta in deltas.items():
+            if not delta:
+                continue
+
+            if not cls.objects.filter(name=name).update(value=F('value') + delta):
+                # the counters were never built; counting from scratch
+                # already includes this change
+                cls.rebuild()
+                return
+
+    def __str__(self):
+        return self.__unicode__()
+
+    def __unicode__(self):
+        return "%s: %d" % (self.name, self.value)
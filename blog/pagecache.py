@@ -0,0 +1,314 @@
+""" full page cache for anonymous visitors.
+
+    Public pages are cached per path, page number and pagination cursor (the
+    'p' and 'cursor' query string parameters) for requests that don't carry
+    a session cookie. Every cached page belongs to a few invalidation groups
+    (see get_page_groups); the page key includes the current generation of
+    each of its groups, so bumping a group's generation makes every page in
+    it miss without having to know which query strings were cached.
+
+    The models call the *_changed functions below from save() and delete()
+    so only the pages showing the changed object are thrown away.
+
+    The Atom/RSS feeds (see blog.feeds) are cached the same way, for every
+    visitor since they don't depend on the session, in the 'feed' and
+    'feed:<idea slug>' groups. They carry an ETag and Last-Modified header
+    so feed readers that poll them get a 304 while nothing changed.
+"""
+import time
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe, quote_etag
+
+PAGE_CACHE_ALIAS = getattr(settings, 'PAGE_CACHE_ALIAS', 'default')
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+PAGE_KEY_PREFIX = 'pagecache:page:'
+FEED_KEY_PREFIX = 'pagecache:feed:'
+GROUP_KEY_PREFIX = 'pagecache:group:'
+
+# query string parameters that can be part of a cached page's key
+PAGE_PARAMS = ['p', 'cursor']
+
+# url names of the views that can be cached and how many thoughts
+# the thought_nav tags on a thought page show in each direction
+CACHEABLE_VIEWS = ['index', 'catalog', 'idea-page', 'thought-page', 'books', 'highlights']
+THOUGHT_NAV_NEXT = 1
+THOUGHT_NAV_PREV = 3
+
+
+def get_cache():
+    return caches[PAGE_CACHE_ALIAS]
+
+
+###############################################################################
+# page keys
+###############################################################################
+def get_page_number(request):
+    """ return the page number requested in the query string (1 if there is
+        none) or None if the query string has anything else in it, in which
+        case the page is not cached.
+    """
+    if any(k not in PAGE_PARAMS for k in request.GET.keys()):
+        return None
+
+    page = request.GET.get('p', '1')
+    if not page.isdigit() or int(page) < 1:
+        return None
+    return int(page)
+
+
+def get_page_groups(url_name, kwargs, page):
+    """ invalidation groups for a cached page. The page is thrown out when
+        any of these groups is invalidated.
+    """
+    if url_name == 'index':
+        return ['index', 'index-page:%d' % page, 'reading-list']
+    elif url_name == 'catalog':
+        return ['ideas', 'catalog']
+    elif url_name == 'idea-page':
+        # the footer lists other Ideas too
+        return ['ideas', 'idea-page:%s' % kwargs['idea_slug']]
+    elif url_name == 'thought-page':
+        return ['idea:%s' % kwargs['idea_slug'], 'thought:%s' % kwargs['thought_slug']]
+    elif url_name == 'books':
+        return ['reading-list']
+    elif url_name == 'highlights':
+        return ['highlights']
+    return []
+
+
+def get_generations(groups):
+    """ get the current generation of each group (in one cache round trip).
+        Missing generations start at the current time in milliseconds, so a
+        generation that was evicted from the cache can't come back with an
+        old value and bring stale pages back with it.
+    """
+    cache = get_cache()
+    keys = [GROUP_KEY_PREFIX + g for g in groups]
+    generations = cache.get_many(keys)
+
+    for key in keys:
+        if key not in generations:
+            cache.add(key, int(time.time() * 1000), None)
+            generations[key] = cache.get(key)
+
+    return [generations[key] for key in keys]
+
+
+def get_page_key(request):
+    """ return the cache key for this request or None if it should not be
+        served from (or stored in) the page cache.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+
+    # logged in users (or anyone with a session, e.g. pending flash
+    # messages) always get a freshly rendered page
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return None
+
+    match = getattr(request, 'resolver_match', None)
+    if not match or match.url_name not in CACHEABLE_VIEWS:
+        return None
+
+    page = get_page_number(request)
+    if page is None:
+        return None
+
+    groups = get_page_groups(match.url_name, match.kwargs, page)
+    generations = get_generations(groups)
+
+    raw_key = "%s?p=%d&cursor=%s|%s" % (request.path, page, request.GET.get('cursor', ''), ":".join(str(g) for g in generations))
+    return PAGE_KEY_PREFIX + hashlib.md5(raw_key.encode('utf-8')).hexdigest()
+
+
+def cache_anonymous_page(view):
+    """ view decorator that serves the page from the page cache for
+        anonymous visitors and stores rendered pages for the next one
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = get_page_key(request)
+        if not key:
+            return view(request, *args, **kwargs)
+
+        cache = get_cache()
+        response = cache.get(key)
+        if response is not None:
+            return response
+
+        response = view(request, *args, **kwargs)
+
+        # don't store redirects, errors, or anything that hands out a cookie
+        if response.status_code == 200 and not response.streaming and not response.cookies \
+                and not request.META.get('CSRF_COOKIE_USED'):
+            cache.set(key, response, PAGE_CACHE_TIMEOUT)
+        return response
+    return wrapper
+
+
+def get_feed_key(request, groups):
+    """ cache key for a feed. The absolute url is part of it because the
+        feed's links are built from the host it was requested on.
+    """
+    generations = get_generations(groups)
+    raw_key = "%s|%s" % (request.build_absolute_uri(request.path), ":".join(str(g) for g in generations))
+    return FEED_KEY_PREFIX + hashlib.md5(raw_key.encode('utf-8')).hexdigest()
+
+
+def cache_feed(feed):
+    """ view decorator for a syndication Feed: serves it from the cache and
+        answers If-None-Match and If-Modified-Since with a 304. The ETag is
+        a hash of the XML (a feed that was thrown out and rebuilt the same
+        keeps it), Last-Modified is the newest item's date_edited.
+    """
+    @wraps(feed)
+    def wrapper(request, idea_slug=None):
+        groups = ['feed:%s' % idea_slug] if idea_slug else ['feed']
+        key = get_feed_key(request, groups)
+
+        cache = get_cache()
+        response = cache.get(key)
+        if response is None:
+            response = feed(request, idea_slug=idea_slug) if idea_slug else feed(request)
+            response['ETag'] = quote_etag(hashlib.md5(response.content).hexdigest())
+            cache.set(key, response, PAGE_CACHE_TIMEOUT)
+
+        last_modified = parse_http_date_safe(response.get('Last-Modified', ''))
+        return get_conditional_response(request, etag=response['ETag'], last_modified=last_modified,
+                                        response=response)
+    return wrapper
+
+
+###############################################################################
+# invalidation
+###############################################################################
+def invalidate(*groups):
+    """ throw out every cached page in the given groups
+    """
+    cache = get_cache()
+    for group in set(groups):
+        key = GROUP_KEY_PREFIX + group
+        try:
+            cache.incr(key)
+        except ValueError:
+            # no pages were cached with this group yet
+            pass
+
+
+def is_public_thought(thought):
+    return thought is not None and not thought.is_draft and not thought.is_trash
+
+
+def get_thought_nav_slugs(thought):
+    """ slugs of the published thoughts whose thought_nav lists this thought
+        (the ones shortly after it and shortly before it in the same Idea)
+    """
+    thoughts = type(thought).objects.filter(idea=thought.idea_id, is_draft=False, is_trash=False)
+
+    after = thoughts.filter(date_published__gt=thought.date_published)\
+        .order_by('date_published').values_list('slug', flat=True)[:THOUGHT_NAV_PREV]
+    before = thoughts.filter(date_published__lt=thought.date_published)\
+        .order_by('-date_published').values_list('slug', flat=True)[:THOUGHT_NAV_NEXT]
+    return list(after) + list(before)
+
+
+def get_index_page(thought):
+    """ page of the front page that shows this (published) thought. Returns
+        None for the latest thought, which is in the showcase on every page.
+    """
+    from blog import lib
+
+    position = type(thought).objects.filter(
+        is_draft=False,
+        is_trash=False,
+        date_published__gt=thought.date_published,
+    ).count()
+
+    if position == 0:
+        return None
+    return (position - 1) // lib.PAGINATION_FRONT_PER_PAGE + 1
+
+
+def thought_changed(thought, original=None, deleted=False):
+    """ invalidate the pages showing a Thought after it was saved or deleted.
+        'original' is the Thought as it was before the save (None for new
+        Thoughts).
+    """
+    is_public = not deleted and is_public_thought(thought)
+    was_public = is_public_thought(original)
+
+    if not is_public and not was_public:
+        # drafts and trash are never served from the cache
+        return
+
+    groups = ['catalog', 'thought:%s' % thought.slug, 'idea-page:%s' % thought.idea_id,
+              'feed', 'feed:%s' % thought.idea_id]
+
+    for t in [t for t in (thought, original) if is_public_thought(t)]:
+        groups += ['thought:%s' % slug for slug in get_thought_nav_slugs(t)]
+
+    if original and original.idea_id != thought.idea_id:
+        groups += ['idea-page:%s' % original.idea_id, 'feed:%s' % original.idea_id]
+
+    # an edit that leaves the thought where it was only changes its own page
+    # of the front page; anything else shifts the thoughts after it too
+    index_page = None
+    if is_public and was_public and original.date_published == thought.date_published:
+        index_page = get_index_page(thought)
+
+    if index_page:
+        groups.append('index-page:%d' % index_page)
+    else:
+        groups.append('index')
+
+    invalidate(*groups)
+
+
+def thoughts_changed(originals, thoughts=None):
+    """ invalidate the pages showing several Thoughts after a bulk update
+        (see blog.bulk). 'originals' are the Thoughts as they were before the
+        update and 'thoughts' as they are now (None if they were deleted).
+
+        Finding the thought_nav neighbours of every Thought would take a few
+        queries each, so every thought page of the Ideas involved is thrown
+        out instead.
+    """
+    groups = []
+    for t in list(originals) + list(thoughts or []):
+        if is_public_thought(t):
+            groups += ['thought:%s' % t.slug, 'idea:%s' % t.idea_id, 'idea-page:%s' % t.idea_id,
+                       'feed:%s' % t.idea_id]
+
+    if groups:
+        invalidate('index', 'catalog', 'feed', *groups)
+
+
+def idea_changed(idea):
+    """ invalidate the pages showing an Idea after it was saved or deleted
+    """
+    invalidate('ideas', 'idea:%s' % idea.slug, 'index', 'feed', 'feed:%s' % idea.slug)
+
+
+def ideas_reordered():
+    """ invalidate the pages listing Ideas after their order changed
+    """
+    invalidate('ideas', 'index')
+
+
+def highlight_changed(highlight):
+    """ invalidate the pages showing Highlights
+    """
+    invalidate('index', 'highlights')
+
+
+def reading_list_changed(item):
+    """ invalidate the pages showing the reading list (the books page and
+        the recently read sidebar)
+    """
+    invalidate('reading-list')
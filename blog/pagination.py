@@ -0,0 +1,306 @@
+""" keyset (seek) pagination for the list views.
+
+    Instead of OFFSET, a page is found by seeking past the sort key of a row
+    on the page it was linked from, e.g. for ('-date_published', '-slug'):
+
+        WHERE date_published < %s OR (date_published = %s AND slug < %s)
+        ORDER BY date_published DESC, slug DESC LIMIT 11
+
+    which stays an index range scan at any depth. The links in the
+    pagination widget carry that key as a cursor (the 'cursor' query string
+    parameter) next to the page number; a bare page number (an old link, or
+    one typed in) still works through a plain OFFSET query.
+
+    The page count for the widget comes from a COUNT(*) that is cached until
+    a row of the model is saved or deleted, so it is run once per change
+    instead of twice per request.
+"""
+import json
+import base64
+import hashlib
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.db.models.signals import post_save
+
+from blog import pagecache
+
+CURSOR_PARAM = 'cursor'
+CURSOR_LAST = 'last'
+
+COUNT_CACHE_TIMEOUT = getattr(settings, 'PAGINATION_COUNT_TIMEOUT', 60 * 60)
+COUNT_KEY_PREFIX = 'pagination:count:'
+
+# the models whose lists are paginated (their counts are cached)
+PAGINATED_MODELS = ['blog.Idea', 'blog.Thought', 'blog.Highlight', 'blog.ReadingListItem', 'blog.Task', 'blog.Note',
+                    'blog.Activity']
+
+
+###############################################################################
+# cursors
+###############################################################################
+def encode_cursor(direction, number, key):
+    """ cursor pointing 'a'fter or 'b'efore the row with the given sort key,
+        which is on page 'number'
+    """
+    values = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in key])
+    values = base64.urlsafe_b64encode(values.encode('utf-8')).decode('ascii')
+
+    # no '=' padding; url_qs splits query string parameters on '='
+    return "%s%d.%s" % (direction, number, values.rstrip('='))
+
+
+def decode_cursor(cursor, fields):
+    """ return (direction, page number, sort key) for a cursor made by
+        encode_cursor or None if it can't be used
+    """
+    try:
+        head, values = cursor.split('.', 1)
+        direction, number = head[0], int(head[1:])
+        values += '=' * (-len(values) % 4)
+        values = json.loads(base64.urlsafe_b64decode(values.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, IndexError):
+        return None
+
+    if direction not in ('a', 'b') or len(values) != len(fields):
+        return None
+
+    try:
+        key = [field.to_python(value) for field, value in zip(fields, values)]
+    except Exception:
+        return None
+    return direction, number, key
+
+
+###############################################################################
+# cached counts
+###############################################################################
+def get_table_group(model):
+    return 'table:%s' % model._meta.db_table
+
+
+def tables_changed(*models):
+    """ throw out the cached counts for the tables of the given models.
+        Deletes call this themselves (the models' delete methods and
+        blog.bulk): a post_delete receiver would make QuerySet.delete() load
+        and signal every row instead of deleting them in one statement (see
+        Collector.can_fast_delete).
+    """
+    pagecache.invalidate(*[get_table_group(model) for model in models])
+
+
+def table_changed(sender, **kwargs):
+    """ post_save handler; throw out the cached counts for a table when one
+        of its rows is saved
+    """
+    tables_changed(sender)
+
+
+for model in PAGINATED_MODELS:
+    post_save.connect(table_changed, sender=model, dispatch_uid='blog.pagination.table_changed.%s' % model)
+
+
+def cached_count(queryset):
+    """ COUNT(*) of the queryset, cached until its table changes
+    """
+    generation = pagecache.get_generations([get_table_group(queryset.model)])[0]
+    sql, params = queryset.query.sql_with_params()
+    raw_key = "%s|%s|%s" % (sql, params, generation)
+    key = COUNT_KEY_PREFIX + hashlib.md5(raw_key.encode('utf-8')).hexdigest()
+
+    cache = caches[pagecache.PAGE_CACHE_ALIAS]
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+###############################################################################
+# paginator
+###############################################################################
+class KeysetPage(Sequence):
+    """ one page of a KeysetPaginator. Behaves like django's Page for the
+        templates (iteration, len, has_next, ...)
+    """
+    def __init__(self, object_list, number, paginator, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+
+    def __repr__(self):
+        return '<Page %s of %s>' % (self.number, self.paginator.num_pages)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        return self.number + 1 if self.has_next() else None
+
+    def previous_page_number(self):
+        return self.number - 1 if self.has_previous() else None
+
+    def get_cursor(self, number):
+        """ cursor for a link from this page to page 'number'. Pages after
+            this one seek past its last row, pages before it seek back from
+            its first row, and the last page is read from the end.
+        """
+        if number == 1 or number == self.number or not self.object_list:
+            return None
+
+        if number == self.paginator.num_pages and number != self.number + 1:
+            return CURSOR_LAST
+        elif number > self.number:
+            return encode_cursor('a', self.number, self.paginator.get_key(self.object_list[-1]))
+        return encode_cursor('b', self.number, self.paginator.get_key(self.object_list[0]))
+
+
+class KeysetPaginator(object):
+    """ paginate a queryset on 'ordering', a list of field names (with '-'
+        for descending) that must end in a unique field so every row has a
+        distinct sort key, e.g. ['-date_published', '-slug'].
+    """
+    def __init__(self, queryset, per_page, ordering):
+        self.per_page = per_page
+        self.ordering = ordering
+        self.queryset = queryset.order_by(*ordering)
+
+        opts = queryset.model._meta
+        self.field_names = [name.lstrip('-') for name in ordering]
+        self.fields = [opts.pk if name == 'pk' else opts.get_field(name) for name in self.field_names]
+        self._count = None
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = cached_count(self.queryset)
+        return self._count
+
+    @property
+    def num_pages(self):
+        return max(1, (self.count + self.per_page - 1) // self.per_page)
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def get_key(self, obj):
+        return [getattr(obj, field.attname) for field in self.fields]
+
+    def seek(self, key, after=True):
+        """ queryset of the rows after (or before) the row with sort key 'key'
+            in the paginator ordering
+        """
+        condition = Q()
+        for idx, name in enumerate(self.ordering):
+            descending = name.startswith('-')
+            lookup = 'lt' if descending == after else 'gt'
+
+            term = Q(**{'%s__%s' % (self.field_names[idx], lookup): key[idx]})
+            for prev in range(idx):
+                term &= Q(**{self.field_names[prev]: key[prev]})
+            condition |= term
+
+        queryset = self.queryset.filter(condition)
+        if not after:
+            queryset = queryset.reverse()
+        return queryset
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return 1
+        return min(max(number, 1), self.num_pages)
+
+    def page(self, number, cursor=None):
+        """ return page 'number' (a KeysetPage). 'cursor' is the value a
+            pagination link was generated with (see KeysetPage.get_cursor)
+        """
+        number = self.validate_number(number)
+        rows = None
+
+        if number > 1 and cursor == CURSOR_LAST and number == self.num_pages:
+            size = self.count - (number - 1) * self.per_page
+            rows = list(self.queryset.reverse()[:size])[::-1]
+            has_next = False
+        elif number > 1 and cursor:
+            rows, has_next = self.page_from_cursor(number, decode_cursor(cursor, self.fields))
+
+        if not rows:
+            # no cursor (or a stale one); fall back to OFFSET
+            offset = (number - 1) * self.per_page
+            rows = list(self.queryset[offset:offset + self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+
+        return KeysetPage(rows, number, self, has_next)
+
+    def page_from_cursor(self, number, cursor):
+        if not cursor:
+            return None, False
+
+        direction, anchor_number, key = cursor
+        if direction == 'a' and number > anchor_number:
+            offset = (number - anchor_number - 1) * self.per_page
+            rows = list(self.seek(key, after=True)[offset:offset + self.per_page + 1])
+            return rows[:self.per_page], len(rows) > self.per_page
+        elif direction == 'b' and number < anchor_number:
+            offset = (anchor_number - number - 1) * self.per_page
+            rows = list(self.seek(key, after=False)[offset:offset + self.per_page])[::-1]
+            return rows, True
+        return None, False
+
+
+def paginate(queryset, request, per_page, ordering, page_lead=0):
+    """ paginate a queryset for a list view. Reads the page number ('p') and
+        cursor ('cursor') from the request and returns the paginator, the
+        page of items and the pagination dict for template_pagination.html:
+
+        {
+          'first': [page number]
+          'last': [page number]
+          'next': [page number]
+          'prev': [page number]
+          'current': [page number]
+          'pages': [list of page numbers]
+          'page': [the page, for building page links with cursors]
+        }
+    """
+    paginator = KeysetPaginator(queryset, per_page, ordering)
+    page = paginator.page(request.GET.get('p'), request.GET.get(CURSOR_PARAM))
+
+    pagination = {
+        'first': 1,
+        'last': paginator.num_pages,
+        'current': page.number,
+        'next': page.next_page_number(),
+        'prev': page.previous_page_number(),
+        'page': page,
+    }
+
+    if page_lead > 0:
+        lower_pages = range(max(page.number - page_lead, 1), page.number)
+        upper_pages = range(page.number + 1, min(page.number + page_lead + 1, paginator.num_pages + 1))
+    else:
+        lower_pages = []
+        upper_pages = []
+
+    pagination['pages'] = [i for j in (lower_pages, [page.number], upper_pages) for i in j]
+
+    return paginator, page, pagination
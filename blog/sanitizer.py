@@ -0,0 +1,224 @@
+""" html sanitizer for user content (Thought content, Idea and Highlight
+    descriptions, Notes).
+
+    lxml's Cleaner objects only hold configuration, so one instance per set
+    of allowed tags is built the first time it is needed and reused after
+    that. Sanitizing parses the html once; the whitelist, truncation, tag
+    balancing and "(Read More)" link all work on the same element tree,
+    which is serialized once at the end.
+"""
+import threading
+
+import lxml.html
+from lxml import etree
+from lxml.html.clean import Cleaner
+
+from django.utils.text import Truncator
+
+READ_MORE_TEXT = '(Read More)'
+
+# tags get_text puts spaces around
+TEXT_BLOCK_TAGS = [
+    'p', 'div', 'br', 'hr', 'li', 'ul', 'ol', 'blockquote', 'pre', 'table', 'tr', 'td', 'th',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+]
+
+# attributes get_media_urls looks at
+MEDIA_URL_ATTRS = ['src', 'href', 'poster']
+
+_cleaners = {}
+_cleaners_lock = threading.Lock()
+
+# strip_tags and get_text only read the text, so their cleaner leaves the
+# markup in place and only kills the elements whose content isn't text
+# (scripts, style sheets, comments, form controls, ...). That gives the same
+# text as whitelisting no tags at all without unwrapping every element, and
+# skips the attribute pass that only matters for html that gets served.
+TEXT_CLEANER = Cleaner(
+    page_structure=True,
+    links=True,
+    style=True,
+    safe_attrs_only=False,
+    remove_unknown_tags=False,
+)
+
+
+def get_cleaner(allowed_tags, page_structure=False):
+    """ return a Cleaner that whitelists 'allowed_tags'. Cleaners are cached
+        by their (unordered) tag set, so the lists on each model share one
+        instance per process.
+    """
+    key = (frozenset(allowed_tags or ()), page_structure)
+
+    cleaner = _cleaners.get(key)
+    if cleaner is None:
+        with _cleaners_lock:
+            cleaner = _cleaners.get(key)
+            if cleaner is None:
+                cleaner = Cleaner(
+                    page_structure=page_structure,
+                    links=True,
+                    safe_attrs_only=True,
+                    remove_unknown_tags=False,
+                    allow_tags=list(allowed_tags or ()),
+                )
+                _cleaners[key] = cleaner
+    return cleaner
+
+
+def parse(content, cleaner):
+    """ parse an html string and run it through the given cleaner. Returns
+        the root element of the sanitized tree or None if there is nothing
+        to parse.
+    """
+    if not content:
+        return None
+
+    try:
+        root = lxml.html.fromstring(content)
+    except etree.ParserError:
+        # whitespace only, or nothing lxml recognizes as a document
+        return None
+
+    cleaner(root)
+    return root
+
+
+def text_length(root):
+    """ number of text characters in the tree (markup is not counted)
+    """
+    return sum(len(text) for text in root.itertext())
+
+
+def truncate_tree(el, keep, ellipsis):
+    """ keep the first 'keep' text characters inside el, append the ellipsis
+        at the cut point and drop everything after it (in place). Elements
+        that were open at the cut point stay in the tree, so they get their
+        closing tags when the tree is serialized.
+
+        Returns the number of characters that may still be kept after el, or
+        None once the cut has been made.
+    """
+    if el.text:
+        if len(el.text) >= keep:
+            el.text = el.text[:keep] + ellipsis
+            del el[:]
+            return None
+        keep -= len(el.text)
+
+    for idx, child in enumerate(el):
+        keep = truncate_tree(child, keep, ellipsis)
+        if keep is None:
+            child.tail = None
+            del el[idx + 1:]
+            return None
+
+        if child.tail:
+            if len(child.tail) >= keep:
+                child.tail = child.tail[:keep] + ellipsis
+                del el[idx + 1:]
+                return None
+            keep -= len(child.tail)
+
+    return keep
+
+
+def append_link(root, full_link):
+    """ add a "(Read More)" link pointing at full_link to the end of the last
+        paragraph (or to the end of the content if there are no paragraphs)
+    """
+    paragraphs = list(root.iter('p'))
+    target = paragraphs[-1] if paragraphs else root
+
+    # separate the link from the text with a non breaking space
+    if len(target):
+        target[-1].tail = (target[-1].tail or '') + u'\xa0'
+    else:
+        target.text = (target.text or '') + u'\xa0'
+
+    link = etree.SubElement(target, 'a', href=full_link)
+    link.text = READ_MORE_TEXT
+
+
+def sanitize(content, allowed_tags, max_length=None, full_link=None):
+    """ whitelist the tags in content, truncate the text to max_length
+        characters (counting the ellipsis, like django's truncatechars_html)
+        and optionally append a "(Read More)" link to full_link.
+
+        Returns an html string.
+    """
+    root = parse(content, get_cleaner(allowed_tags))
+    if root is None:
+        return ''
+
+    if max_length is not None and text_length(root) > max_length:
+        ellipsis = Truncator('').add_truncation_text('')
+        keep = max_length - len(ellipsis)
+
+        if keep <= 0:
+            root.text = ellipsis
+            root.tail = None
+            del root[:]
+        else:
+            truncate_tree(root, keep, ellipsis)
+
+    if full_link:
+        append_link(root, full_link)
+
+    return lxml.html.tostring(root, encoding='unicode')
+
+
+def strip_tags(unsafe_html):
+    """ return only the text in unsafe_html. Script and style content is
+        removed along with all of the markup.
+    """
+    root = parse(unsafe_html, TEXT_CLEANER)
+    if root is None:
+        return ''
+    return root.text_content()
+
+
+def get_text(unsafe_html):
+    """ the text in unsafe_html with a space wherever a block element or
+        line break separated it (strip_tags runs "<p>a</p><p>b</p>" together
+        into "ab"), whitespace collapsed. Script and style content is
+        removed.
+    """
+    root = parse(unsafe_html, TEXT_CLEANER)
+    if root is None:
+        return ''
+
+    for el in root.iter(*TEXT_BLOCK_TAGS):
+        el.text = " " + (el.text or "")
+        el.tail = " " + (el.tail or "")
+    return " ".join(root.text_content().split())
+
+
+def get_image_srcs(content):
+    """ the src of every img tag in an html string, in document order. The
+        tree isn't cleaned first; nothing from it is ever output.
+    """
+    if not content:
+        return []
+
+    try:
+        root = lxml.html.fromstring(content)
+    except etree.ParserError:
+        return []
+    return [img.get('src') for img in root.iter('img') if img.get('src')]
+
+
+def get_media_urls(content, skip_tags=()):
+    """ every url an html string links to or embeds (the src, href and
+        poster attributes), in document order. Elements whose tag is in
+        skip_tags are left out.
+    """
+    if not content:
+        return []
+
+    try:
+        root = lxml.html.fromstring(content)
+    except etree.ParserError:
+        return []
+    return [el.get(attr) for el in root.iter() if el.tag not in skip_tags
+            for attr in MEDIA_URL_ATTRS if el.get(attr)]
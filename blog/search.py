@@ -0,0 +1,192 @@
+""" full text search over Thoughts, Notes and Ideas.
+
+    The text is kept in SearchEntry (see blog.models), which the database
+    indexes itself: Postgres with a weighted tsvector column and a GIN
+    index, SQLite with an FTS5 table (see migration 0044). This module runs
+    the ranked query for whichever one the site is on and turns the hits
+    into SearchResults with a highlighted snippet of the matching text.
+
+    Titles weigh more than the body on both backends. Postgres ranks with
+    ts_rank and cuts snippets with ts_headline, SQLite uses bm25 and
+    snippet(). The snippets come back from the database with control
+    characters around the matches, which are swapped for <mark> tags once
+    the text has been escaped.
+"""
+import re
+
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from blog.models import SearchEntry
+
+SEARCH_RESULTS_PER_PAGE = 10
+SEARCH_PAGES_TO_LEAD = 2
+
+# snippet length in words
+SEARCH_SNIPPET_WORDS = 30
+
+# marks around matches in snippets (SearchEntry.get_text keeps them out of
+# the indexed text)
+MATCH_START = '\x02'
+MATCH_STOP = '\x03'
+ELLIPSIS = '…'
+
+
+###############################################################################
+# backends
+###############################################################################
+def get_fts_query(query):
+    """ FTS5 query that needs every word of the search (each quoted, so
+        nothing the visitor types is FTS5 syntax)
+    """
+    return " ".join('"%s"' % w for w in re.findall(r'\w+', query))
+
+
+def search_sqlite(cursor, query, public_only, limit, offset):
+    fts_query = get_fts_query(query)
+    if not fts_query:
+        return 0, []
+
+    where = "blog_searchentry_fts MATCH %s" + (" AND e.is_public" if public_only else "")
+
+    cursor.execute(
+        "SELECT count(*) FROM blog_searchentry_fts JOIN blog_searchentry e ON e.id = blog_searchentry_fts.rowid "
+        "WHERE " + where,
+        [fts_query],
+    )
+    total = cursor.fetchone()[0]
+
+    cursor.execute(
+        "SELECT e.id, snippet(blog_searchentry_fts, 1, %s, %s, %s, %s) "
+        "FROM blog_searchentry_fts JOIN blog_searchentry e ON e.id = blog_searchentry_fts.rowid "
+        "WHERE " + where + " "
+        "ORDER BY bm25(blog_searchentry_fts, 5.0, 1.0) "
+        "LIMIT %s OFFSET %s",
+        [MATCH_START, MATCH_STOP, ELLIPSIS, SEARCH_SNIPPET_WORDS, fts_query, limit, offset],
+    )
+    return total, cursor.fetchall()
+
+
+def search_postgresql(cursor, query, public_only, limit, offset):
+    where = "e.document @@ plainto_tsquery('pg_catalog.english', %s)" + (" AND e.is_public" if public_only else "")
+
+    cursor.execute("SELECT count(*) FROM blog_searchentry e WHERE " + where, [query])
+    total = cursor.fetchone()[0]
+
+    # snippets are only cut for the page of results
+    options = "StartSel=%s, StopSel=%s, MaxWords=%d, MinWords=%d, MaxFragments=2, FragmentDelimiter=\" %s \"" % (
+        MATCH_START, MATCH_STOP, SEARCH_SNIPPET_WORDS, SEARCH_SNIPPET_WORDS // 2, ELLIPSIS,
+    )
+    cursor.execute(
+        "SELECT hit.id, ts_headline('pg_catalog.english', hit.body, plainto_tsquery('pg_catalog.english', %s), %s) "
+        "FROM ("
+        "    SELECT e.id, e.body, ts_rank(e.document, plainto_tsquery('pg_catalog.english', %s)) AS rank "
+        "    FROM blog_searchentry e WHERE " + where + " "
+        "    ORDER BY rank DESC, e.id "
+        "    LIMIT %s OFFSET %s"
+        ") hit ORDER BY hit.rank DESC, hit.id",
+        [query, options, query, query, limit, offset],
+    )
+    return total, cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': search_sqlite,
+    'postgresql': search_postgresql,
+}
+
+
+###############################################################################
+# results
+###############################################################################
+def format_snippet(snippet):
+    """ escape a snippet from the database and highlight its matches
+    """
+    html = escape(snippet or '').replace(MATCH_START, '<mark>').replace(MATCH_STOP, '</mark>')
+    return mark_safe(html)
+
+
+class SearchResult(object):
+    """ one hit: the Thought, Note or Idea ('kind' says which), its title,
+        the highlighted snippet, and where to read it on the site and to
+        edit it on the dashboard
+    """
+    def __init__(self, entry, snippet):
+        self.entry = entry
+        self.object = entry.get_object()
+        self.kind = type(self.object).__name__
+        self.title = entry.title
+        self.snippet = format_snippet(snippet)
+
+    @property
+    def url(self):
+        """ public page (Notes have none)
+        """
+        if self.kind == 'Thought':
+            return self.object.get_absolute_url()
+        elif self.kind == 'Idea':
+            return reverse('idea-page', kwargs={'idea_slug': self.object.slug})
+        return None
+
+    @property
+    def dashboard_url(self):
+        if self.kind == 'Thought':
+            return reverse('dashboard-author') + "?id=" + self.object.slug
+        elif self.kind == 'Idea':
+            return reverse('dashboard-ideas') + "?id=" + self.object.slug
+        return reverse('dashboard-notes') + "?id=" + str(self.object.id)
+
+
+def search(query, public_only=True, limit=SEARCH_RESULTS_PER_PAGE, offset=0):
+    """ run a search. Returns the total number of hits and the SearchResults
+        from offset to offset + limit, best first. With public_only, drafts,
+        trash and Notes are left out.
+    """
+    query = query.strip()
+    if not query:
+        return 0, []
+
+    with connection.cursor() as cursor:
+        total, hits = BACKENDS[connection.vendor](cursor, query, public_only, limit, offset)
+
+    entries = SearchEntry.objects.select_related('thought__idea', 'note', 'idea').in_bulk([h[0] for h in hits])
+    return total, [SearchResult(entries[entry_id], snippet) for entry_id, snippet in hits if entry_id in entries]
+
+
+def search_page(request, public_only=True):
+    """ search for the 'q' query string parameter of a request and return
+        the query, the paginator, the results on the page requested by 'p'
+        and the pagination dict for template_pagination.html (the page
+        number kind; see blog.pagination)
+    """
+    query = request.GET.get('q', '').strip()
+
+    number = request.GET.get('p', 1)
+    try:
+        number = max(int(number), 1)
+    except ValueError:
+        number = 1
+
+    offset = (number - 1) * SEARCH_RESULTS_PER_PAGE
+    total, results = search(query, public_only, SEARCH_RESULTS_PER_PAGE, offset)
+
+    # the hits are already sliced; the paginator only does the page math
+    paginator = Paginator(range(total), SEARCH_RESULTS_PER_PAGE)
+    try:
+        page = paginator.page(number)
+    except (EmptyPage, PageNotAnInteger):
+        page = paginator.page(paginator.num_pages)
+
+    pagination = {
+        'first': 1,
+        'last': paginator.num_pages,
+        'current': page.number,
+        'next': page.next_page_number() if page.has_next() else None,
+        'prev': page.previous_page_number() if page.has_previous() else None,
+        'pages': list(range(max(page.number - SEARCH_PAGES_TO_LEAD, 1),
+                            min(page.number + SEARCH_PAGES_TO_LEAD, paginator.num_pages) + 1)),
+    }
+    return query, paginator, results, pagination
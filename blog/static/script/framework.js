@@ -284,7 +284,7 @@ function tinymce_snapshot(editor) {
 }
 
 // closure containing function handler for file upload management
-tinymceFileBrowser = function (upload_url, filename_url) {
+tinymceFileBrowser = function (upload_url) {
   return function (field_name, url, type, win) {
     // remember tinymce elements to place url into
     var lfieldname = field_name;
@@ -297,37 +297,26 @@ tinymceFileBrowser = function (upload_url, filename_url) {
     file_upload.style.display = "none";
     file_upload.click();  // open os dialog window
 
-    // add event listener to "ok" button on file browser window to do actual upload
-    $('button:contains("Ok")').click({ file_upload: file_upload }, function (event) {
+    // upload the file as soon as it is picked and fill out the url. The
+    // server names the file after its contents, so the url comes back
+    // with the upload response
+    $(file_upload).change({ file_upload: file_upload }, function (event) {
+      var file = event.data.file_upload.files[0];
       var formData = new FormData();
-      formData.append('file_upload', event.data.file_upload.files[0]);
+      formData.append('file_upload', file);
       formData.append('csrfmiddlewaretoken', $('input[name="csrfmiddlewaretoken"]').val());
 
       $.ajax({
         url: upload_url,
-        async: false,
         method: "post",
         data: formData,
         contentType: false,
         processData: false,
         success: function (data) {
+          lwin.document.getElementById(lfieldname).value = get_absolute_url(data[file.name]);
         },
         error: function (data) {
-          add_flash_message(JSON.stringify(data), 'error', false);
-        },
-      });
-    });
-
-    // fill out url
-    $(file_upload).change({ file_upload: file_upload }, function () {
-      $.ajax({
-        url: filename_url + encodeURIComponent(file_upload.value),
-        method: "get",
-        success: function (filename) {
-          lwin.document.getElementById(lfieldname).value = get_absolute_url(filename);
-        },
-        error: function () {
-          add_flash_message('Invalid image filename...', 'error', true);
+          add_flash_message(JSON.stringify(data.responseJSON || data), 'error', false);
         },
       });
     });
@@ -343,7 +332,6 @@ function initialize_tinymce(params) {
     clear_button_id: params.clear_button_id || 'button-clear',
     revert_button_id: params.revert_button_id || 'button-revert',
     upload_url: $('#id_upload_url').val() || '/api/upload/',
-    filename_url: $('#id_filename_url').val() || '/api/generate_upload_filename/full/',
   }
 
   var default_mce_params = {
@@ -368,7 +356,7 @@ function initialize_tinymce(params) {
                                 'removeformat styleselect formatselect fontselect fontsizeselect preview code'],
     setup: params.setup || tinymce_snapshot,
     file_browser_callback: params.file_browser_callback ||
-      tinymceFileBrowser(default_params.upload_url, default_params.filename_url),
+      tinymceFileBrowser(default_params.upload_url),
   };
 
   // initialize editor window
@@ -1,17 +1,34 @@
 from __future__ import absolute_import, unicode_literals
 from celery import shared_task
+from celery.utils.log import get_task_logger
 
 import datetime
 
+from boto.exception import BotoClientError, BotoServerError
+from django.apps import apps
+
+from blog import bulk, lib, media
 from blog.models import Highlight
 
+# how many times a failed image resize is retried and how long to wait
+# before the first retry (in seconds, doubled on every retry after that)
+IMAGE_TASK_MAX_RETRIES = 5
+IMAGE_TASK_RETRY_DELAY = 10
+
+logger = get_task_logger(__name__)
+
+
 @shared_task
 def publish_highlight(highlight_id):
-    """ Given a Highlight id, retrieve it and set is_published to true
+    """ Given a Highlight id, retrieve it and set is_published to true.
+
+        Highlights are scheduled with publish_at now (see publish_scheduled);
+        this is only kept for ETA tasks queued before that. It does nothing
+        if the Highlight was published already.
     """
 
     try:
-        instance = Highlight.objects.get(id=highlight_id)
+        instance = Highlight.objects.get(id=highlight_id, is_published=False)
 
         instance.is_published = True
         instance.date_published = datetime.datetime.now()
@@ -19,3 +36,74 @@ def publish_highlight(highlight_id):
 
     except Highlight.DoesNotExist:
         pass
+
+
+@shared_task
+def publish_scheduled():
+    """ publish the Highlights and drafts whose publish_at has passed (see
+        bulk.publish_scheduled). Runs periodically from CELERY_BEAT_SCHEDULE.
+    """
+    highlights, thoughts = bulk.publish_scheduled()
+    return highlights + thoughts
+
+
+@shared_task(bind=True, max_retries=IMAGE_TASK_MAX_RETRIES, acks_late=True)
+def process_image(self, model_name, pk, field_name, new_size):
+    """ Given a blog model name ('idea', 'thought' or 'highlight'), a primary
+        key and the name of an image field, resize the image to new_size,
+        make its narrower and WebP variants (see lib.save_image_variants),
+        clear the instance's image_pending flag (see
+        models.queue_image_resize) and hand the resized image to its
+        image_resized method.
+
+        Storage errors are retried with exponential backoff. Once the retries
+        run out, or on any other error (e.g. a decompression bomb or a file
+        PIL can't read, see lib.ImageDecodeError, which no retry would fix),
+        the error is logged, the flag is cleared anyway and the original
+        upload is left in place.
+        Nothing requeues an image that is still pending, so the flag must
+        never be left set.
+    """
+    model = apps.get_model('blog', model_name)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        # deleted before the worker got to it
+        return
+
+    filename = getattr(instance, field_name).name
+    if not filename:
+        return
+
+    # a failed image records the width it was tried at, so saving the
+    # instance again doesn't queue it again (see models.update_image_state)
+    image_widths = lib.failed_image_widths(new_size[0])
+    image = None
+    try:
+        image = lib.resize_image(filename, tuple(new_size))
+        image_widths = ",".join(str(w) for w in lib.save_image_variants(filename, image))
+    except lib.ImageDecodeError:
+        logger.exception("could not decode %s of %s %s", field_name, model_name, pk)
+    except (IOError, BotoClientError, BotoServerError) as e:
+        # reading or writing storage (PIL's decode errors, which are
+        # IOErrors too, are ImageDecodeErrors by now)
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=IMAGE_TASK_RETRY_DELAY * 2 ** self.request.retries)
+        logger.exception("giving up on resizing %s of %s %s", field_name, model_name, pk)
+    except Exception:
+        logger.exception("could not resize %s of %s %s", field_name, model_name, pk)
+
+    # a newer upload may have replaced this one in the meantime, in which
+    # case its own task clears the flag
+    model.objects.filter(pk=pk, **{field_name: filename}).update(image_pending=False, image_widths=image_widths)
+    instance.image_pending = False
+    instance.image_widths = image_widths
+    instance.image_resized(image)
+
+
+@shared_task
+def collect_orphaned_media():
+    """ delete the media files nothing refers to anymore (see blog.media).
+        Runs periodically from CELERY_BEAT_SCHEDULE.
+    """
+    orphans = media.collect_orphans()
+    return len(orphans)
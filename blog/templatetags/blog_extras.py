@@ -1,14 +1,18 @@
 from django import template
 from django.core.urlresolvers import reverse
 from django.utils.dateformat import DateFormat
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 
 from blog import lib
+from blog.pagination import CURSOR_PARAM
 from blog.models import Idea, ReadingListItem, Task, Note
 from blog.views import dashboard_stats
 
 register = template.Library()
 
+# how wide the thought_nav thumbnails are shown (for their srcset)
+THOUGHT_NAV_IMAGE_SIZES = "(max-width: 640px) 50vw, 200px"
+
 
 class TemplateTaskList(template.Node):
     def __init__(self, name='tasks', task_list_length=lib.NUM_TASK_LIST, idea=None):
@@ -24,7 +28,7 @@ class TemplateTaskList(template.Node):
             if idea:
                 tasks = tasks.filter(idea=idea)
 
-        context[self.name] = Task.reorder_child_tasks(tasks)[:self.length]
+        context[self.name] = Task.reorder_child_tasks(tasks, limit=self.length)[:self.length]
         return ''
 
 
@@ -117,7 +121,7 @@ def idea_dropdown(**kwargs):
     """
     dropdown_classes = kwargs['dropdown_classes'] if 'dropdown_classes' in kwargs else ''
     action = kwargs['action'] if 'action' in kwargs else ''
-    ideas = Idea.objects.all().order_by('order')
+    ideas = Idea.objects.all().order_by('order', 'slug')
 
     dropdown_html = format_html(
         "<ul class='dropdown{}'>",
@@ -171,16 +175,86 @@ def thought_nav(thought, **kwargs):
             list_html += format_html("<li>{}</li>", placeholder_html)
         else:
             list_html += format_html(
-                "<li><div class='nav'><a class='overlay' href='{}'></a><p>{}</p><img src='{}' /></div></li>",
-                reverse('thought-page', kwargs={'idea_slug': t.idea.slug, 'thought_slug': t.slug}),
+                "<li><div class='nav'><a class='overlay' href='{}'></a><p>{}</p>{}</div></li>",
+                reverse('thought-page', kwargs={'idea_slug': t.idea_id, 'thought_slug': t.slug}),
                 t.title,
-                t.get_preview(),
+                responsive_image(t.get_preview_image(), sizes=THOUGHT_NAV_IMAGE_SIZES),
             )
 
     list_html += format_html("</ul>")
     return list_html
 
 
+def get_image_srcsets(image):
+    """ given an image field file, return a tuple of srcset attribute values
+        (original format, WebP) listing its width variants (see
+        lib.save_image_variants). Either one is '' if there is nothing to
+        list.
+    """
+    if not image or image.instance.image_pending:
+        return '', ''
+
+    widths = lib.parse_image_widths(image.instance.image_widths)
+    if not widths:
+        return '', ''
+
+    variants = set(lib.get_variant_names(image.name, widths))
+    srcset, webp_srcset = [], []
+    for w in widths:
+        name = image.name if w == widths[-1] else lib.get_variant_name(image.name, w)
+        srcset.append("%s %dw" % (image.storage.url(name), w))
+
+        webp_name = lib.get_variant_name(name, ext='.webp')
+        if webp_name in variants:
+            webp_srcset.append("%s %dw" % (image.storage.url(webp_name), w))
+    return ", ".join(srcset), ", ".join(webp_srcset)
+
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', **kwargs):
+    """ write an <img> for an Idea icon, Thought preview or Highlight icon
+        with a srcset of its narrower variants, inside a <picture> with a
+        WebP <source> when there are WebP versions. Images that haven't been
+        processed yet get a plain <img>.
+
+        Parameters:
+        image -> image field file (e.g. thought.preview)
+        sizes -> sizes attribute, how wide the image is shown
+        kwargs -> other attributes of the img tag (class, alt, ...)
+    """
+    if not image:
+        return ''
+
+    attrs = format_html_join('', " {}='{}'", sorted(kwargs.items()))
+    srcset, webp_srcset = get_image_srcsets(image)
+
+    if not srcset:
+        return format_html("<img src='{}'{} />", image.url, attrs)
+
+    img_html = format_html("<img src='{}' srcset='{}' sizes='{}'{} />", image.url, srcset, sizes, attrs)
+    if not webp_srcset:
+        return img_html
+    return format_html(
+        "<picture><source type='image/webp' srcset='{}' sizes='{}'>{}</picture>",
+        webp_srcset, sizes, img_html
+    )
+
+
+@register.filter()
+def image_width_url(image, width):
+    """ url of the narrowest variant of an image that is at least 'width'
+        pixels wide, for places a srcset can't go (e.g. CSS backgrounds)
+    """
+    if not image:
+        return ''
+
+    widths = [] if image.instance.image_pending else lib.parse_image_widths(image.instance.image_widths)
+    for w in widths[:-1]:
+        if w >= int(width):
+            return image.storage.url(lib.get_variant_name(image.name, w))
+    return image.url
+
+
 @register.filter()
 def rev(value, args=''):
     kwargs = {}
@@ -229,9 +303,12 @@ def url_qs(context, **kwargs):
 
         params[str(key)] = str(value)
 
-    # add/replace query string parameters in kwargs
+    # add/replace query string parameters in kwargs (None removes one)
     for kwarg, value in kwargs.items():
-        params[str(kwarg)] = str(value)
+        if value is None:
+            params.pop(str(kwarg), None)
+        else:
+            params[str(kwarg)] = str(value)
 
     query_string = "&".join([k + "=" + v for k, v in params.items()])
     if query_string:
@@ -240,6 +317,17 @@ def url_qs(context, **kwargs):
     return request.path + query_string
 
 
+@register.simple_tag(takes_context=True)
+def page_url(context, pages, number):
+    """ url of page 'number' of a paginated list. 'pages' is the pagination
+        dict from pagination.paginate; the url carries the keyset cursor
+        for the page alongside the page number.
+    """
+    page = pages.get('page') if hasattr(pages, 'get') else None
+    cursor = page.get_cursor(number) if page else None
+    return url_qs(context, **{'p': number, CURSOR_PARAM: cursor})
+
+
 @register.simple_tag
 def recently_read(**kwargs):
     """ return html containing data from the recently read list
@@ -0,0 +1,78 @@
+""" a small in-process stand-in for the Google Books volumes API, for tests
+    of blog.books. A search finds the books whose title or author contain
+    every word of the query.
+
+        server = BooksServer([{'title': ..., 'author': ...}, ...])
+        server.start()
+        client = BookSearchClient(url=server.url)
+        ...
+        server.stop()
+"""
+import json
+import time
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class BooksHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        words = query.get('q', [''])[0].lower().split()
+        max_results = int(query.get('maxResults', ['10'])[0])
+
+        found = [b for b in self.server.books if all(w in (b['title'] + " " + b['author']).lower() for w in words)]
+        self.server.requests.append((query.get('q', [''])[0], self.client_address))
+        time.sleep(self.server.delay)
+
+        body = json.dumps({
+            'totalItems': len(found),
+            'items': [{
+                'volumeInfo': {
+                    'title': b['title'],
+                    'authors': [b['author']],
+                    'infoLink': 'http://books.example.com/%d' % self.server.books.index(b),
+                    'imageLinks': {'smallThumbnail': 'http://books.example.com/%d.jpg' % self.server.books.index(b)},
+                },
+            } for b in found[:max_results]],
+        }).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class BooksServer(ThreadingHTTPServer):
+    """ the stand-in server. 'requests' logs the query and client address
+        of every search; 'delay' slows every response down (in seconds).
+    """
+    def __init__(self, books):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), BooksHandler)
+        self.books = books
+        self.requests = []
+        self.delay = 0
+        self.thread = None
+
+    def handle_error(self, request, client_address):
+        # clients that timed out hang up before the response is written
+        pass
+
+    @property
+    def url(self):
+        return 'http://%s:%d/books/v1/volumes' % self.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
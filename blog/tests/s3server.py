@@ -0,0 +1,181 @@
+""" a small in-process stand-in for S3, for tests that talk to a bucket
+    through boto. It keeps objects in memory and understands just enough of
+    the S3 REST API for plain PUTs, multipart uploads, GETs, bucket listings
+    and (multi-object) deletes (path style urls, no authentication).
+
+        server = S3Server()
+        server.start()
+        bucket = server.get_bucket('media')
+        ...
+        server.stop()
+"""
+import re
+import time
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import boto
+from boto.s3.connection import OrdinaryCallingFormat
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def parse(self):
+        url = urlparse(self.path)
+        bucket, _, key = url.path.lstrip('/').partition('/')
+        query = parse_qs(url.query, keep_blank_values=True)
+        return bucket, key, query
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def respond(self, status, body=b'', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        bucket, key, query = self.parse()
+        body = self.read_body()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+
+        if 'uploadId' in query:
+            upload = self.server.uploads[query['uploadId'][0]]
+            upload['parts'][int(query['partNumber'][0])] = body
+        else:
+            self.server.objects[(bucket, key)] = {
+                'body': body,
+                'content_type': self.headers.get('Content-Type'),
+                'modified': time.time(),
+            }
+        self.server.requests.append(('PUT', key, len(body)))
+        self.respond(200, headers={'ETag': etag})
+
+    def do_POST(self):
+        bucket, key, query = self.parse()
+        body = self.read_body()
+
+        if 'uploads' in query:
+            upload_id = str(len(self.server.uploads) + 1)
+            self.server.uploads[upload_id] = {
+                'content_type': self.headers.get('Content-Type'),
+                'parts': {},
+            }
+            self.server.requests.append(('INITIATE', key, 0))
+            self.respond(200, (
+                "<InitiateMultipartUploadResult><Bucket>%s</Bucket><Key>%s</Key>"
+                "<UploadId>%s</UploadId></InitiateMultipartUploadResult>" % (bucket, key, upload_id)
+            ))
+        elif 'uploadId' in query:
+            upload = self.server.uploads.pop(query['uploadId'][0])
+            numbers = [int(n) for n in re.findall(r'<PartNumber>(\d+)</PartNumber>', body.decode('utf-8'))]
+            data = b''.join(upload['parts'][n] for n in numbers)
+
+            self.server.objects[(bucket, key)] = {'body': data, 'content_type': upload['content_type'], 'modified': time.time()}
+            self.server.requests.append(('COMPLETE', key, len(data)))
+            self.respond(200, (
+                "<CompleteMultipartUploadResult><Location>/%s/%s</Location><Bucket>%s</Bucket>"
+                "<Key>%s</Key><ETag>\"x\"</ETag></CompleteMultipartUploadResult>" % (bucket, key, bucket, key)
+            ))
+        elif 'delete' in query:
+            keys = re.findall(r'<Key>(.*?)</Key>', body.decode('utf-8'))
+            for name in keys:
+                self.server.objects.pop((bucket, name), None)
+            self.server.requests.append(('DELETE_KEYS', '', len(keys)))
+            self.respond(200, "<DeleteResult></DeleteResult>")
+        else:
+            self.respond(400)
+
+    def do_GET(self):
+        bucket, key, query = self.parse()
+        if 'uploadId' in query:
+            # list parts (boto does this to build the complete request)
+            upload = self.server.uploads[query['uploadId'][0]]
+            parts = "".join(
+                "<Part><PartNumber>%d</PartNumber><ETag>\"%s\"</ETag><Size>%d</Size></Part>"
+                % (n, hashlib.md5(body).hexdigest(), len(body)) for n, body in sorted(upload['parts'].items())
+            )
+            self.respond(200, (
+                "<ListPartsResult><Bucket>%s</Bucket><Key>%s</Key><UploadId>%s</UploadId>"
+                "<IsTruncated>false</IsTruncated>%s</ListPartsResult>" % (bucket, key, query['uploadId'][0], parts)
+            ))
+            return
+
+        if not key:
+            self.list_bucket(bucket, query.get('prefix', [''])[0])
+            return
+
+        obj = self.server.objects.get((bucket, key))
+        if obj is None:
+            self.respond(404)
+        else:
+            self.respond(200, obj['body'], {'Content-Type': obj['content_type'] or 'binary/octet-stream'})
+
+    def list_bucket(self, bucket, prefix):
+        # everything in one page, no delimiters
+        contents = "".join(
+            "<Contents><Key>%s</Key><LastModified>%s</LastModified><ETag>\"x\"</ETag>"
+            "<Size>%d</Size><StorageClass>STANDARD</StorageClass></Contents>"
+            % (key, time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(obj['modified'])), len(obj['body']))
+            for (b, key), obj in sorted(self.server.objects.items()) if b == bucket and key.startswith(prefix)
+        )
+        self.server.requests.append(('LIST', prefix, 0))
+        self.respond(200, (
+            "<ListBucketResult><Name>%s</Name><Prefix>%s</Prefix>"
+            "<IsTruncated>false</IsTruncated>%s</ListBucketResult>" % (bucket, prefix, contents)
+        ))
+
+    def do_DELETE(self):
+        bucket, key, query = self.parse()
+        if 'uploadId' in query:
+            self.server.uploads.pop(query['uploadId'][0], None)
+            self.server.requests.append(('ABORT', key, 0))
+        else:
+            self.server.objects.pop((bucket, key), None)
+        self.respond(204)
+
+
+class S3Server(ThreadingHTTPServer):
+    """ the stand-in server. 'objects' maps (bucket, key) to the stored body
+        and Content-Type and 'requests' logs what the client did.
+    """
+    def __init__(self):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), S3Handler)
+        self.objects = {}
+        self.uploads = {}
+        self.requests = []
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def get_bucket(self, name):
+        """ a boto bucket on this server
+        """
+        connection = boto.connect_s3(
+            aws_access_key_id='test',
+            aws_secret_access_key='test',
+            host=self.server_address[0],
+            port=self.server_address[1],
+            is_secure=False,
+            calling_format=OrdinaryCallingFormat(),
+        )
+        return connection.get_bucket(name, validate=False)
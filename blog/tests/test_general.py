@@ -1,10 +1,25 @@
+import os
+import shutil
+import datetime
+import tempfile
+from io import StringIO
+from unittest import mock
+
+import pytz
+from PIL import Image
+from celery.exceptions import Retry
+
 from django.db import IntegrityError
 from django.test import TestCase, Client
+from django.core.management import call_command
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 
-from blog.models import Idea, Thought
+from blog import bulk, lib, media, search, tasks
+from blog.models import Idea, Thought, ThoughtImage, Highlight, ReadingListItem, Task, Activity, Note, Statistic, SearchEntry, get_image_files
+from blog.templatetags.blog_extras import responsive_image, image_width_url
+from blog.tests.s3server import S3Server
 
 
 # Create your tests here.
@@ -64,6 +79,429 @@ class ThoughtModelTestCase(TestCase):
             self.assertEqual(e.message, "column slug is not unique")
 
 
+class ExcerptTestCase(TestCase):
+    """ the precomputed excerpt fields should be filled in on save and by
+        the backfill_excerpts management command
+    """
+    def setUp(self):
+        self.dummy_author = User.objects.create(username="Cory",
+                                                email="cparsnipson@gmail.com",
+                                                password="test")
+        self.dummy_idea = Idea.objects.create(name="Miscellaneous",
+                                              slug="miscellaneous",
+                                              description="<p>Random, <script>x</script>blog thoughts.</p>")
+
+    def test_save_fills_excerpts(self):
+        """ every excerpt field should match the truncate() call it replaces
+        """
+        thought = Thought.objects.create(
+            title="Thought 1",
+            slug="thought-1",
+            content="<p>" + "word " * 100 + "</p><img src='/media/images/a.png'>",
+            idea=self.dummy_idea,
+            author=self.dummy_author,
+        )
+
+        self.assertEqual(thought.excerpt, thought.truncate())
+        self.assertEqual(thought.excerpt_lead, thought.truncate(max_length=240))
+        self.assertEqual(thought.excerpt_link, thought.truncate(max_length=175, full_link=thought.get_absolute_url()))
+        self.assertIn("(Read More)", thought.excerpt_link)
+        self.assertNotIn("<script>", self.dummy_idea.excerpt)
+
+    def test_backfill_command(self):
+        """ rows written without going through save() get their excerpts
+            from the management command
+        """
+        Idea.objects.filter(slug=self.dummy_idea.slug).update(excerpt='', excerpt_short='')
+
+        call_command('backfill_excerpts', model=['idea'], stdout=open(os.devnull, 'w'))
+
+        idea = Idea.objects.get(slug=self.dummy_idea.slug)
+        self.assertEqual(idea.excerpt, idea.truncate())
+        self.assertEqual(idea.excerpt_short, idea.truncate(max_length=50))
+
+
+class ThoughtNavTestCase(TestCase):
+    """ unit tests for the thought_nav neighbour lookup
+    """
+    def setUp(self):
+        self.dummy_author = User.objects.create(username="Cory",
+                                                email="cparsnipson@gmail.com",
+                                                password="test")
+        self.dummy_idea = Idea.objects.create(name="Miscellaneous",
+                                              slug="misc",
+                                              description="Random, blog thoughts.")
+        other_idea = Idea.objects.create(name="Other", slug="other", description="Other thoughts.")
+
+        base = datetime.datetime(2019, 1, 1, tzinfo=pytz.utc)
+        for i in range(8):
+            Thought.objects.create(title="Thought %d" % i, slug="thought-%d" % i, content="content",
+                                   idea=other_idea if i == 4 else self.dummy_idea,
+                                   author=self.dummy_author, is_draft=(i == 2))
+            Thought.objects.filter(slug="thought-%d" % i).update(date_published=base + datetime.timedelta(days=i))
+
+    def test_neighbours(self):
+        """ neighbours skip drafts and other Ideas and are padded with None
+        """
+        thought = Thought.objects.get(slug="thought-3")
+
+        self.assertEqual([t.slug for t in thought.get_next_thoughts(num=3)], ["thought-5", "thought-6", "thought-7"])
+        self.assertEqual([t and t.slug for t in thought.get_prev_thoughts(num=3)], ["thought-1", "thought-0", None])
+
+        thought = Thought.objects.get(slug="thought-6")
+        self.assertEqual([t and t.slug for t in thought.get_next_thoughts(num=3)], ["thought-7", None, None])
+
+    def test_neighbours_single_query(self):
+        """ every thought_nav on a page shares one query, Ideas included
+        """
+        thought = Thought.objects.get(slug="thought-3")
+
+        with self.assertNumQueries(1):
+            for t in thought.get_next_thoughts(num=1) + thought.get_prev_thoughts(num=3) + \
+                    thought.get_prev_thoughts(num=1) + thought.get_next_thoughts(num=1):
+                if t:
+                    t.idea.name
+
+
+class TaskTreeTestCase(TestCase):
+    """ unit tests for loading the task tree
+    """
+    def setUp(self):
+        self.dummy_idea = Idea.objects.create(name="Miscellaneous",
+                                              slug="misc",
+                                              description="Random, blog thoughts.")
+
+        self.low = self.create_task(content="low", priority=0)
+        self.high = self.create_task(content="high", priority=2, idea=self.dummy_idea)
+        self.sub = self.create_task(content="sub", priority=1, parent_task=self.high)
+        self.sub_next = self.create_task(content="sub next", priority=3, parent_task=self.high)
+        self.subsub = self.create_task(content="subsub", parent_task=self.sub)
+
+        self.done = self.create_task(content="done", parent_task=self.sub)
+        self.done.is_completed = True
+        self.done.save()
+
+    def create_task(self, **kwargs):
+        # Task.save doesn't take the arguments objects.create passes it
+        task = Task(**kwargs)
+        task.save()
+        return task
+
+    def test_tree_order(self):
+        """ subtasks follow their parents at any depth, by priority
+        """
+        tasks = Task.reorder_child_tasks(Task.objects.filter(is_completed=False))
+
+        self.assertEqual([t.content for t in tasks], ["high", "sub next", "sub", "subsub", "low"])
+        self.assertEqual([t.depth for t in tasks], [0, 1, 1, 2, 0])
+
+        tasks = Task.reorder_child_tasks(Task.objects.all(), show_complete=True)
+        self.assertIn(self.done.id, [t.id for t in tasks])
+
+    def test_tree_queries(self):
+        """ the tree is one query (plus one for the Ideas) and templates don't
+            need any more
+        """
+        with self.assertNumQueries(2):
+            tasks = Task.reorder_child_tasks(Task.objects.filter(is_completed=False))
+
+        with self.assertNumQueries(0):
+            subtasks = [(t.has_subtasks(), t.parent_task and t.parent_task.id, str(t.idea)) for t in tasks]
+
+        self.assertEqual(subtasks[0], (True, None, "Miscellaneous"))
+        self.assertEqual(subtasks[2], (True, self.high.id, "None"))
+
+    def test_tree_limit(self):
+        """ limit cuts off top level tasks, not subtasks
+        """
+        tasks = Task.reorder_child_tasks(Task.objects.filter(is_completed=False), limit=1)
+        self.assertEqual([t.content for t in tasks], ["high", "sub next", "sub", "subsub"])
+
+
+class ActivityMessageTestCase(TestCase):
+    """ unit tests for the stored Activity messages
+    """
+    def setUp(self):
+        self.dummy_author = User.objects.create(username="Cory",
+                                                email="cparsnipson@gmail.com",
+                                                password="test")
+
+    def create_activity(self, type_string, tokens):
+        activity = Activity(author=self.dummy_author, type=Activity.get_type_id(type_string))
+        activity.store_tokens(tokens)
+        activity.save()
+        return activity
+
+    def test_message_stored_on_save(self):
+        """ the message is rendered once, when the activity is saved
+        """
+        activity = self.create_activity('Trashed Thought', {'length': 2, 'title': 'T', 'slug': 't'})
+        self.assertEqual(Activity.objects.get(id=activity.id).message,
+                         "moved 2 <span class='thought'>Thoughts</span> to the trash")
+
+        activity = self.create_activity('Changed Task Priority', {'id': 3, 'content': 'c', 'old_priority': 0, 'new_priority': 3})
+        self.assertIn("from <span class='excerpt'>Low</span> to <span class='excerpt'>Next</span>", activity.message)
+
+    def test_invalid_type(self):
+        """ types without a message raise IndexError
+        """
+        with self.assertRaises(IndexError):
+            Activity(type=Activity.get_type_id('Tweet')).generate_message()
+
+    def test_render_command(self):
+        """ the command re-renders messages that went stale
+        """
+        activity = self.create_activity('Edited Idea', {'name': 'Misc'})
+        Activity.objects.filter(id=activity.id).update(message='old wording')
+
+        call_command('render_activity_messages', stdout=open(os.devnull, 'w'))
+        self.assertEqual(Activity.objects.get(id=activity.id).message,
+                         "edited <span class='excerpt'>Idea</span> <span class='idea'>Misc</span>")
+
+
+class BulkActionTestCase(TestCase):
+    """ unit tests for the set based dashboard actions (blog.bulk)
+    """
+    def setUp(self):
+        self.dummy_author = User.objects.create(username="Cory",
+                                                email="cparsnipson@gmail.com",
+                                                password="test")
+        self.dummy_idea = Idea.objects.create(name="Miscellaneous",
+                                              slug="misc",
+                                              description="Random, blog thoughts.")
+        self.other_idea = Idea.objects.create(name="Other", slug="other", description="Other thoughts.")
+
+        self.slugs = ['thought-%d' % i for i in range(10)]
+        for slug in self.slugs:
+            Thought.objects.create(title=slug, slug=slug, content=slug,
+                                   idea=self.dummy_idea, author=self.dummy_author)
+        Statistic.get_stats()
+
+    def test_trash_query_count(self):
+        """ trashing does not take more queries for more thoughts (the
+            select, update, insert, two counters, the search index and the
+            savepoint)
+        """
+        with self.assertNumQueries(8):
+            results = bulk.trash_thoughts(self.slugs + ['missing'], self.dummy_author)
+
+        self.assertEqual([status for status, tokens in results], [True] * 10 + [False])
+        self.assertEqual(Thought.objects.filter(is_trash=True).count(), 10)
+        self.assertEqual(Activity.objects.filter(type=Activity.get_type_id('Trashed Draft')).count(), 10)
+        self.assertEqual(Statistic.get_stats(), Statistic.count_all())
+
+    def test_publish(self):
+        """ publishing with auto_update moves date_published for drafts only
+        """
+        old_date = Thought.objects.get(slug='thought-0').date_published
+        bulk.publish_thoughts(self.slugs[:2], self.dummy_author, publish=True, auto_update=True)
+
+        thought = Thought.objects.get(slug='thought-0')
+        self.assertFalse(thought.is_draft)
+        self.assertGreater(thought.date_published, old_date)
+        self.assertEqual(Statistic.get_stats()['thought_count'], 2)
+
+        activity = Activity.objects.get(tokens__contains='"thought-0"')
+        self.assertEqual(activity.message, "published <span class='excerpt'>Draft</span> <span class='draft'>thought-0</span>")
+
+    def test_move(self):
+        """ moved thoughts link to their new Idea
+        """
+        results = bulk.move_thoughts(self.slugs[:3], self.dummy_author, 'other')
+        self.assertEqual(results[0], (True, {'thought': 'thought-0', 'idea': 'Other'}))
+
+        thought = Thought.objects.get(slug='thought-0')
+        self.assertEqual(thought.idea_id, 'other')
+        self.assertIn('/other/thought-0', thought.excerpt_link)
+        self.assertEqual(Thought.objects.filter(idea='other').count(), 3)
+
+        results = bulk.move_thoughts(self.slugs[:3], self.dummy_author, 'no-such-idea')
+        self.assertFalse(any(status for status, tokens in results))
+
+    def test_delete(self):
+        """ deleting thoughts and books through the dashboard
+        """
+        ReadingListItem.objects.create(title="Book", author="Author", link="http://example.com/",
+                                       cover="http://example.com/cover.jpg")
+        book_id = ReadingListItem.objects.get().id
+        note = Note.objects.create(title="Note", content="Note content")
+
+        self.client.force_login(self.dummy_author)
+        next_url = reverse('dashboard')
+        self.client.post(reverse('dashboard-backend'), {'action': 'thought_delete', 'id': self.slugs, 'next': next_url})
+        self.client.post(reverse('dashboard-backend'), {'action': 'book_delete', 'id': [book_id], 'next': next_url})
+        self.client.post(reverse('dashboard-backend'), {'action': 'note_delete', 'id': [note.id, 'x'], 'next': next_url})
+
+        self.assertEqual(Thought.objects.count(), 0)
+        self.assertEqual(ReadingListItem.objects.count(), 0)
+        self.assertEqual(Note.objects.count(), 0)
+        self.assertEqual(Activity.objects.filter(type=Activity.get_type_id('Deleted Draft')).count(), 10)
+        self.assertEqual(Statistic.get_stats(), Statistic.count_all())
+
+    def test_publish_scheduled(self):
+        """ the sweep publishes what is due, dated when it was due, and
+            leaves the rest for later
+        """
+        now = bulk.get_now()
+        due = now - datetime.timedelta(hours=1)
+        Thought.objects.filter(slug='thought-0').update(publish_at=due)
+        Thought.objects.filter(slug='thought-1').update(publish_at=now + datetime.timedelta(days=1))
+        Thought.objects.filter(slug='thought-2').update(publish_at=due)
+        bulk.trash_thoughts(['thought-2'], self.dummy_author)
+        Highlight.objects.create(title="Due", description="d", url="http://due.com", publish_at=due)
+        Highlight.objects.create(title="Later", description="l", url="http://later.com",
+                                 publish_at=now + datetime.timedelta(days=1))
+
+        self.assertEqual(tasks.publish_scheduled(), 2)
+        self.assertEqual(bulk.publish_scheduled(), (0, 0))
+
+        thought = Thought.objects.get(slug='thought-0')
+        self.assertEqual((thought.is_draft, thought.date_published, thought.publish_at), (False, due, None))
+        self.assertEqual(Thought.objects.filter(is_draft=False).count(), 1)
+        self.assertEqual(list(Highlight.objects.filter(is_published=True).values_list('title', 'date_published')),
+                         [("Due", due)])
+        self.assertTrue(Activity.objects.filter(tokens__contains='"thought-0"',
+                                                type=Activity.get_type_id('Published Draft')).exists())
+        self.assertEqual(Statistic.get_stats(), Statistic.count_all())
+
+    def test_schedule_highlight(self):
+        """ a new Highlight waits for its turn behind the backlog instead of
+            being queued in the worker
+        """
+        Highlight.objects.create(title="Old", description="o", url="http://old.com", is_published=True)
+        Highlight.objects.create(title="Waiting", description="w", url="http://waiting.com",
+                                 publish_at=bulk.get_now() + datetime.timedelta(days=1))
+
+        self.client.force_login(self.dummy_author)
+        self.client.post(reverse('forms-highlight'), {
+            'title': "New", 'description': "n", 'url': "http://new.com", 'next': reverse('dashboard-highlights'),
+        })
+
+        highlight = Highlight.objects.get(title="New")
+        self.assertFalse(highlight.is_published)
+        self.assertGreater(highlight.publish_at, bulk.get_now() + datetime.timedelta(days=1))
+
+        bulk.publish_scheduled(highlight.publish_at)
+        self.assertTrue(Highlight.objects.get(title="New").is_published)
+
+
+class IdeaOrderTestCase(TestCase):
+    """ unit tests for the gap based Idea ordering
+    """
+    def setUp(self):
+        self.slugs = ['idea-%d' % i for i in range(5)]
+        for slug in self.slugs:
+            Idea.objects.create(name=slug, slug=slug, description=slug)
+
+    def get_slugs(self):
+        return list(Idea.objects.order_by('order', 'slug').values_list('slug', flat=True))
+
+    def test_new_ideas_leave_gaps(self):
+        """ new ideas go to the end, ORDER_GAP apart
+        """
+        orders = list(Idea.objects.order_by('order').values_list('order', flat=True))
+        self.assertEqual(orders, [Idea.ORDER_GAP * i for i in range(1, 6)])
+
+    def test_move_to(self):
+        """ moving into a gap only updates the moved idea
+        """
+        idea = Idea.objects.get(slug='idea-4')
+        with self.assertNumQueries(2):
+            idea.move_to(1)
+        self.assertEqual(self.get_slugs(), ['idea-0', 'idea-4', 'idea-1', 'idea-2', 'idea-3'])
+
+        Idea.objects.get(slug='idea-0').move_to(10)
+        Idea.objects.get(slug='idea-3').move_to(0)
+        self.assertEqual(self.get_slugs(), ['idea-3', 'idea-4', 'idea-1', 'idea-2', 'idea-0'])
+
+    def test_move_without_gap(self):
+        """ ideas are renumbered when neighbours have no room between them
+        """
+        Idea.objects.filter(slug='idea-1').update(order=Idea.ORDER_GAP + 1)
+        Idea.objects.get(slug='idea-3').move_to(1)
+
+        self.assertEqual(self.get_slugs(), ['idea-0', 'idea-3', 'idea-1', 'idea-2', 'idea-4'])
+        self.assertEqual(Idea.objects.get(slug='idea-4').order, Idea.ORDER_GAP * 5)
+
+    def test_apply_ordering(self):
+        """ a whole new ordering is one update; unlisted ideas go last
+        """
+        Idea.apply_ordering(['idea-2', 'idea-0'])
+        self.assertEqual(self.get_slugs(), ['idea-2', 'idea-0', 'idea-1', 'idea-3', 'idea-4'])
+
+        idea = Idea.objects.get(slug='idea-0')
+        self.assertEqual(idea.get_next().slug, 'idea-1')
+        self.assertEqual(idea.get_prev().slug, 'idea-2')
+        self.assertEqual(idea.get_position(), 1)
+
+    def test_ties(self):
+        """ ideas with the same order value are ordered by slug
+        """
+        Idea.objects.update(order=1)
+        idea = Idea.objects.get(slug='idea-2')
+        self.assertEqual(idea.get_next().slug, 'idea-3')
+        self.assertEqual(idea.get_prev().slug, 'idea-1')
+
+
+class StatisticTestCase(TestCase):
+    """ unit tests for the dashboard statistics counter table
+    """
+    def setUp(self):
+        self.dummy_author = User.objects.create(username="Cory",
+                                                email="cparsnipson@gmail.com",
+                                                password="test")
+        self.dummy_idea = Idea.objects.create(name="Miscellaneous",
+                                              slug="misc",
+                                              description="Random, blog thoughts.")
+
+    def create_thought(self, slug, **kwargs):
+        return Thought.objects.create(title=slug, slug=slug, content=slug,
+                                      idea=self.dummy_idea, author=self.dummy_author, **kwargs)
+
+    def test_counters_follow_saves(self):
+        """ publishing, trashing and deleting move thoughts between counters
+        """
+        thought = self.create_thought('thought-1')
+        self.create_thought('thought-2', is_draft=False)
+        ReadingListItem.objects.create(title="Book", author="Author", link="http://example.com/",
+                                       cover="http://example.com/cover.jpg", wishlist=True)
+
+        stats = Statistic.get_stats()
+        self.assertEqual(stats['idea_count'], 1)
+        self.assertEqual(stats['draft_count'], 1)
+        self.assertEqual(stats['thought_count'], 1)
+        self.assertEqual(stats['wish_book_count'], 1)
+        self.assertEqual(stats['total_book_count'], 1)
+
+        thought.is_draft = False
+        thought.save()
+        self.assertEqual(Statistic.get_stats()['thought_count'], 2)
+
+        thought.is_trash = True
+        thought.save()
+        thought.delete()
+
+        self.assertEqual(Statistic.get_stats(), Statistic.count_all())
+
+    def test_get_stats_single_query(self):
+        """ reading the stats is one query once the counters exist
+        """
+        self.create_thought('thought-1')
+        Statistic.get_stats()
+
+        with self.assertNumQueries(1):
+            Statistic.get_stats()
+
+    def test_rebuild(self):
+        """ rebuild recovers from counters that drifted
+        """
+        self.create_thought('thought-1', is_draft=False)
+        Statistic.objects.filter(name='thought_count').update(value=42)
+
+        call_command('rebuild_stats', stdout=open(os.devnull, 'w'))
+        self.assertEqual(Statistic.get_stats()['thought_count'], 1)
+
+
 class IdeaFormTestCase(TestCase):
     """ unit tests related to IdeaForm functions
     """
@@ -137,6 +575,452 @@ class IdeaViewTestCase(TestCase):
         self.assertEqual(num_ideas, Idea.objects.count())
 
 
+class ThoughtImageTestCase(TestCase):
+    """ the ThoughtImage table follows the img tags in Thought content
+    """
+    def setUp(self):
+        self.dummy_author = User.objects.create(username="Cory",
+                                                email="cparsnipson@gmail.com",
+                                                password="test")
+        self.dummy_idea = Idea.objects.create(name="Miscellaneous",
+                                              slug="misc",
+                                              description="Random, blog thoughts.")
+
+    def create_thought(self, slug, content):
+        return Thought.objects.create(title=slug, slug=slug, content=content,
+                                      idea=self.dummy_idea, author=self.dummy_author)
+
+    def get_images(self, thought):
+        return set(thought.images.values_list('filename', flat=True))
+
+    def test_save(self):
+        """ media images are recorded on save, images on other sites aren't
+        """
+        thought = self.create_thought('t', "<p><img src='/media/images/a.png'> <img src='http://x.com/media/b.png'></p>"
+                                           "<img src='/media/images/a.png'><img src='/media/images/c%20d.png'>")
+        self.assertEqual(self.get_images(thought), {'images/a.png', 'images/c d.png'})
+
+        thought.content = "<img src='/media/images/c%20d.png'><img src='/media/images/e.png'>"
+        thought.save()
+        self.assertEqual(self.get_images(thought), {'images/c d.png', 'images/e.png'})
+
+        # saving without touching the content doesn't look at the images
+        thought.title = "new title"
+        with mock.patch.object(Thought, 'update_image_references') as update:
+            thought.save()
+        self.assertFalse(update.called)
+
+    def test_delete(self):
+        """ deleting Thoughts drops their rows but leaves the files to
+            blog.media
+        """
+        thought = self.create_thought('t', "<img src='/media/images/a.png'><img src='/media/images/shared.png'>")
+        self.create_thought('t2', "<img src='/media/images/shared.png'><img src='/media/images/b.png'>")
+        self.create_thought('t3', "<img src='/media/images/shared.png'>")
+
+        with mock.patch.object(lib, 'delete_files') as delete_files:
+            thought.delete()
+            bulk.delete_thoughts(['t2'], self.dummy_author)
+
+        self.assertFalse(delete_files.called)
+        self.assertEqual(set(ThoughtImage.objects.values_list('filename', flat=True)), {'images/shared.png'})
+
+
+class ImageTaskTestCase(TestCase):
+    """ images are resized by blog.tasks.process_image instead of during
+        the save
+    """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        os.makedirs(os.path.join(self.media_root, 'images'))
+
+        settings = self.settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        Image.new('RGB', (800, 600), (255, 0, 0)).save(os.path.join(self.media_root, 'images', 'red.png'))
+
+    def test_save_queues_resize(self):
+        """ saving doesn't touch the image, it's marked as in progress
+        """
+        with mock.patch.object(lib, 'resize_image') as resize_image:
+            highlight = Highlight.objects.create(title="Red", description="red", url="http://red.com", icon='images/red.png')
+
+        self.assertFalse(resize_image.called)
+        self.assertTrue(Highlight.objects.get(id=highlight.id).image_pending)
+
+    def test_unchanged_image_not_queued(self):
+        """ saves that don't change the image don't process it again, and
+            don't undo what the worker did
+        """
+        with mock.patch('blog.models.queue_image_resize') as queue:
+            highlight = Highlight.objects.create(title="Red", description="red", url="http://red.com", icon='images/red.png')
+            self.assertEqual(queue.call_count, 1)
+
+            # loaded before the worker is done
+            stale = Highlight.objects.get(id=highlight.id)
+            tasks.process_image('highlight', highlight.id, 'icon', list(lib.HIGHLIGHT_PREVIEW_IMAGE_SIZE))
+
+            stale.description = "still red"
+            stale.save()
+            self.assertEqual(queue.call_count, 1)
+
+            highlight = Highlight.objects.get(id=highlight.id)
+            self.assertFalse(highlight.image_pending)
+            self.assertEqual(lib.parse_image_widths(highlight.image_widths)[-1], lib.HIGHLIGHT_PREVIEW_IMAGE_SIZE[0])
+
+            highlight.icon = 'images/blue.png'
+            highlight.save()
+            self.assertEqual(queue.call_count, 2)
+            self.assertTrue(Highlight.objects.get(id=highlight.id).image_pending)
+
+    def test_process_image(self):
+        """ the task resizes the image and clears the flag
+        """
+        highlight = Highlight.objects.create(title="Red", description="red", url="http://red.com", icon='images/red.png')
+
+        tasks.process_image('highlight', highlight.id, 'icon', [200, 100])
+
+        with Image.open(os.path.join(self.media_root, 'images', 'red.png')) as image:
+            self.assertEqual(image.size, (200, 100))
+
+        highlight = Highlight.objects.get(id=highlight.id)
+        self.assertFalse(highlight.image_pending)
+        self.assertEqual(highlight.image_widths, '150,200')
+
+        # the narrower and WebP variants are collected once the Highlight
+        # is gone
+        variants = [os.path.join(self.media_root, name) for name in get_image_files(highlight, 'icon')]
+        self.assertTrue(all(os.path.exists(name) for name in variants))
+        self.assertEqual(media.collect_orphans(min_age=datetime.timedelta(0)), [])
+
+        highlight.delete()
+        self.assertTrue(all(os.path.exists(name) for name in variants))
+        self.assertEqual(len(media.collect_orphans(min_age=datetime.timedelta(0))), len(variants))
+        self.assertFalse(any(os.path.exists(name) for name in variants))
+
+    def test_idea_icon_small(self):
+        """ the small Idea icon is encoded like the icon, so transparent
+            icons keep their transparency and photos are JPEGs. Saving an
+            Idea doesn't read the icon to find out.
+        """
+        Image.new('RGBA', (800, 600), (255, 0, 0, 0)).save(os.path.join(self.media_root, 'images', 'clear.png'))
+        Image.frombytes('RGB', (800, 600), os.urandom(800 * 600 * 3)).save(
+            os.path.join(self.media_root, 'images', 'noise.png'))
+
+        with mock.patch('django.core.files.storage.FileSystemStorage.open') as storage_open:
+            clear = Idea.objects.create(name="Clear", slug="clear", description="clear", icon='images/clear.png')
+            noise = Idea.objects.create(name="Noise", slug="noise", description="noise", icon='images/noise.png')
+            Idea.objects.create(name="Missing", slug="missing", description="missing", icon='images/missing.jpg')
+        self.assertFalse(storage_open.called)
+        tasks.process_image('idea', clear.slug, 'icon', list(lib.IDEA_PREVIEW_IMAGE_SIZE))
+        tasks.process_image('idea', noise.slug, 'icon', list(lib.IDEA_PREVIEW_IMAGE_SIZE))
+
+        clear_small = Idea.objects.get(slug='clear').icon_small
+        with Image.open(os.path.join(self.media_root, clear_small.name)) as image:
+            self.assertEqual(image.format, 'PNG')
+            self.assertEqual(image.size, lib.IDEA_PREVIEW_IMAGE_SMALL_SIZE)
+            self.assertTrue(lib.has_alpha(image))
+
+        self.assertEqual(Idea.objects.get(slug='clear').icon_format, 'PNG')
+        noise_small = Idea.objects.get(slug='noise').icon_small
+        with Image.open(os.path.join(self.media_root, noise_small.name)) as image:
+            self.assertEqual(image.format, 'JPEG')
+
+    def test_image_size_report(self):
+        """ the report compares the stored images with the encoder's output
+        """
+        Highlight.objects.create(title="Red", description="red", url="http://red.com", icon='images/red.png')
+        out = StringIO()
+
+        call_command('image_size_report', verbose=True, stdout=out)
+
+        self.assertIn("images/red.png: PNG", out.getvalue())
+        self.assertIn("1 image(s)", out.getvalue())
+
+    def test_responsive_image(self):
+        """ processed images get a srcset of their variants, pending ones a
+            plain img
+        """
+        highlight = Highlight.objects.create(title="Red", description="red", url="http://red.com", icon='images/red.png')
+        self.assertEqual(responsive_image(highlight.icon), "<img src='/media/images/red.png' />")
+
+        tasks.process_image('highlight', highlight.id, 'icon', [200, 100])
+        highlight = Highlight.objects.get(id=highlight.id)
+
+        html = responsive_image(highlight.icon, sizes='200px', alt='red')
+        self.assertIn("srcset='/media/images/red-150w.png 150w, /media/images/red.png 200w'", html)
+        self.assertIn("<source type='image/webp' srcset='/media/images/red-150w.png.webp 150w, /media/images/red.png.webp 200w'", html)
+        self.assertIn("alt='red'", html)
+        self.assertEqual(image_width_url(highlight.icon, 100), '/media/images/red-150w.png')
+
+    def test_process_image_retry(self):
+        """ storage errors are retried later and the image stays in progress
+        """
+        highlight = Highlight.objects.create(title="Red", description="red", url="http://red.com", icon='images/red.png')
+
+        with mock.patch.object(lib, 'resize_image', side_effect=IOError("storage is down")), \
+                mock.patch.object(tasks.process_image, 'retry', side_effect=Retry()) as retry:
+            with self.assertRaises(Retry):
+                tasks.process_image('highlight', highlight.id, 'icon', [200, 100])
+
+        self.assertEqual(retry.call_args[1]['countdown'], tasks.IMAGE_TASK_RETRY_DELAY)
+        self.assertTrue(Highlight.objects.get(id=highlight.id).image_pending)
+
+    def test_process_image_bad_image(self):
+        """ an image that can't be processed isn't retried and doesn't stay
+            in progress; the original upload is served
+        """
+        highlight = Highlight.objects.create(title="Red", description="red", url="http://red.com", icon='images/red.png')
+
+        with mock.patch.object(lib, 'resize_image', side_effect=Image.DecompressionBombError("too big")), \
+                mock.patch.object(tasks.process_image, 'retry') as retry, \
+                mock.patch.object(tasks.logger, 'exception') as log:
+            tasks.process_image('highlight', highlight.id, 'icon', [200, 100])
+
+        self.assertFalse(retry.called)
+        self.assertTrue(log.called)
+        highlight = Highlight.objects.get(id=highlight.id)
+        self.assertFalse(highlight.image_pending)
+        self.assertEqual(highlight.image_widths, '!200')
+        self.assertEqual(responsive_image(highlight.icon), "<img src='/media/images/red.png' />")
+
+    def test_process_image_not_an_image(self):
+        """ an upload PIL can't read is given up on at once, not retried
+        """
+        with open(os.path.join(self.media_root, 'images', 'junk.png'), 'wb') as f:
+            f.write(b"not an image")
+        highlight = Highlight.objects.create(title="Junk", description="junk", url="http://junk.com", icon='images/junk.png')
+
+        with mock.patch.object(tasks.process_image, 'retry') as retry, \
+                mock.patch.object(tasks.logger, 'exception') as log:
+            tasks.process_image('highlight', highlight.id, 'icon', [200, 100])
+
+        self.assertFalse(retry.called)
+        self.assertTrue(log.called)
+        highlight = Highlight.objects.get(id=highlight.id)
+        self.assertFalse(highlight.image_pending)
+        self.assertEqual(highlight.image_widths, '!200')
+
+    def test_failed_image_not_queued(self):
+        """ editing the text of an object whose image couldn't be processed
+            doesn't try the image again; replacing the image does
+        """
+        author = User.objects.create(username="Cory", email="cparsnipson@gmail.com", password="test")
+        idea = Idea.objects.create(name="Miscellaneous", slug="misc", description="Random, blog thoughts.")
+
+        with mock.patch('blog.models.queue_image_resize') as queue:
+            thought = Thought.objects.create(title="Red", slug="red", content="red", idea=idea, author=author,
+                                             preview='images/red.png')
+            self.assertEqual(queue.call_count, 1)
+
+            with mock.patch.object(lib, 'resize_image', side_effect=ValueError("broken")), \
+                    mock.patch.object(tasks.logger, 'exception'):
+                tasks.process_image('thought', thought.slug, 'preview', list(lib.THOUGHT_PREVIEW_IMAGE_SIZE))
+
+            thought = Thought.objects.get(slug=thought.slug)
+            thought.content = "still red"
+            thought.save()
+            self.assertEqual(queue.call_count, 1)
+            self.assertFalse(Thought.objects.get(slug=thought.slug).image_pending)
+
+            thought.preview = 'images/blue.png'
+            thought.save()
+            self.assertEqual(queue.call_count, 2)
+            self.assertTrue(Thought.objects.get(slug=thought.slug).image_pending)
+
+
+class MediaCollectorTestCase(TestCase):
+    """ blog.media deletes the uploads nothing refers to
+    """
+    files = [
+        'images/icon.png',
+        'images/inline.png',
+        'images/orphan.png',
+        'images/old/orphan.png',
+        'files/notes.pdf',
+        'videos/clip.mp4',
+        'CACHE/images/icon/small.jpg',
+    ]
+
+    def setUp(self):
+        self.dummy_author = User.objects.create(username="Cory",
+                                                email="cparsnipson@gmail.com",
+                                                password="test")
+        self.dummy_idea = Idea.objects.create(name="Miscellaneous",
+                                              slug="misc",
+                                              description="Random, blog thoughts.")
+
+        Highlight.objects.create(title="Icon", description="icon", url="http://icon.com", icon='images/icon.png')
+        Thought.objects.create(title="t", slug="t", content="<img src='/media/images/inline.png'>",
+                               idea=self.dummy_idea, author=self.dummy_author)
+        Note.objects.create(title="n", content="<a href='/media/files/notes.pdf'>notes</a>")
+
+    def use_media_root(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+
+        settings = self.settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        for name in self.files:
+            path = os.path.join(media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 10)
+        return media_root
+
+    def test_collect(self):
+        """ orphans are listed by the dry run and deleted by the real one
+        """
+        media_root = self.use_media_root()
+        orphans = ['images/old/orphan.png', 'images/orphan.png', 'videos/clip.mp4']
+
+        out = StringIO()
+        call_command('collect_media', dry_run=True, min_age=0, stdout=out)
+        self.assertIn("3 orphaned file(s), 30 bytes would be deleted", out.getvalue())
+        self.assertTrue(all(os.path.exists(os.path.join(media_root, name)) for name in self.files))
+
+        # recent uploads may not have been saved with their form yet
+        self.assertEqual(media.collect_orphans(), [])
+
+        collected = media.collect_orphans(min_age=datetime.timedelta(0))
+        self.assertEqual(sorted(name for name, size in collected), orphans)
+        for name in self.files:
+            self.assertEqual(os.path.exists(os.path.join(media_root, name)), name not in orphans)
+
+    def test_thought_references(self):
+        """ inline Thought images come from the ThoughtImage table, the
+            other references from the html
+        """
+        thought = Thought.objects.get(slug="t")
+        thought.content += "<video src='/media/videos/clip.mp4' poster='/media/images/orphan.png'></video>"
+        thought.save()
+
+        referenced = media.get_referenced_files()
+        self.assertTrue({'images/inline.png', 'videos/clip.mp4', 'images/orphan.png'} <= referenced)
+
+        ThoughtImage.objects.filter(thought=thought).delete()
+        self.assertNotIn('images/inline.png', media.get_referenced_files())
+
+    def test_collect_s3(self):
+        """ on S3 the orphans come from the bucket listing and go in one
+            multi-object delete
+        """
+        server = S3Server()
+        server.start()
+        self.addCleanup(server.stop)
+        bucket = server.get_bucket('media')
+
+        for name in self.files:
+            bucket.new_key('media/' + name).set_contents_from_string('x' * 10)
+        del server.requests[:]
+
+        with mock.patch.object(lib, 'get_s3_bucket', return_value=bucket), \
+                mock.patch.object(lib, 'get_s3_key_name', side_effect=lambda name: 'media/' + name):
+            collected = media.collect_orphans(min_age=datetime.timedelta(0))
+
+        self.assertEqual(sorted(name for name, size in collected), ['images/old/orphan.png', 'images/orphan.png', 'videos/clip.mp4'])
+        self.assertEqual(sorted(key for b, key in server.objects), [
+            'media/CACHE/images/icon/small.jpg', 'media/files/notes.pdf', 'media/images/icon.png', 'media/images/inline.png',
+        ])
+        self.assertEqual([r for r in server.requests if r[0] != 'LIST'], [('DELETE_KEYS', '', 3)])
+
+
+class SearchTestCase(TestCase):
+    """ full text search over Thoughts, Notes and Ideas (blog.search)
+    """
+    def setUp(self):
+        self.dummy_author = User.objects.create_superuser(username="Cory",
+                                                          email="cparsnipson@gmail.com",
+                                                          password="test")
+        self.dummy_idea = Idea.objects.create(name="Gardening",
+                                              slug="gardening",
+                                              description="<p>Growing tomatoes on a balcony.</p>")
+
+        Thought.objects.create(title="Tomato blight", slug="blight", is_draft=False,
+                               content="<p>The <b>tomatoes</b> got blight again.</p>",
+                               idea=self.dummy_idea, author=self.dummy_author)
+        Thought.objects.create(title="Compost", slug="compost", is_draft=False,
+                               content="<p>Compost makes better tomatoes &amp; <i>peppers</i>.</p>",
+                               idea=self.dummy_idea, author=self.dummy_author)
+        Thought.objects.create(title="Draft", slug="draft", content="<p>Secret tomatoes plan.</p>",
+                               idea=self.dummy_idea, author=self.dummy_author)
+        Note.objects.create(title="Shopping", content="<p>buy tomatoes seeds</p>")
+
+    def search(self, query, public_only=True):
+        total, results = search.search(query, public_only)
+        return total, [(r.kind, r.title) for r in results]
+
+    def test_visibility(self):
+        """ visitors only find published Thoughts and Ideas, the dashboard
+            finds everything; titles rank above the body
+        """
+        total, results = self.search("tomato")
+        self.assertEqual(total, 3)
+        self.assertEqual(results[0], ('Thought', "Tomato blight"))
+        self.assertEqual(sorted(results[1:]), [('Idea', "Gardening"), ('Thought', "Compost")])
+
+        total, results = self.search("tomatoes", public_only=False)
+        self.assertEqual(total, 5)
+        self.assertIn(('Thought', "Draft"), results)
+        self.assertIn(('Note', "Shopping"), results)
+
+        self.assertEqual(self.search("compost peppers"), (1, [('Thought', "Compost")]))
+        self.assertEqual(self.search("  "), (0, []))
+        self.assertEqual(self.search('" OR * -'), (0, []))
+
+    def test_reindex(self):
+        """ edits, bulk trashing and deletes reach the index
+        """
+        thought = Thought.objects.get(slug='compost')
+        thought.content = "<p>Worms eat the peels.</p>"
+        thought.save()
+        self.assertEqual(self.search("peppers"), (0, []))
+        self.assertEqual(self.search("worms"), (1, [('Thought', "Compost")]))
+
+        bulk.trash_thoughts(['compost'], self.dummy_author)
+        self.assertEqual(self.search("worms"), (0, []))
+        self.assertEqual(self.search("worms", public_only=False)[0], 1)
+
+        Thought.objects.filter(slug='compost').delete()
+        Note.objects.all().delete()
+        self.assertEqual(self.search("worms", public_only=False)[0], 0)
+        self.assertEqual(self.search("seeds", public_only=False)[0], 0)
+        self.assertEqual(SearchEntry.objects.count(), 3)
+
+    def test_snippet(self):
+        """ matches are highlighted in an escaped snippet of the text
+        """
+        total, results = search.search("peppers")
+        self.assertEqual(results[0].snippet, "Compost makes better tomatoes &amp; <mark>peppers</mark>.")
+        self.assertEqual(results[0].url, reverse('thought-page', kwargs={'idea_slug': 'gardening', 'thought_slug': 'compost'}))
+
+        Note.objects.create(title="Markup", content="<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>")
+        total, results = search.search("alert", public_only=False)
+        self.assertEqual(results[0].snippet, "&lt;script&gt;<mark>alert</mark>(1)&lt;/script&gt;")
+        self.assertEqual(results[0].dashboard_url, reverse('dashboard-notes') + "?id=%d" % results[0].object.id)
+
+    def test_views(self):
+        """ the public page leaves drafts out, the dashboard page is for
+            the author only
+        """
+        response = self.client.get(reverse('search'), {'q': 'tomatoes'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Tomato blight")
+        self.assertNotContains(response, "Secret")
+
+        self.assertEqual(self.client.get(reverse('dashboard-search'), {'q': 'tomatoes'}).status_code, 302)
+
+        self.client.force_login(self.dummy_author)
+        response = self.client.get(reverse('dashboard-search'), {'q': 'tomatoes', 'p': 'x'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "<mark>tomatoes</mark> plan")
+        self.assertContains(response, "Shopping")
+
+
 class FileUploadTestCase(TestCase):
     """ test file upload functions
     """
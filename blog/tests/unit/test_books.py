@@ -0,0 +1,122 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from blog import books, catalog, lib
+from blog.tests.booksserver import BooksServer
+
+BOOKS = [
+    {'title': "War and Peace", 'author': "Leo Tolstoy"},
+    {'title': "The Art of War", 'author': "Sun Tzu"},
+    {'title': "War of the Worlds", 'author': "H. G. Wells"},
+    {'title': "Anna Karenina", 'author': "Leo Tolstoy"},
+    {'title': "Peace Is Every Step", 'author': "Thich Nhat Hanh"},
+]
+
+
+class TestBooks(TestCase):
+    """ unit tests for the book search client
+    """
+    def setUp(self):
+        self.server = BooksServer(BOOKS)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+        self.client = books.BookSearchClient(url=self.server.url, timeout=(1, 0.2))
+        self.addCleanup(self.client.session.close)
+
+    def get_queries(self):
+        return [q for q, address in self.server.requests]
+
+    def test_search(self):
+        """ books come back in the BookSearch format
+        """
+        found = self.client.search("tolstoy", 5)
+
+        self.assertEqual([b['title'] for b in found], ["War and Peace", "Anna Karenina"])
+        self.assertEqual(found[0], {
+            'url': 'http://books.example.com/0',
+            'cover': 'http://books.example.com/0.jpg',
+            'title': "War and Peace",
+            'author': "Leo Tolstoy",
+        })
+        self.assertEqual(len(self.client.search("war", 2)), 2)
+        self.assertEqual(self.client.search("  ", 5), [])
+
+    def test_keep_alive(self):
+        """ searches reuse one pooled connection
+        """
+        for keywords in ["war", "tolstoy", "peace", "anna"]:
+            self.client.search(keywords, 5)
+
+        addresses = set(address for q, address in self.server.requests)
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(len(addresses), 1)
+
+    def test_cache(self):
+        """ the same keywords (give or take case and spaces) are only sent
+            once, and callers can't change what's cached
+        """
+        first = self.client.search("War  and Peace", 5)
+        first[0]['title'] = "changed"
+
+        self.assertEqual(self.client.search(" war and peace ", 5)[0]['title'], "War and Peace")
+        self.assertEqual(self.get_queries(), ["war and peace"])
+
+        # expired entries are searched again
+        self.client.cache.ttl = -1
+        self.client.search("tolstoy", 5)
+        self.client.search("tolstoy", 5)
+        self.assertEqual(self.get_queries(), ["war and peace", "tolstoy", "tolstoy"])
+
+    def test_cache_lru(self):
+        """ the least recently used entry is dropped when the cache is full
+        """
+        cache = books.ResultCache(size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_prefix_reuse(self):
+        """ typing more of a search is answered from the shorter one while
+            it has enough books left
+        """
+        self.assertEqual(len(self.client.search("wa", 5)), 3)
+
+        # "wa" found every book it could, so anything longer is filtered
+        self.assertEqual([b['title'] for b in self.client.search("war wor", 5)], ["War of the Worlds"])
+        self.assertEqual(self.client.search("war z", 5), [])
+        self.assertEqual(self.get_queries(), ["wa"])
+
+    def test_prefix_reuse_incomplete(self):
+        """ a prefix that didn't get every book only answers when it still
+            has enough matches
+        """
+        with mock.patch.object(books, 'BOOK_SEARCH_FETCH_SIZE', 2):
+            self.client.search("wa", 5)
+            self.client.search("war", 1)
+            self.client.search("war a", 5)
+
+        self.assertEqual(self.get_queries(), ["wa", "war a"])
+
+    def test_timeout(self):
+        """ a slow API gives no books (and nothing is cached)
+        """
+        self.server.delay = 0.5
+        self.assertEqual(self.client.search("war", 5), [])
+
+        self.server.delay = 0
+        self.assertEqual(len(self.client.search("war", 5)), 3)
+
+    def test_book_search(self):
+        """ lib.BookSearch goes through the shared client
+        """
+        with mock.patch.object(books, '_client', self.client), \
+                mock.patch.object(catalog, 'search', return_value=[]):
+            found = lib.BookSearch().search("peace", max_len=1)
+
+        self.assertEqual(len(found), 1)
+        self.assertEqual(self.get_queries(), ["peace"])
@@ -0,0 +1,113 @@
+import os
+import json
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.test import TestCase
+from django.core.management import call_command
+
+from blog import books, catalog, lib
+
+BOOKS = [
+    {'title': "War and Peace", 'authors': ["Leo Tolstoy"], 'popularity': 9000},
+    {'title': "The Art of War", 'author': "Sun Tzu", 'popularity': 5000},
+    {'title': "War of the Worlds", 'author': "H. G. Wells", 'popularity': 3000},
+    {'title': "Anna Karenina", 'author': "Leo Tolstoy", 'popularity': 7000},
+    {'title': "Warrior of the Light", 'author': "Paulo Coelho", 'popularity': 100},
+    {'title': "Peace Is Every Step", 'author': "Thich Nhat Hanh"},
+    {'title': "", 'author': "Nobody"},
+]
+
+
+class TestCatalog(TestCase):
+    """ unit tests for the local book catalog
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'catalog.sqlite3')
+
+        self.books = [dict(b, url='http://books.example.com/' + b['title'], cover='http://books.example.com/cover.jpg')
+                      for b in BOOKS]
+
+    def search(self, keywords, max_len=5):
+        return [b['title'] for b in catalog.search(keywords, max_len, self.path)]
+
+    def test_build(self):
+        """ books without a title are skipped and a rebuild replaces the
+            catalog
+        """
+        self.assertEqual(catalog.build(self.books, self.path), 6)
+        self.assertEqual(catalog.search("tolstoy", 1, self.path), [{
+            'title': "War and Peace",
+            'author': "Leo Tolstoy",
+            'url': 'http://books.example.com/War and Peace',
+            'cover': 'http://books.example.com/cover.jpg',
+        }])
+
+        catalog.build(self.books[:1], self.path)
+        self.assertEqual(self.search("war"), ["War and Peace"])
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_prefix(self):
+        """ every keyword has to start a word; whole title words rank above
+            partial ones and titles above authors, then popularity decides
+        """
+        catalog.build(self.books, self.path)
+
+        self.assertEqual(self.search("war"), ["War and Peace", "The Art of War", "War of the Worlds", "Warrior of the Light"])
+        self.assertEqual(self.search("war", 2), ["War and Peace", "The Art of War"])
+        self.assertEqual(self.search("WAR  wor"), ["War of the Worlds"])
+        self.assertEqual(self.search("peace"), ["War and Peace", "Peace Is Every Step"])
+        self.assertEqual(self.search("leo"), ["War and Peace", "Anna Karenina"])
+
+    def test_trigram(self):
+        """ misspellings are matched by their trigrams when no prefix matches
+        """
+        catalog.build(self.books, self.path)
+
+        self.assertEqual(self.search("ana karenima"), ["Anna Karenina"])
+        self.assertEqual(self.search("warior light"), ["Warrior of the Light"])
+        self.assertEqual(self.search("xyzzy"), [])
+
+    def test_no_catalog(self):
+        """ without a catalog every search is a miss
+        """
+        self.assertEqual(self.search("war"), [])
+
+    def test_book_search(self):
+        """ lib.BookSearch answers from the catalog and only asks the remote
+            API on a miss
+        """
+        catalog.build(self.books, self.path)
+        client = mock.Mock()
+        client.search.return_value = [{'title': "Remote"}]
+
+        with mock.patch.object(catalog, 'BOOK_CATALOG_PATH', self.path), \
+                mock.patch.object(books, 'get_client', return_value=client):
+            self.assertEqual(lib.BookSearch().search("anna", max_len=3)[0]['title'], "Anna Karenina")
+            self.assertFalse(client.search.called)
+
+            self.assertEqual(lib.BookSearch().search("dune", max_len=3), [{'title': "Remote"}])
+            client.search.assert_called_once_with("dune", 3)
+
+    def test_import_command(self):
+        """ the command reads JSON lines and CSV dumps
+        """
+        jsonl = os.path.join(self.tmp_dir, 'books.jsonl')
+        with open(jsonl, 'w') as f:
+            f.write("\n".join(json.dumps(b) for b in self.books) + "\nnot json\n")
+
+        out = StringIO()
+        call_command('import_book_catalog', jsonl, output=self.path, stdout=out, stderr=StringIO())
+        self.assertIn("imported 6 book(s)", out.getvalue())
+        self.assertEqual(self.search("tolstoy"), ["War and Peace", "Anna Karenina"])
+
+        dump = os.path.join(self.tmp_dir, 'books.txt')
+        with open(dump, 'w') as f:
+            f.write("title,author,url,cover,popularity\nDune,Frank Herbert,http://x,http://x.jpg,10\n")
+
+        call_command('import_book_catalog', dump, format='csv', output=self.path, stdout=StringIO())
+        self.assertEqual(self.search("dune"), ["Dune"])
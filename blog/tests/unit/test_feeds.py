@@ -0,0 +1,85 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from blog import bulk, pagecache
+from blog.models import Idea, Thought
+
+
+class TestFeeds(TestCase):
+    """ unit tests for the cached Atom/RSS feeds
+    """
+    def setUp(self):
+        pagecache.get_cache().clear()
+
+        self.author = User.objects.create(username="Cory", email="cparsnipson@gmail.com", password="test")
+        self.idea = Idea.objects.create(name="Miscellaneous", slug="misc", description="<p>Random, blog thoughts.</p>")
+        self.other_idea = Idea.objects.create(name="Other", slug="other", description="Other thoughts.")
+
+        Thought.objects.create(title="Thought 1", slug="thought-1", content="<p>Contents of Thought 1.</p>",
+                               idea=self.idea, author=self.author, is_draft=False)
+        Thought.objects.create(title="Thought 2", slug="thought-2", content="<p>Contents of Thought 2.</p>",
+                               idea=self.other_idea, author=self.author, is_draft=False)
+        Thought.objects.create(title="Draft", slug="draft", content="<p>Not yet.</p>",
+                               idea=self.idea, author=self.author)
+
+    def test_feeds(self):
+        """ the feeds list published thoughts with their excerpts
+        """
+        response = self.client.get(reverse('feed-atom'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/atom+xml; charset=utf-8')
+        self.assertContains(response, "Thought 1")
+        self.assertContains(response, "Thought 2")
+        self.assertContains(response, "Contents of Thought 1.")
+        self.assertContains(response, "/ideas/misc/thought-1/")
+        self.assertNotContains(response, "Draft")
+
+        response = self.client.get(reverse('idea-feed-rss', kwargs={'idea_slug': 'misc'}))
+        self.assertEqual(response['Content-Type'], 'application/rss+xml; charset=utf-8')
+        self.assertContains(response, "Random, blog thoughts.")
+        self.assertContains(response, "Thought 1")
+        self.assertNotContains(response, "Thought 2")
+
+        self.assertEqual(self.client.get(reverse('idea-feed-atom', kwargs={'idea_slug': 'nope'})).status_code, 404)
+
+    def test_conditional_get(self):
+        """ a reader that has the current feed gets a 304, without a query
+        """
+        response = self.client.get(reverse('feed-rss'))
+        newest = Thought.objects.get(slug='thought-2').date_edited
+        self.assertEqual(response['Last-Modified'], newest.strftime('%a, %d %b %Y %H:%M:%S GMT'))
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse('feed-rss'))
+            not_modified = self.client.get(reverse('feed-rss'), HTTP_IF_NONE_MATCH=response['ETag'])
+            not_modified_since = self.client.get(reverse('feed-rss'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified_since.status_code, 304)
+        self.assertEqual(self.client.get(reverse('feed-rss'), HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_invalidation(self):
+        """ publishing, editing and trashing change the feeds, drafts don't
+        """
+        url = reverse('feed-atom')
+        idea_url = reverse('idea-feed-atom', kwargs={'idea_slug': 'other'})
+        etag = self.client.get(url)['ETag']
+        idea_etag = self.client.get(idea_url)['ETag']
+
+        draft = Thought.objects.get(slug='draft')
+        draft.content = "<p>Still not yet.</p>"
+        draft.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        draft.is_draft = False
+        draft.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Still not yet.")
+        self.assertEqual(self.client.get(idea_url, HTTP_IF_NONE_MATCH=idea_etag).status_code, 304)
+
+        bulk.trash_thoughts(['thought-2'], self.author)
+        self.assertNotContains(self.client.get(url), "Thought 2")
+        self.assertNotContains(self.client.get(idea_url), "Thought 2")
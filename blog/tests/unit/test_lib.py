@@ -1,6 +1,41 @@
+import os
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from PIL import Image
+
 from django.test import TestCase
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
 
+import paths
 import blog.lib as lib
+from blog import sanitizer
+from blog.management.commands.benchmark import legacy_truncate, legacy_strip_tags, SAMPLE_HTML
+from blog.models import Idea
+from blog.tests.s3server import S3Server
+
+
+def sample_image(size, fmt='JPEG', orientation=None):
+    """ encoded photo-ish test image (smooth gradients, like most photos)
+    """
+    red = Image.linear_gradient('L').resize(size)
+    green = Image.radial_gradient('L').resize(size)
+    blue = red.transpose(Image.FLIP_LEFT_RIGHT)
+    image = Image.merge('RGB', (red, green, blue))
+
+    kwargs = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[lib.EXIF_ORIENTATION_TAG] = orientation
+        kwargs['exif'] = exif.tobytes()
+
+    out = io.BytesIO()
+    image.save(out, fmt, **kwargs)
+    return out.getvalue()
 
 
 class TestLib(TestCase):
@@ -197,11 +232,138 @@ class TestLib(TestCase):
 
         self.assertEqual(expected, received)
 
+    ###########################################################################
+    # find_unique_slug function tests
+    ###########################################################################
+    def create_idea(self, slug):
+        return Idea.objects.create(name=slug, slug=slug, description=slug)
+
+    def test_find_unique_slug_single_query(self):
+        """ the first free suffix is found with one query, however many
+            slugs are taken
+        """
+        for slug in ['my-idea', 'my-idea-2', 'my-idea-3', 'my-idea-5', 'my-idea-x', 'my-ideas']:
+            self.create_idea(slug)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(lib.find_unique_slug("My Idea", Idea), 'my-idea-4')
+        self.assertEqual(lib.find_unique_slug("My Ideas!", Idea), 'my-ideas-2')
+        self.assertEqual(lib.find_unique_slug("Fresh Idea", Idea), 'fresh-idea')
+
+    def test_save_with_unique_slug_retry(self):
+        """ a slug taken between finding and saving it gets the next one
+        """
+        idea = Idea(name="Race", description="Race")
+        original = lib.find_unique_slug
+
+        def stale_find_unique_slug(unsafe_slug, model):
+            # the first lookup misses an idea created right after it
+            if not Idea.objects.filter(slug='race').exists():
+                self.create_idea('race')
+                return 'race'
+            return original(unsafe_slug, model)
+
+        with mock.patch.object(lib, 'find_unique_slug', stale_find_unique_slug):
+            lib.save_with_unique_slug(idea, "Race")
+
+        self.assertEqual(idea.slug, 'race-2')
+        self.assertEqual(Idea.objects.get(slug='race').name, 'race')
+
     ###########################################################################
     # truncate function tests
     ###########################################################################
     def test_truncate(self):
-        self.fail('to be implemented')
+        """ text longer than max_length is cut (ellipsis included), tags
+            outside the whitelist are dropped and open tags are closed
+        """
+        test = "<p>one <em>two three</em> four</p><p>five six</p>"
+        expected = "<div><p>one <em>two...</em></p></div>"
+
+        received = lib.truncate(test, max_length=10, allowed_tags=['p', 'em'])
+
+        self.assertEqual(expected, received)
+
+    def test_truncate_short(self):
+        """ text that fits in max_length is only sanitized
+        """
+        test = "<p>one <script>two</script><strong>three</strong></p>"
+        expected = "<p>one three</p>"
+
+        received = lib.truncate(test, max_length=100, allowed_tags=['p'])
+
+        self.assertEqual(expected, received)
+
+    def test_truncate_full_link(self):
+        """ the read more link goes at the end of the last paragraph
+        """
+        test = "<p>one two three</p><p>four five six</p>"
+        expected = u"<div><p>one two three</p><p>four...\xa0<a href=\"/more/\">(Read More)</a></p></div>"
+
+        received = lib.truncate(test, max_length=20, allowed_tags=['p'], full_link='/more/')
+
+        self.assertEqual(expected, received)
+
+    def test_truncate_empty(self):
+        """ empty or whitespace only content gives an empty string
+        """
+        self.assertEqual('', lib.truncate(''))
+        self.assertEqual('', lib.truncate('   '))
+
+    def test_truncate_matches_legacy(self):
+        """ the single pass sanitizer gives the same output as the original
+            Cleaner + truncatechars_html implementation
+        """
+        tag_lists = [lib.ALLOWED_TAGS, ['a'], [], ['p', 'em', 'img']]
+
+        for html in SAMPLE_HTML:
+            for allowed_tags in tag_lists:
+                for max_length in [5, 50, 90, 175, 250, 1000]:
+                    for full_link in [None, '/ideas/idea/thought/']:
+                        expected = legacy_truncate(html, max_length, allowed_tags, full_link)
+                        received = lib.truncate(html, max_length, allowed_tags, full_link)
+
+                        self.assertEqual(expected.replace('&nbsp;', u'\xa0'), received)
+
+    def test_strip_tags_matches_legacy(self):
+        """ strip tags gives the same text as the original implementation
+        """
+        for html in SAMPLE_HTML:
+            self.assertEqual(legacy_strip_tags(html), lib.strip_tags(html))
+
+    def test_strip_tags_script_style(self):
+        """ script and style content isn't text
+        """
+        html = "<p>a <style>p { color: red; }</style>b<script>alert(1)</script> c</p>"
+
+        self.assertEqual("a b c", lib.strip_tags(html))
+        self.assertEqual("a b c", sanitizer.get_text(html))
+
+    def test_sanitizer_cleaner_cache(self):
+        """ tag lists with the same tags share one cleaner
+        """
+        cleaner = sanitizer.get_cleaner(['p', 'em'])
+
+        self.assertIs(cleaner, sanitizer.get_cleaner(['em', 'p']))
+        self.assertIsNot(cleaner, sanitizer.get_cleaner(['p']))
+
+    def test_sanitizer_single_parse(self):
+        """ the sanitizer parses the html once and reuses its cleaners (the
+            original built a Cleaner and parsed up to three times per call;
+            see 'manage.py benchmark truncate' for the timings)
+        """
+        html = "".join(SAMPLE_HTML)
+        lib.truncate(html, 250, lib.ALLOWED_TAGS, '/more/')
+
+        with mock.patch.object(sanitizer.lxml.html, 'fromstring', wraps=sanitizer.lxml.html.fromstring) as parse, \
+                mock.patch.object(sanitizer, 'Cleaner') as cleaner:
+            lib.truncate(html, 250, lib.ALLOWED_TAGS, '/more/')
+            self.assertEqual(parse.call_count, 1)
+
+            lib.strip_tags(html)
+            sanitizer.get_text(html)
+            self.assertEqual(parse.call_count, 3)
+
+        self.assertFalse(cleaner.called)
 
     ###########################################################################
     # generate_upload_filename function tests
@@ -215,6 +377,135 @@ class TestLib(TestCase):
     def test_upload_file(self):
         self.fail('to be implemented')
 
+    def test_hash_upload_filename(self):
+        """ hashed names depend on the contents, not on what is in storage
+        """
+        first = SimpleUploadedFile("My Cat.PNG", b"cat pixels", content_type="image/png")
+        second = SimpleUploadedFile("My Cat.PNG", b"other pixels", content_type="image/png")
+
+        with self.assertNumQueries(0):
+            name = lib.hash_upload_filename(first, keep_name=True)
+        self.assertRegex(name, r'^my-cat-[0-9a-f]{16}\.png$')
+        self.assertEqual(first.read(), b"cat pixels")
+
+        self.assertNotEqual(name, lib.hash_upload_filename(second, keep_name=True))
+        self.assertEqual(lib.hash_upload_filename(first)[-20:], name[-20:])
+
+    def test_upload_file_stored_once(self):
+        """ uploading the same file twice gives the same url and one file
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        os.mkdir(os.path.join(media_root, paths.MEDIA_IMAGE_DIR))
+
+        with self.settings(MEDIA_ROOT=media_root):
+            with mock.patch.object(default_storage, 'exists') as exists:
+                for i in range(2):
+                    f = SimpleUploadedFile("cat.png", b"cat pixels", content_type="image/png")
+                    status, file_url = lib.upload_file(f)
+                    self.assertTrue(status)
+                self.assertFalse(exists.called)
+
+        self.assertEqual(os.listdir(os.path.join(media_root, os.path.dirname(file_url))), [os.path.basename(file_url)])
+
+    ###########################################################################
+    # stream_to_s3 function tests
+    ###########################################################################
+    def start_s3(self):
+        server = S3Server()
+        server.start()
+        self.addCleanup(server.stop)
+        return server, server.get_bucket('media')
+
+    def test_stream_to_s3_small(self):
+        """ a file smaller than a part is one PUT with its Content-Type
+        """
+        server, bucket = self.start_s3()
+        f = SimpleUploadedFile("clip.mp4", b"x" * 1000, content_type="video/mp4")
+
+        lib.stream_to_s3(f, bucket, 'media/videos/clip.mp4', f.content_type)
+
+        self.assertEqual(server.requests, [('PUT', 'media/videos/clip.mp4', 1000)])
+        self.assertEqual(server.objects[('media', 'media/videos/clip.mp4')]['content_type'], 'video/mp4')
+
+    def test_stream_to_s3_multipart(self):
+        """ bigger files go up in parts no bigger than a part plus a chunk
+        """
+        server, bucket = self.start_s3()
+        data = os.urandom(1000) * 300
+        # in memory uploads come out in one chunk, files on disk don't
+        f = File(io.BytesIO(data), name="clip.mp4")
+
+        with mock.patch.object(lib, 'UPLOAD_CHUNK_SIZE', 1000):
+            lib.stream_to_s3(f, bucket, 'media/videos/clip.mp4', 'video/mp4', part_size=64 * 1000)
+
+        parts = [size for method, key, size in server.requests if method == 'PUT']
+        self.assertEqual(len(parts), 5)
+        self.assertTrue(all(size <= 65 * 1000 for size in parts))
+        self.assertEqual(server.requests[0][0], 'INITIATE')
+        self.assertEqual(server.requests[-1][0], 'COMPLETE')
+
+        stored = server.objects[('media', 'media/videos/clip.mp4')]
+        self.assertEqual(stored['body'], data)
+        self.assertEqual(stored['content_type'], 'video/mp4')
+
+    def test_stream_to_s3_cancel(self):
+        """ a failed part cancels the multipart upload
+        """
+        server, bucket = self.start_s3()
+        f = SimpleUploadedFile("clip.mp4", b"x" * 3000, content_type="video/mp4")
+
+        with mock.patch('boto.s3.multipart.MultiPartUpload.upload_part_from_file', side_effect=IOError("broken pipe")):
+            with self.assertRaises(IOError):
+                lib.stream_to_s3(f, bucket, 'media/videos/clip.mp4', f.content_type, part_size=1000)
+
+        self.assertEqual(server.requests[-1], ('ABORT', 'media/videos/clip.mp4', 0))
+        self.assertEqual(server.objects, {})
+
+    def test_upload_file_s3(self):
+        """ upload_file streams to the bucket behind the storage
+        """
+        server, bucket = self.start_s3()
+        f = SimpleUploadedFile("cat.png", b"cat pixels", content_type="image/png")
+
+        with mock.patch.object(lib, 'get_s3_bucket', return_value=bucket), \
+                mock.patch.object(lib, 'get_s3_key_name', side_effect=lambda name: 'media/' + name):
+            status, file_url = lib.upload_file(f)
+
+        self.assertTrue(status)
+        self.assertEqual(server.objects[('media', 'media/' + file_url)]['body'], b"cat pixels")
+        self.assertEqual(len(server.requests), 1)
+
+    ###########################################################################
+    # get_media_filename function tests
+    ###########################################################################
+    def test_get_media_filename(self):
+        """ urls into MEDIA_URL give storage names, anything else None
+        """
+        with self.settings(MEDIA_URL='/media/'):
+            self.assertEqual(lib.get_media_filename('/media/images/a%20b.png'), 'images/a b.png')
+            self.assertIsNone(lib.get_media_filename('/static/images/a.png'))
+            self.assertIsNone(lib.get_media_filename('http://example.com/media/images/a.png'))
+            self.assertIsNone(lib.get_media_filename('/media/'))
+            self.assertIsNone(lib.get_media_filename(''))
+
+        with self.settings(MEDIA_URL='http://bucket.s3.amazonaws.com/media/'):
+            self.assertEqual(lib.get_media_filename('https://bucket.s3.amazonaws.com/media/images/a.png'), 'images/a.png')
+            self.assertIsNone(lib.get_media_filename('/media/images/a.png'))
+
+    ###########################################################################
+    # get_variant_name function tests
+    ###########################################################################
+    def test_get_variant_name(self):
+        """ variants keep the original extension, so images that only differ
+            by extension don't share variants
+        """
+        self.assertEqual(lib.get_variant_name('images/cat.png', 300), 'images/cat-300w.png')
+        self.assertEqual(lib.get_variant_name('images/cat.png', 300, '.webp'), 'images/cat-300w.png.webp')
+        self.assertEqual(lib.get_variant_name('images/cat.png', ext='.webp'), 'images/cat.png.webp')
+        self.assertNotEqual(lib.get_variant_name('images/cat.jpg', ext='.webp'),
+                            lib.get_variant_name('images/cat.png', ext='.webp'))
+
     ###########################################################################
     # get_center_coord function tests
     ###########################################################################
@@ -277,7 +568,121 @@ class TestLib(TestCase):
     # resize_image function tests
     ###########################################################################
     def test_resize_image(self):
-        self.fail('to be implemented')
+        """ the image comes back (and is stored) upright at exactly new_size
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        os.makedirs(os.path.join(media_root, 'images'))
+
+        # stored 800x400, red on the left and blue on the right; displayed
+        # rotated 90 degrees clockwise (400x800, red on top)
+        image = Image.new('RGB', (800, 400), (255, 0, 0))
+        image.paste((0, 0, 255), (400, 0, 800, 400))
+        exif = Image.Exif()
+        exif[lib.EXIF_ORIENTATION_TAG] = 6
+        image.save(os.path.join(media_root, 'images', 'tall.jpg'), 'JPEG', exif=exif.tobytes())
+
+        with self.settings(MEDIA_ROOT=media_root):
+            resized = lib.resize_image('images/tall.jpg', (100, 200))
+
+            with default_storage.open('images/tall.jpg') as f:
+                stored = Image.open(f)
+                stored.load()
+
+        for image in [resized, stored]:
+            self.assertEqual(image.size, (100, 200))
+            red, green, blue = image.convert('RGB').getpixel((50, 10))
+            self.assertTrue(red > 200 and blue < 50, "top should be red, got %r" % ((red, green, blue),))
+            red, green, blue = image.convert('RGB').getpixel((50, 190))
+            self.assertTrue(blue > 200 and red < 50, "bottom should be blue, got %r" % ((red, green, blue),))
+
+    def test_resize_image_file(self):
+        """ the image in storage is replaced by the resized one
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        os.makedirs(os.path.join(media_root, 'images'))
+        with open(os.path.join(media_root, 'images', 'photo.jpg'), 'wb') as f:
+            f.write(sample_image((1600, 1200)))
+
+        with self.settings(MEDIA_ROOT=media_root):
+            lib.resize_image('images/photo.jpg', (200, 150))
+
+            with default_storage.open('images/photo.jpg') as f:
+                image = Image.open(f)
+                self.assertEqual((image.format, image.size), ('JPEG', (200, 150)))
+
+    def test_open_image_draft(self):
+        """ big JPEGs are decoded at a reduced scale that still covers twice
+            the target size, and refused over max_pixels
+        """
+        data = sample_image((4000, 3000))
+
+        image, rotated = lib.open_image(io.BytesIO(data), (600, 300))
+        self.assertEqual(image.size, (2000, 1500))
+        self.assertFalse(rotated)
+
+        with self.assertRaises(Image.DecompressionBombError):
+            lib.open_image(io.BytesIO(data), (600, 300), max_pixels=1000 * 1000)
+
+        # no reduced decode for PNGs
+        image, rotated = lib.open_image(io.BytesIO(sample_image((1200, 900), 'PNG')), (200, 150))
+        self.assertEqual(image.size, (1200, 900))
+
+    def test_open_image_exif_orientation(self):
+        """ images are turned upright according to their EXIF orientation
+        """
+        # stored 800x400, displayed rotated 90 degrees clockwise (400x800)
+        data = sample_image((800, 400), orientation=6)
+
+        # decoded at half scale (still twice the target)
+        image, rotated = lib.open_image(io.BytesIO(data), (100, 200))
+        self.assertTrue(rotated)
+        self.assertEqual(image.size, (200, 400))
+
+        cropped = lib.resize_cover(image, (100, 200))
+        self.assertEqual(cropped.size, (100, 200))
+
+    def test_resize_cover(self):
+        """ the crop always comes out at exactly the requested size
+        """
+        for size in [(1234, 617), (601, 300), (300, 600), (200, 100), (6000, 4000)]:
+            image = Image.new('RGB', size)
+            self.assertEqual(lib.resize_cover(image, (600, 300)).size, (600, 300))
+
+    ###########################################################################
+    # encode_image function tests
+    ###########################################################################
+    def test_choose_image_format(self):
+        """ photos are JPEGs, graphics and transparent images PNGs
+        """
+        photo = Image.open(io.BytesIO(sample_image((600, 300))))
+        self.assertEqual(lib.choose_image_format(photo), 'JPEG')
+
+        graphic = Image.new('RGB', (600, 300), (255, 255, 255))
+        graphic.paste((200, 0, 0), (100, 100, 200, 200))
+        self.assertEqual(lib.choose_image_format(graphic), 'PNG')
+
+        transparent = photo.convert('RGBA')
+        transparent.putpixel((0, 0), (0, 0, 0, 0))
+        self.assertEqual(lib.choose_image_format(transparent), 'PNG')
+
+        # an alpha channel that is opaque everywhere doesn't count
+        self.assertEqual(lib.choose_image_format(photo.convert('RGBA')), 'JPEG')
+
+    def test_encode_image(self):
+        """ photos come out as progressive JPEGs, smaller than as PNGs
+        """
+        photo = Image.open(io.BytesIO(sample_image((600, 300)))).convert('RGBA')
+
+        out_img, content_type = lib.encode_image(photo)
+        encoded = Image.open(out_img)
+        self.assertEqual((content_type, encoded.format, encoded.mode), ('image/jpeg', 'JPEG', 'RGB'))
+        self.assertTrue(encoded.info.get('progressive'))
+
+        png, content_type = lib.encode_image(photo, 'PNG')
+        self.assertEqual(content_type, 'image/png')
+        self.assertLess(out_img.getbuffer().nbytes, png.getbuffer().nbytes)
 
     ###########################################################################
     # create_pagination function tests
@@ -0,0 +1,144 @@
+from django.conf import settings
+from django.core.urlresolvers import reverse, resolve
+from django.test import TestCase, RequestFactory
+from django.contrib.auth.models import User
+
+from blog import pagecache
+from blog.models import Idea, Thought, ReadingListItem
+
+
+class TestPageCache(TestCase):
+    """ unit tests for the anonymous page cache
+    """
+    def setUp(self):
+        pagecache.get_cache().clear()
+
+        self.author = User.objects.create(username="Cory", email="cparsnipson@gmail.com", password="test")
+        self.idea = Idea.objects.create(name="Miscellaneous", slug="misc", description="Random, blog thoughts.")
+
+        # pages link the idea icon; skip Idea.save so nothing tries to resize it
+        Idea.objects.filter(slug="misc").update(icon="images/misc.png")
+        self.idea.refresh_from_db()
+
+        self.thought = Thought.objects.create(
+            title="Thought 1",
+            slug="thought-1",
+            content="<p>Contents of Thought 1.</p>",
+            idea=self.idea,
+            author=self.author,
+            is_draft=False,
+        )
+        self.thought_url = reverse('thought-page', kwargs={'idea_slug': 'misc', 'thought_slug': 'thought-1'})
+
+    def get_request(self, path, **extra):
+        request = RequestFactory().get(path, **extra)
+        request.resolver_match = resolve(request.path)
+        return request
+
+    def get_generation(self, group):
+        return pagecache.get_cache().get(pagecache.GROUP_KEY_PREFIX + group)
+
+    ###########################################################################
+    # page keys
+    ###########################################################################
+    def test_page_key(self):
+        """ the same page gets the same key, other pages get other keys
+        """
+        key = pagecache.get_page_key(self.get_request('/'))
+        self.assertIsNotNone(key)
+        self.assertEqual(key, pagecache.get_page_key(self.get_request('/?p=1')))
+        self.assertNotEqual(key, pagecache.get_page_key(self.get_request('/?p=2')))
+        self.assertNotEqual(key, pagecache.get_page_key(self.get_request(self.thought_url)))
+
+    def test_page_key_uncacheable(self):
+        """ sessions, odd query strings and dashboard pages are never cached
+        """
+        request = self.get_request('/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = 'abc'
+        self.assertIsNone(pagecache.get_page_key(request))
+
+        self.assertIsNone(pagecache.get_page_key(self.get_request('/?p=abc')))
+        self.assertIsNone(pagecache.get_page_key(self.get_request('/?p=1&utm_source=x')))
+        self.assertIsNone(pagecache.get_page_key(self.get_request(reverse('dashboard'))))
+
+    ###########################################################################
+    # views
+    ###########################################################################
+    def test_cached_page_hit(self):
+        """ the second anonymous request for a page doesn't touch the database
+        """
+        response = self.client.get(self.thought_url)
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.thought_url)
+        self.assertEqual(cached.content, response.content)
+
+    def test_logged_in_not_cached(self):
+        """ logged in users always get a fresh page
+        """
+        self.client.force_login(self.author)
+        self.client.get(self.thought_url)
+
+        response = self.client.get(self.thought_url)
+        self.assertNotEqual(len(response.content), 0)
+        with self.assertRaises(AssertionError):
+            with self.assertNumQueries(0):
+                self.client.get(self.thought_url)
+
+    ###########################################################################
+    # invalidation
+    ###########################################################################
+    def test_thought_save_invalidates(self):
+        """ editing a thought throws out its page
+        """
+        self.client.get(self.thought_url)
+
+        self.thought.title = "Edited Thought"
+        self.thought.save()
+
+        response = self.client.get(self.thought_url)
+        self.assertContains(response, "Edited Thought")
+
+    def test_thought_edit_keeps_other_pages(self):
+        """ editing a thought in place leaves unrelated pages alone
+        """
+        self.client.get(reverse('books'))
+        books_generation = self.get_generation('reading-list')
+
+        self.thought.title = "Edited Thought"
+        self.thought.save()
+
+        self.assertEqual(books_generation, self.get_generation('reading-list'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('books'))
+
+    def test_draft_save_does_not_invalidate(self):
+        """ drafts are never on a public page
+        """
+        self.client.get('/')
+        generation = self.get_generation('index')
+
+        Thought.objects.create(
+            title="Draft",
+            slug="draft",
+            content="draft",
+            idea=self.idea,
+            author=self.author,
+        )
+        self.assertEqual(generation, self.get_generation('index'))
+
+    def test_reading_list_invalidates(self):
+        """ a new book shows up on the books page
+        """
+        self.client.get(reverse('books'))
+
+        ReadingListItem.objects.create(
+            title="John Dies at the End",
+            author="David Wong",
+            link="http://johndiesattheend.com/",
+            cover="http://johndiesattheend.com/cover.jpg",
+        )
+
+        response = self.client.get(reverse('books'))
+        self.assertContains(response, "John Dies at the End")
@@ -0,0 +1,123 @@
+import datetime
+
+import pytz
+from django.db import connection
+from django.db.models.deletion import Collector
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+
+from blog import bulk, pagecache
+from blog.models import ReadingListItem, Activity, Highlight
+from blog.pagination import KeysetPaginator, CURSOR_LAST, paginate
+
+
+class TestKeysetPagination(TestCase):
+    """ unit tests for the keyset paginator
+    """
+    ordering = ['-date_published', '-id']
+
+    def setUp(self):
+        pagecache.get_cache().clear()
+
+        for i in range(23):
+            ReadingListItem.objects.create(
+                title="Book %d" % i,
+                author="Author",
+                link="http://example.com/%d" % i,
+                cover="http://example.com/%d.jpg" % i,
+            )
+
+        # give some books the same date so the id tie breaker matters
+        base = datetime.datetime(2019, 1, 1, tzinfo=pytz.utc)
+        for book in ReadingListItem.objects.all():
+            ReadingListItem.objects.filter(id=book.id).update(date_published=base + datetime.timedelta(days=book.id // 3))
+
+        self.books = ReadingListItem.objects.all()
+        self.expected = list(self.books.order_by(*self.ordering))
+
+    def get_request(self, **params):
+        return RequestFactory().get('/books/', params)
+
+    def test_offset_pages(self):
+        """ bare page numbers return the same pages as slicing
+        """
+        for number in range(1, 4):
+            paginator, page, pagination = paginate(self.books, self.get_request(p=number), 10, self.ordering)
+            self.assertEqual(list(page), self.expected[(number - 1) * 10:number * 10])
+
+        self.assertEqual(paginator.num_pages, 3)
+        self.assertEqual(pagination['last'], 3)
+        self.assertIsNone(pagination['next'])
+
+    def test_cursor_pages(self):
+        """ following the next and prev cursors walks the same pages as
+            OFFSET without running an OFFSET query
+        """
+        paginator = KeysetPaginator(self.books, 5, self.ordering)
+        page = paginator.page(1)
+        self.assertEqual(list(page), self.expected[:5])
+
+        for number in range(2, 6):
+            cursor = page.get_cursor(number)
+            with CaptureQueriesContext(connection) as queries:
+                page = paginator.page(number, cursor)
+            self.assertEqual(list(page), self.expected[(number - 1) * 5:number * 5])
+            self.assertFalse(any('OFFSET' in q['sql'] for q in queries.captured_queries))
+
+        self.assertFalse(page.has_next())
+
+        for number in range(4, 0, -1):
+            page = paginator.page(number, page.get_cursor(number))
+            self.assertEqual(list(page), self.expected[(number - 1) * 5:number * 5])
+
+    def test_jump_pages(self):
+        """ page links further away and the last page link land on the right
+            rows
+        """
+        paginator = KeysetPaginator(self.books, 5, self.ordering)
+        page = paginator.page(1)
+
+        self.assertEqual(page.get_cursor(5), CURSOR_LAST)
+        last = paginator.page(5, page.get_cursor(5))
+        self.assertEqual(list(last), self.expected[20:])
+
+        page = paginator.page(3, page.get_cursor(3))
+        self.assertEqual(list(page), self.expected[10:15])
+
+        page = paginator.page(1, last.get_cursor(1))
+        self.assertEqual(list(page), self.expected[:5])
+
+    def test_bad_cursor(self):
+        """ garbage cursors fall back to the page number
+        """
+        paginator = KeysetPaginator(self.books, 5, self.ordering)
+        for cursor in ['nonsense', 'a1.!!!', 'b9.W10=']:
+            self.assertEqual(list(paginator.page(2, cursor)), self.expected[5:10])
+
+    def test_cached_count(self):
+        """ the count is only run once until the table changes
+        """
+        self.assertEqual(KeysetPaginator(self.books, 5, self.ordering).count, 23)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(KeysetPaginator(self.books, 5, self.ordering).count, 23)
+        self.assertEqual(len(queries.captured_queries), 0)
+
+        ReadingListItem.objects.create(title="New", author="Author", link="http://example.com/", cover="http://example.com/c.jpg")
+        self.assertEqual(KeysetPaginator(self.books, 5, self.ordering).count, 24)
+
+    def test_cached_count_delete(self):
+        """ deletes throw out the count too, without a post_delete receiver
+            that would keep QuerySet.delete() from being a single statement
+        """
+        for model in [ReadingListItem, Activity, Highlight]:
+            self.assertTrue(Collector(using='default').can_fast_delete(model.objects.all()))
+
+        author = User.objects.create(username="Cory", email="cparsnipson@gmail.com", password="test")
+        self.assertEqual(KeysetPaginator(self.books, 5, self.ordering).count, 23)
+        bulk.delete_books([b.id for b in ReadingListItem.objects.all()[:3]], author)
+        self.assertEqual(KeysetPaginator(self.books, 5, self.ordering).count, 20)
+
+        ReadingListItem.objects.all()[0].delete()
+        self.assertEqual(KeysetPaginator(self.books, 5, self.ordering).count, 19)
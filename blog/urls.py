@@ -3,7 +3,7 @@ from django.conf.urls.static import static
 from django.conf.urls import url
 from django.views.generic.base import RedirectView
 
-from . import views
+from . import views, feeds
 
 urlpatterns = [
     # favicon
@@ -16,10 +16,17 @@ urlpatterns = [
     url(r'^about/', views.about, name='about'),
     url(r'^books/', views.books, name='books'),
     url(r'^highlights/', views.highlights, name='highlights'),
+    url(r'^search/$', views.search, name='search'),
     url(r'^ideas/$', views.ideas, name='catalog'),
     url(r'^ideas/(?P<idea_slug>[a-z0-9\-]+)/$', views.idea_detail, name='idea-page'),
     url(r'^ideas/(?P<idea_slug>[a-z0-9\-]+)/(?P<thought_slug>[a-z0-9\-]+)/', views.thought_detail, name='thought-page'),
 
+    # atom/rss feeds
+    url(r'^feeds/rss/$', feeds.rss, name='feed-rss'),
+    url(r'^feeds/atom/$', feeds.atom, name='feed-atom'),
+    url(r'^feeds/ideas/(?P<idea_slug>[a-z0-9\-]+)/rss/$', feeds.idea_rss, name='idea-feed-rss'),
+    url(r'^feeds/ideas/(?P<idea_slug>[a-z0-9\-]+)/atom/$', feeds.idea_atom, name='idea-feed-atom'),
+
     # dashboard urls, admin only!
     url(r'^dashboard/$', views.dashboard, name='dashboard'),
     url(r'^dashboard/books/$', views.dashboard_books, name='dashboard-books'),
@@ -31,6 +38,7 @@ urlpatterns = [
     url(r'^dashboard/author/$', views.dashboard_author, name='dashboard-author'),
     url(r'^dashboard/drafts/$', views.dashboard_drafts, name='dashboard-drafts'),
     url(r'^dashboard/trash/$', views.dashboard_trash, name='dashboard-trash'),
+    url(r'^dashboard/search/$', views.dashboard_search, name='dashboard-search'),
     url(r'^dashboard/backend/$', views.dashboard_backend, name='dashboard-backend'),
 
     # site api
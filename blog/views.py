@@ -1,65 +1,55 @@
 import os
 import urllib
 import random
-from datetime import datetime, timedelta
+from datetime import timedelta
 
+from django.conf import settings
 from django.core import serializers
 from django.core.urlresolvers import reverse
 from django.core.exceptions import ValidationError
 from django.template.context_processors import csrf
 from django.http import JsonResponse, HttpResponseForbidden
 from django.views.generic import View
+from django.utils import timezone
 from django.utils.http import urlquote_plus
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.contrib.auth.decorators import login_required
 
-from blog import lib
-import paths
-from blog.models import Idea, Thought, Highlight, ReadingListItem, Task, Activity, Note
+from blog import lib, bulk, search as site_search
+from blog.pagecache import cache_anonymous_page
+from blog.pagination import paginate
+from blog.models import Idea, Thought, Highlight, ReadingListItem, Task, Activity, Note, Statistic
 from blog.forms import LoginForm, IdeaForm, ThoughtForm, HighlightForm, ReadingListItemForm, TaskForm, NoteForm
-from blog.tasks import publish_highlight
 
 
 ###############################################################################
 # Site skeleton views
 ###############################################################################
+@cache_anonymous_page
 def index(request):
-    thoughts = Thought.objects.filter(is_draft=False, is_trash=False).order_by("-date_published")
+    thoughts = Thought.objects.filter(is_draft=False, is_trash=False).defer('content').order_by("-date_published", "-slug")
 
-    latest_thought = None
-    if len(thoughts):
-        latest_thought = thoughts[0]
-        latest_thought.content = latest_thought.truncate(max_length=240)
+    # the latest thought is in the showcase, the rest are paginated below it
+    latest_thought = thoughts.first()
+    if latest_thought:
+        thoughts = thoughts.exclude(slug=latest_thought.slug)
 
-    thoughts = thoughts[1:]
-
-    page = request.GET.get('p')
-    paginator, thoughts_on_page = lib.create_paginator(
-        queryset=thoughts,
-        per_page=lib.PAGINATION_FRONT_PER_PAGE,
-        page=page,
-    )
-    pagination = lib.create_pagination(
+    paginator, thoughts_on_page, pagination = paginate(
         queryset=thoughts,
-        current_page=page,
+        request=request,
         per_page=lib.PAGINATION_FRONT_PER_PAGE,
         page_lead=lib.PAGINATION_FRONT_PAGES_TO_LEAD,
+        ordering=['-date_published', '-slug'],
     )
 
-    for t in thoughts_on_page:
-        t.content = t.truncate()
-
     # get latest link of the day
     highlight = Highlight.objects.filter(is_published=True).order_by('-date_published')[:1]
     highlight_cut = False
     if highlight:
         highlight = highlight[0]
-        highlight.description = highlight.truncate(
-            max_length=90,
-            full_link=reverse('highlights'))
-        highlight_cut = len(highlight.description) > 90
+        highlight_cut = len(highlight.excerpt_link) > 90
 
     context = {
         'page_title': 'Home',
@@ -92,20 +82,16 @@ def logout_page(request):
     return render(request, 'blog/logout.html', context)
 
 
+@cache_anonymous_page
 def highlights(request):
     highlight_list = Highlight.objects.filter(is_published=True).order_by('-date_published')
 
-    page = request.GET.get('p')
-    paginator, highlights_on_page = lib.create_paginator(
-        queryset=highlight_list,
-        per_page=lib.PAGINATION_HIGHLIGHTS_PER_PAGE,
-        page=page,
-    )
-    pagination = lib.create_pagination(
+    paginator, highlights_on_page, pagination = paginate(
         queryset=highlight_list,
-        current_page=page,
+        request=request,
         per_page=lib.PAGINATION_HIGHLIGHTS_PER_PAGE,
         page_lead=lib.PAGINATION_HIGHLIGHTS_PAGES_TO_LEAD,
+        ordering=['-date_published', '-id'],
     )
 
     context = {
@@ -117,20 +103,16 @@ def highlights(request):
     return render(request, 'blog/highlights.html', context)
 
 
+@cache_anonymous_page
 def books(request):
     read_book_list_total = ReadingListItem.objects.filter(wishlist=False).order_by('-date_published')
 
-    page = request.GET.get('p')
-    paginator, read_list = lib.create_paginator(
-        queryset=read_book_list_total,
-        per_page=lib.PAGINATION_READINGLIST_PER_PAGE,
-        page=page,
-    )
-    pagination = lib.create_pagination(
+    paginator, read_list, pagination = paginate(
         queryset=read_book_list_total,
-        current_page=page,
+        request=request,
         per_page=lib.PAGINATION_READINGLIST_PER_PAGE,
         page_lead=lib.PAGINATION_READINGLIST_PAGES_TO_LEAD,
+        ordering=['-date_published', '-id'],
     )
 
     context = {
@@ -150,38 +132,42 @@ def about(request):
     return render(request, 'blog/about.html', context)
 
 
-def ideas(request):
-    idea_list = Idea.objects.all().order_by('order')
+def search(request):
+    """ public search over published Thoughts and Ideas (not page cached,
+        every query string is a different page)
+    """
+    query, paginator, results, pagination = site_search.search_page(request, public_only=True)
+
+    context = {
+        'page_title': 'Search',
+        'query': query,
+        'results': results,
+        'paginator': paginator,
+        'pagination': pagination,
+    }
+    return render(request, 'blog/search.html', context)
 
-    page = request.GET.get('p')
-    paginator, ideas_on_page = lib.create_paginator(
-        queryset=idea_list,
-        per_page=lib.PAGINATION_IDEAS_PER_PAGE,
-        page=page,
-    )
 
-    pagination_main = lib.create_pagination(
+@cache_anonymous_page
+def ideas(request):
+    idea_list = Idea.objects.all().order_by('order', 'slug')
+
+    paginator, ideas_on_page, pagination_main = paginate(
         queryset=idea_list,
-        current_page=page,
+        request=request,
         per_page=lib.PAGINATION_IDEAS_PER_PAGE,
         page_lead=lib.PAGINATION_IDEAS_PAGES_TO_LEAD,
+        ordering=['order', 'slug'],
     )
 
-    for idea in idea_list:
-        idea.description = idea.truncate()
-
     # create more recent ideas list
-    recent_thoughts = Thought.objects.filter(is_draft=False, is_trash=False).order_by('-date_published')
+    recent_thoughts = Thought.objects.filter(is_draft=False, is_trash=False).defer('content').order_by('-date_published')
 
     recent_ideas = [t['idea'] for t in recent_thoughts.values('idea')]
     unique_ideas = lib.remove_duplicates([t['idea'] for t in recent_thoughts.values('idea')])[:lib.NUM_RECENT_IDEAS]
 
     recent_thoughts = [recent_thoughts[recent_ideas.index(i)] for i in unique_ideas]
 
-    allowed_tags = list(Thought.allowed_tags) + ['img']
-    for t in recent_thoughts:
-        t.content = t.truncate(allowed_tags=allowed_tags)
-
     context = {
         'page_title': 'Ideas',
         'ideas': ideas_on_page,
@@ -192,33 +178,21 @@ def ideas(request):
     return render(request, 'blog/ideas.html', context)
 
 
+@cache_anonymous_page
 def idea_detail(request, idea_slug=None):
     idea = get_object_or_404(Idea, slug=idea_slug)
-    thoughts = Thought.objects.filter(idea=idea_slug, is_draft=False, is_trash=False).order_by('-date_published')
-
-    page = request.GET.get('p')
-    paginator, thoughts_on_page = lib.create_paginator(
-        queryset=thoughts,
-        per_page=lib.PAGINATION_THOUGHTS_PER_PAGE,
-        page=page,
-    )
+    thoughts = Thought.objects.filter(idea=idea_slug, is_draft=False, is_trash=False).defer('content').order_by('-date_published')
 
-    pagination_main = lib.create_pagination(thoughts, page)
-    pagination_side = lib.create_pagination(
+    paginator, thoughts_on_page, pagination_main = paginate(
         queryset=thoughts,
-        current_page=page,
+        request=request,
         per_page=lib.PAGINATION_THOUGHTS_PER_PAGE,
-        page_lead=0,
+        page_lead=lib.PAGINATION_THOUGHTS_PAGES_TO_LEAD,
+        ordering=['-date_published', '-slug'],
     )
 
-    for t in thoughts_on_page:
-        t.content = t.truncate(
-            max_length=175,
-            full_link=reverse('thought-page', kwargs={
-                'idea_slug': t.idea.slug,
-                'thought_slug': t.slug,
-            }),
-        )
+    # same page, without the neighbouring page numbers
+    pagination_side = dict(pagination_main, pages=[pagination_main['current']])
 
     # pick from a list, prevent duplicates
     other_ideas = Idea.objects.exclude(slug=idea_slug)
@@ -241,8 +215,9 @@ def idea_detail(request, idea_slug=None):
     return render(request, 'blog/idea.html', context)
 
 
+@cache_anonymous_page
 def thought_detail(request, idea_slug=None, thought_slug=None):
-    thought = get_object_or_404(Thought, slug=thought_slug)
+    thought = get_object_or_404(Thought.objects.select_related('idea'), slug=thought_slug)
 
     # make sure trashed thoughts and drafts can only be viewed by
     # an authenticated, admin user
@@ -264,18 +239,13 @@ def thought_detail(request, idea_slug=None, thought_slug=None):
 ###############################################################################
 @login_required(login_url='index')
 def dashboard(request):
-    activities = Activity.objects.all().order_by("-date")
-    paginator, activities_on_page = lib.create_paginator(
-        queryset=activities,
-        per_page=lib.PAGINATION_DASHBOARD_ACTIVITY_PER_PAGE,
-        page=request.GET.get('p'),
-    )
-
-    pagination = lib.create_pagination(
+    activities = Activity.objects.select_related("author").order_by("-date")
+    paginator, activities_on_page, pagination = paginate(
         queryset=activities,
-        current_page=request.GET.get('p'),
+        request=request,
         per_page=lib.PAGINATION_DASHBOARD_ACTIVITY_PER_PAGE,
         page_lead=lib.PAGINATION_DASHBOARD_ACTIVITY_PAGES_TO_LEAD,
+        ordering=['-date', '-id'],
     )
 
     context = {
@@ -302,17 +272,12 @@ def dashboard_books(request):
     reading_list_item_form = ReadingListItemForm(instance=instance)
 
     read_list_total = ReadingListItem.objects.filter(wishlist=False).order_by('-date_published')
-    paginator, read_list = lib.create_paginator(
+    paginator, read_list, pagination = paginate(
         queryset=read_list_total,
-        per_page=lib.PAGINATION_DASHBOARD_READINGLIST_PER_PAGE,
-        page=request.GET.get('p'),
-    )
-
-    pagination = lib.create_pagination(
-        queryset=read_list_total,
-        current_page=request.GET.get('p'),
+        request=request,
         per_page=lib.PAGINATION_DASHBOARD_READINGLIST_PER_PAGE,
         page_lead=lib.PAGINATION_DASHBOARD_READINGLIST_PAGES_TO_LEAD,
+        ordering=['-date_published', '-id'],
     )
 
     context = {
@@ -334,21 +299,16 @@ def dashboard_highlights(request):
     """
     highlight_list = Highlight.objects.all().order_by('is_published', '-date_published')
 
-    paginator, highlights_on_page = lib.create_paginator(
+    paginator, highlights_on_page, pagination = paginate(
         queryset=highlight_list,
-        per_page=lib.PAGINATION_DASHBOARD_HIGHLIGHTS_PER_PAGE,
-        page=request.GET.get('p'),
-    )
-
-    pagination = lib.create_pagination(
-        queryset=highlight_list,
-        current_page=request.GET.get('p'),
+        request=request,
         per_page=lib.PAGINATION_DASHBOARD_HIGHLIGHTS_PER_PAGE,
         page_lead=lib.PAGINATION_DASHBOARD_HIGHLIGHTS_PAGES_TO_LEAD,
+        ordering=['is_published', '-date_published', '-id'],
     )
 
     for h in highlights_on_page:
-        h.description = h.truncate(max_length=75, allowed_tags=['a'])
+        h.description = h.excerpt_short
 
     instance = None
     if 'id' in request.GET:
@@ -411,18 +371,12 @@ def dashboard_notes(request):
     """
     notes = Note.objects.all().order_by("-date_published")
 
-    page = request.GET.get('p')
-    paginator, notes_on_page = lib.create_paginator(
-        queryset=notes,
-        per_page=lib.PAGINATION_DASHBOARD_NOTES_PER_PAGE,
-        page=page,
-    )
-
-    pagination = lib.create_pagination(
+    paginator, notes_on_page, pagination = paginate(
         queryset=notes,
-        current_page=page,
+        request=request,
         per_page=lib.PAGINATION_DASHBOARD_NOTES_PER_PAGE,
         page_lead=lib.PAGINATION_DASHBOARD_NOTES_PAGES_TO_LEAD,
+        ordering=['-date_published', '-id'],
     )
 
     instance = None
@@ -450,23 +404,18 @@ def dashboard_ideas(request):
         ?id=[idea slug]  specify a slug in query string to edit an idea
     """
     # obtain all the Ideas
-    idea_list = Idea.objects.all().order_by("order")
+    idea_list = Idea.objects.all().order_by('order', 'slug')
 
-    page = request.GET.get('p')
-    paginator, ideas_on_page = lib.create_paginator(
+    paginator, ideas_on_page, pagination = paginate(
         queryset=idea_list,
-        per_page=lib.PAGINATION_DASHBOARD_IDEAS_PER_PAGE,
-        page=page,
-    )
-    pagination = lib.create_pagination(
-        queryset=idea_list,
-        current_page=page,
+        request=request,
         per_page=lib.PAGINATION_DASHBOARD_IDEAS_PER_PAGE,
         page_lead=lib.PAGINATION_DASHBOARD_IDEAS_PAGES_TO_LEAD,
+        ordering=['order', 'slug'],
     )
 
     for i in ideas_on_page:
-        i.description = i.truncate(max_length=50)
+        i.description = i.excerpt_short
 
     # form for editing/creating a new idea
     idea_slug = None
@@ -508,17 +457,12 @@ def dashboard_thoughts(request):
     except Idea.DoesNotExist:
         return redirect(reverse('dashboard-ideas'))
 
-    page = request.GET.get('p')
-    paginator, thoughts_on_page = lib.create_paginator(
+    paginator, thoughts_on_page, pagination = paginate(
         queryset=thoughts,
-        per_page=lib.PAGINATION_DASHBOARD_THOUGHTS_PER_PAGE,
-        page=page,
-    )
-    pagination = lib.create_pagination(
-        queryset=thoughts,
-        current_page=page,
+        request=request,
         per_page=lib.PAGINATION_DASHBOARD_THOUGHTS_PER_PAGE,
         page_lead=lib.PAGINATION_DASHBOARD_THOUGHTS_PAGES_TO_LEAD,
+        ordering=['-date_published', '-slug'],
     )
 
     context = {
@@ -560,17 +504,12 @@ def dashboard_drafts(request):
     """
     drafts = Thought.objects.filter(is_draft=True, is_trash=False).order_by('-date_published')
 
-    page = request.GET.get('p')
-    paginator, drafts_on_page = lib.create_paginator(
+    paginator, drafts_on_page, pagination = paginate(
         queryset=drafts,
-        per_page=lib.PAGINATION_DASHBOARD_DRAFTS_PER_PAGE,
-        page=page,
-    )
-    pagination = lib.create_pagination(
-        queryset=drafts,
-        current_page=page,
+        request=request,
         per_page=lib.PAGINATION_DASHBOARD_DRAFTS_PER_PAGE,
         page_lead=lib.PAGINATION_DASHBOARD_DRAFTS_PAGES_TO_LEAD,
+        ordering=['-date_published', '-slug'],
     )
 
     context = {
@@ -588,17 +527,12 @@ def dashboard_trash(request):
     """
     trash = Thought.objects.filter(is_trash=True).order_by("-date_published")
 
-    page = request.GET.get('p')
-    paginator, trash_on_page = lib.create_paginator(
+    paginator, trash_on_page, pagination = paginate(
         queryset=trash,
-        per_page=lib.PAGINATION_DASHBOARD_DRAFTS_PER_PAGE,
-        page=page,
-    )
-    pagination = lib.create_pagination(
-        queryset=trash,
-        current_page=page,
+        request=request,
         per_page=lib.PAGINATION_DASHBOARD_DRAFTS_PER_PAGE,
         page_lead=lib.PAGINATION_DASHBOARD_DRAFTS_PAGES_TO_LEAD,
+        ordering=['-date_published', '-slug'],
     )
 
     context = {
@@ -610,6 +544,23 @@ def dashboard_trash(request):
     return render(request, 'blog/dashboard/dashboard_trash.html', context)
 
 
+@login_required(login_url='index')
+def dashboard_search(request):
+    """ User dashboard page to search everything, drafts, trash and notes
+        included
+    """
+    query, paginator, results, pagination = site_search.search_page(request, public_only=False)
+
+    context = {
+        'page_title': 'Search',
+        'query': query,
+        'results': results,
+        'paginator': paginator,
+        'pagination': pagination,
+    }
+    return render(request, 'blog/dashboard/dashboard_search.html', context)
+
+
 @login_required(login_url='index')
 def dashboard_backend(request):
     if 'next' in request.POST:
@@ -627,8 +578,46 @@ def dashboard_backend(request):
     action = action_args[0]
     action_args = action_args[1:]
 
+    ids = request.POST.getlist('id')
     fmm = lib.FlashMessageManager()
-    for i in request.POST.getlist('id'):
+
+    # thought, highlight, book and note actions work on all of the selected
+    # items at once (see blog.bulk)
+    results = None
+    undo = ''
+    if action == 'thought_trash' or action == 'thought_untrash':
+        results = bulk.trash_thoughts(ids, request.user, action == 'thought_trash')
+        undo = undo_button_html(request, input_data={
+            'action': 'thought_untrash' if action == 'thought_trash' else 'thought_trash',
+        })
+    elif action == 'thought_unpublish' or action == 'thought_publish':
+        auto_update = request.POST['auto_update'] if 'auto_update' in request.POST else False
+        results = bulk.publish_thoughts(ids, request.user, action == 'thought_publish', auto_update)
+        undo = undo_button_html(request, input_data={
+            'action': 'thought_unpublish' if action == 'thought_publish' else 'thought_publish',
+        })
+    elif action == 'thought_idea_move':
+        results = bulk.move_thoughts(ids, request.user, action_args[0] if action_args else '')
+    elif action == 'thought_delete':
+        results = bulk.delete_thoughts(ids, request.user)
+    elif action == 'highlight_delete':
+        results = bulk.delete_highlights(ids, request.user)
+    elif action == 'book_delete':
+        results = bulk.delete_books(ids, request.user)
+    elif action == 'note_delete':
+        results = bulk.delete_notes(ids, request.user)
+    elif action == 'idea_reorder':
+        # the ids are every Idea in their new order
+        Idea.apply_ordering(ids)
+        results = [(True, {'idea': lib.slugify(i)}) for i in ids]
+
+    if results is not None:
+        for status, tokens in results:
+            fmm.add_message({'action': action, 'status': status, 'tokens': tokens, 'extra_html': undo})
+        fmm.flush_messages_to_user(request)
+        return redirect(next_url)
+
+    for i in ids:
         if action == 'idea_delete':
             idea_name = Idea.objects.filter(slug=i)[0].name
             status, tokens = idea_safe_delete(i)
@@ -642,138 +631,21 @@ def dashboard_backend(request):
                 a.save()
 
             fmm.add_message({'action': action, 'status': status, 'tokens': tokens, 'extra_html': ''})
-        elif action == 'idea_order_up' or action == 'idea_order_down':
+        elif action == 'idea_order_up' or action == 'idea_order_down' or action == 'idea_move':
             try:
-                idea_slug = lib.slugify(i)
-                idea = Idea.objects.get(slug=idea_slug)
+                idea = Idea.objects.get(slug=lib.slugify(i))
 
-                if action == 'idea_order_up':
-                    adjacent_idea = idea.get_next()
+                if action == 'idea_move':
+                    position = int(action_args[0]) - 1
                 else:
-                    adjacent_idea = idea.get_prev()
+                    position = idea.get_position() + (1 if action == 'idea_order_up' else -1)
 
-                if adjacent_idea:
-                    idea_swap_order(idea.slug, adjacent_idea.slug)
+                if position >= 0:
+                    idea.move_to(position)
+                    if action == 'idea_move':
+                        fmm.add_message({'action': action, 'status': True, 'tokens': {'idea': idea.slug, 'position': position + 1}, 'extra_html': ''})
             except Exception as e:
-                fmm.add_message({'action': action, 'status': False, 'tokens': {'error': e.message}, 'extra_html': ''})
-        elif action == 'thought_trash' or action == 'thought_untrash':
-            status, tokens = thought_trash(i, action == 'thought_trash')
-            t = Thought.objects.filter(slug=i)[0]
-
-            if action == 'thought_trash':
-                if status:
-                    # log activity in database
-                    a = Activity()
-                    a.author = request.user
-                    a.type = Activity.get_type_id('Trashed Draft' if t.is_draft else 'Trashed Thought')
-                    a.store_tokens({'length': 1, 'title': t.title, 'slug': t.slug})
-                    a.url = reverse('dashboard-trash')
-                    a.save()
-
-                undo = undo_button_html(request, input_data={'action': 'thought_untrash'})
-            else:
-                if status:
-                    # log activity in database
-                    a = Activity()
-                    a.author = request.user
-                    a.type = Activity.get_type_id('Untrashed Draft' if t.is_draft else 'Untrashed Thought')
-                    a.store_tokens({'length': 1, 'title': t.title, 'slug': t.slug})
-                    a.url = reverse('dashboard-author') + "?id=" + t.slug
-                    a.save()
-
-                undo = undo_button_html(request, input_data={'action': 'thought_trash'})
-
-            fmm.add_message({'action': action, 'status': status, 'tokens': tokens, 'extra_html': undo})
-        elif action == 'thought_unpublish' or action == 'thought_publish':
-            t = Thought.objects.filter(slug=i)[0]
-            t_is_draft = t.is_draft
-            auto_update = request.POST['auto_update'] if 'auto_update' in request.POST else False
-            status, tokens = thought_publish(i, action == 'thought_publish', auto_update)
-
-            if action == 'thought_unpublish':
-                if status:
-                    # log activity in database
-                    a = Activity()
-                    a.author = request.user
-                    a.type = Activity.get_type_id('Unpublished Thought')
-                    a.store_tokens({'length': 1, 'title': t.title, 'slug': t.slug})
-                    a.url = reverse('dashboard-author') + "?id=" + t.slug
-                    a.save()
-
-                undo = undo_button_html(request, input_data={'action': 'thought_publish'})
-            else:
-                if status and t_is_draft:
-                    # log activity in database
-                    a = Activity()
-                    a.author = request.user
-                    a.type = Activity.get_type_id('Published Draft')
-                    a.store_tokens({'length': 1, 'title': t.title, 'slug': t.slug})
-                    a.url = reverse('dashboard-author') + "?id=" + t.slug
-                    a.save()
-
-                undo = undo_button_html(request, input_data={'action': 'thought_unpublish'})
-
-            fmm.add_message({'action': action, 'status': status, 'tokens': tokens, 'extra_html': undo})
-        elif action == 'thought_idea_move':
-            t = Thought.objects.filter(slug=i)[0]
-            t_old_idea = t.idea.name
-            status, tokens = thought_move(i, action_args[0] if action_args else '')
-            if status:
-                # log activity in database
-                a = Activity()
-                a.type = Activity.get_type_id('Moved Draft' if t.is_draft else 'Moved Thought')
-                a.author = request.user
-                a.store_tokens({'title': t.title, 'slug': t.slug, 'old_idea': t_old_idea, 'new_idea': action_args[0]})
-                a.url = reverse('dashboard-author') + "?id=" + t.slug
-                a.save()
-
-            fmm.add_message({'action': action, 'status': status, 'tokens': tokens, 'extra_html': ''})
-        elif action == 'thought_delete':
-            t = Thought.objects.filter(slug=i)[0]
-            t_idea = t.idea.slug
-            status, tokens = thought_delete(i)
-
-            if status:
-                # log activity in database
-                a = Activity()
-                a.type = Activity.get_type_id('Deleted Draft' if t.is_draft else 'Deleted Thought')
-                a.author = request.user
-                a.store_tokens({'length': 1, 'title': t.title, 'idea': t_idea})
-                a.url = reverse('dashboard-thoughts') + "?id=" + t_idea
-                a.save()
-
-            fmm.add_message({'action': action, 'status': status, 'tokens': tokens, 'extra_html': ''})
-        elif action == 'highlight_delete':
-            h = Highlight.objects.filter(id=i)[0]
-            h_title = h.title
-            status, tokens = highlight_delete(i)
-            if status:
-                # log activity in database
-                a = Activity()
-                a.type = Activity.get_type_id('Deleted Highlight')
-                a.author = request.user
-                a.store_tokens({'title': h_title, 'id': i})
-                a.url = reverse('dashboard-highlights')
-                a.save()
-
-            fmm.add_message({'action': action, 'status': status, 'tokens': tokens, 'extra_html': ''})
-        elif action == 'book_delete':
-            b = ReadingListItem.objects.filter(id=i)[0]
-            b_title = b.title
-            status, tokens = book_delete(i)
-            if status:
-                # log activity in database
-                a = Activity()
-                a.type = Activity.get_type_id('Deleted Book')
-                a.author = request.user
-                a.store_tokens({'title': b_title, 'id': i})
-                a.url = reverse('dashboard-books')
-                a.save()
-
-            fmm.add_message({'action': action, 'status': status, 'tokens': tokens, 'extra_html': ''})
-        elif action == 'note_delete':
-            n = Note.objects.filter(id=i)[0]
-            FormNoteView.delete(request, n.id)
+                fmm.add_message({'action': action, 'status': False, 'tokens': {'error': str(e)}, 'extra_html': ''})
         else:
             messages.add_message(request, messages.ERROR, "Unknown operation specified.")
             return redirect(next_url)
@@ -809,15 +681,23 @@ def logout(request):
 
 @login_required(login_url='index')
 def upload(request):
-    """ server logic for handling file/image/video/mp3 uploads
+    """ server logic for handling file/image/video/mp3 uploads. Responds
+        with the media url of each uploaded file (by original filename),
+        which the editor needs because the stored name depends on the
+        file's contents (see lib.upload_file).
     """
     files = {}
 
     if request.method == 'POST':
+        status = 200
         for file_input, f in request.FILES.items():
             result, files[f.name] = lib.upload_file(f)
+            if result:
+                files[f.name] = os.path.join(settings.MEDIA_URL, files[f.name])
+            else:
+                status = 400
 
-        return JsonResponse(files)
+        return JsonResponse(files, status=status)
     return JsonResponse({'msg': 'Unsupported method for Upload. (POST only)'})
 
 
@@ -903,168 +783,12 @@ def idea_safe_delete(idea_slug):
     return True, {'idea': idea_slug}
 
 
-def idea_swap_order(idea_slug, adjacent_idea_slug):
-    """ swap an idea with another given idea (based on the order column)
-
-        returns a 2-tuple with the first element being a boolean (True on success, False on failure)
-        and the second element being a string containing an information log message
-    """
-    try:
-        idea_slug = lib.slugify(idea_slug)
-        adjacent_idea_slug = lib.slugify(adjacent_idea_slug)
-
-        idea = Idea.objects.get(slug=idea_slug)
-        adjacent_idea = Idea.objects.get(slug=adjacent_idea_slug)
-
-        # swap the ordering on these two ideas
-        order = adjacent_idea.order
-
-        # order is unique, obliterate one value and save
-        adjacent_idea.order = -1
-        adjacent_idea.save()
-
-        adjacent_idea.order = idea.order
-        idea.order = order
-
-        idea.save()
-        adjacent_idea.save()
-    except (Exception, Idea.DoesNotExist) as e:
-        return False, {'error': e.message}
-    return True, {'idea': idea_slug}
-
-
-def thought_move(thought_slug, idea_slug):
-    """ move a thought from one idea to another
-
-        returns a 2-tuple with the first element being a boolean (True on success, False on failure)
-        and the second element being a dictionary containing string tokens
-    """
-    try:
-        thought_slug = lib.slugify(thought_slug)
-        idea_slug = lib.slugify(idea_slug)
-
-        thought = Thought.objects.get(slug=thought_slug)
-        idea = Idea.objects.get(slug=idea_slug)
-
-        thought.idea = idea
-        thought.save()
-    except (Exception, Thought.DoesNotExist, Idea.DoesNotExist) as e:
-        return False, {'error': e.message}
-
-    return True, {'thought': thought_slug, 'idea': idea.name}
-
-
-def thought_trash(thought_slug, trash=True):
-    """ set the is_trash field on a given Thought.
-
-        returns a 2-tuple with the first element being a boolean (True on success, False on failure)
-        and the second element being a string containing an information log message
-    """
-    try:
-        thought_slug = lib.slugify(thought_slug)
-        thought = Thought.objects.get(slug=thought_slug)
-
-        thought.is_trash = trash
-        thought.save()
-    except (Exception, Thought.DoesNotExist) as e:
-        return False, {'error': e.message}
-    return True, {'thought': thought_slug}
-
-
-def thought_publish(thought_slug, publish=False, auto_update=False):
-    """ Select a thought by the slug and change the is_draft field
-        back to True. This takes the thought visibility out of the front page
-        and idea detail page. Also, viewing the thought on its own page will
-        require authentication of a logged in user.
-
-        returns a 2-tuple with the first element being a boolean (True on success, False on failure)
-        and the second element being a string containing an information log message
-    """
-    try:
-        thought_slug = lib.slugify(thought_slug)
-        thought = Thought.objects.get(slug=thought_slug)
-        thought.is_draft = not publish
-        thought.save(auto_update=auto_update)
-    except (Exception, Thought.DoesNotExist) as e:
-        return False, {'error': e.message}
-    return True, {'thought': thought_slug, 'page': 'Drafts' if not publish else thought.idea.name}
-
-
-def thought_delete(thought_slug):
-    """ Delete a thought specified by thought_slug
-
-        returns a 2-tuple with the first element being a boolean (True on success, False on failure)
-        and the second element being a dictionary containing string tokens
-    """
-    try:
-        thought_slug = lib.slugify(thought_slug)
-        thought = Thought.objects.get(slug=thought_slug)
-        thought.delete()
-    except (Exception, Thought.DoesNotExist) as e:
-        return False, {'error': e.message}
-    return True, {'thought': thought_slug}
-
-
-def highlight_delete(highlight_id):
-    """ Delete a highlight specified by highlight_id
-
-        returns a 2-tuple with the first element being a boolean (True on success, False on failure)
-        and the second element being a string containing an information log message
-    """
-    try:
-        highlight_id = int(highlight_id)
-        highlight = Highlight.objects.get(id=highlight_id)
-        highlight_title = highlight.title
-        highlight.delete()
-    except (Exception, Highlight.DoesNotExist) as e:
-        return False, {'highlight': highlight_id, 'error': e.message}
-    return True, {'highlight_title': highlight_title, 'highlight_id': highlight_id}
-
-
-def book_delete(book_id):
-    """ Delete a book specified by a book_id
-
-        returns a 2-tuple with the first element being a boolean (True on success, False on failure)
-        and the second element being a string containing an information log message
-    """
-    try:
-        book = ReadingListItem.objects.get(id=book_id)
-        book_title = "'" + book.title + "'" + ' (#%d)' % book.id
-        book.delete()
-    except (Exception, ReadingListItem.DoesNotExist) as e:
-        return False, {'error': e.message}
-    return True, {'book_title': book_title}
-
-
-def find_unique_slug(unsafe_slug, model):
-    """ take a string and generate a slug using the lib.slugify function
-        and make sure it does not collide with anything in the database
-
-        specify a model to search for collisions against
-    """
-    test_slug = lib.slugify(unsafe_slug)
-
-    collision_idx = 2
-    while model.objects.filter(slug=test_slug).exists():
-        test_slug = lib.slugify(unsafe_slug + "-" + str(collision_idx))
-        collision_idx += 1
-    return test_slug
-
-
 def dashboard_stats():
-    """ compile statistics from database and return a dictionary object.
+    """ return the dashboard statistics as a dictionary object. The counts
+        are kept up to date in the Statistic table by the model save and
+        delete methods, so this is a single query.
     """
-    stats = {
-        'thought_count': Thought.objects.filter(is_draft=False, is_trash=False).count(),
-        'draft_count': Thought.objects.filter(is_draft=True, is_trash=False).count(),
-        'trash_count': Thought.objects.filter(is_trash=True).count(),
-        'idea_count': Idea.objects.all().count(),
-        'highlight_count': Highlight.objects.filter(is_published=True).count(),
-        'read_book_count': ReadingListItem.objects.filter(wishlist=False).count(),
-        'wish_book_count': ReadingListItem.objects.filter(wishlist=True).count(),
-        'total_book_count': ReadingListItem.objects.all().count(),
-    }
-    return stats
+    return Statistic.get_stats()
 
 
 ###############################################################################
@@ -1105,41 +829,34 @@ class FormIdeaView(View):
             callback = request.POST['next']
 
         # prevent accidental edit when writing new post with same slug
+        slug_source = request.POST.get('slug') or request.POST['name']
         if 'edit' in request.POST:
             slug = lib.slugify(request.POST['edit'])
-        elif 'slug' in request.POST and request.POST['slug']:
-            slug = find_unique_slug(request.POST['slug'], Idea)
         else:
-            slug = find_unique_slug(request.POST['name'], Idea)
+            slug = lib.find_unique_slug(slug_source, Idea)
         request.POST['slug'] = slug
 
         try:
             instance = Idea.objects.get(slug=request.POST['slug'])
             msg = "Successfully edited Idea '%s'" % instance.name
             activity.type = Activity.get_type_id('Edited Idea')
-
-            # keep track of idea icon
-            if 'icon-clear' in request.POST and instance.icon:
-                lib.delete_file(instance.icon.name)
-            original_icon = instance.icon
         except Idea.DoesNotExist:
             instance = None
-            original_icon = None
             activity.type = Activity.get_type_id('Create Idea')
             msg = "Successfully created Idea '%s'" % request.POST['name']
 
         idea_form = IdeaForm(request.POST, request.FILES, instance=instance)
         if idea_form.is_valid():
-            idea = idea_form.save()
+            if instance:
+                idea = idea_form.save()
+            else:
+                # the slug can be taken by someone else before the insert
+                idea = lib.save_with_unique_slug(idea_form.save(commit=False), slug_source)
 
-            activity.url = reverse('dashboard-thoughts') + "?id=" + request.POST['slug']
-            activity.store_tokens({'name': request.POST['name'], 'slug': request.POST['slug']})
+            activity.url = reverse('dashboard-thoughts') + "?id=" + idea.slug
+            activity.store_tokens({'name': request.POST['name'], 'slug': idea.slug})
             activity.save()
 
-            # delete old icon if necessary
-            if original_icon and idea.icon and original_icon.name != idea.icon.name:
-                lib.delete_file(original_icon.name)
-
             if callback:
                 messages.add_message(request, messages.SUCCESS, msg)
                 return redirect(callback)
@@ -1194,12 +911,11 @@ class FormThoughtView(View):
             callback = lib.replace_tokens(request.POST['next'], {'idea': request.POST['idea']})
 
         # prevent accidental edit when writing new post with same slug
+        slug_source = request.POST.get('slug') or request.POST['title']
         if 'edit' in request.POST:
             slug = lib.slugify(request.POST['edit'])
-        elif 'slug' in request.POST and request.POST['slug']:
-            slug = find_unique_slug(request.POST['slug'], Thought)
         else:
-            slug = find_unique_slug(request.POST['title'], Thought)
+            slug = lib.find_unique_slug(slug_source, Thought)
         request.POST['slug'] = slug
 
         # do some work on is_draft (connected to submit button values)
@@ -1216,19 +932,9 @@ class FormThoughtView(View):
                 activity.type = Activity.get_type_id('Published Draft')
             else:
                 activity.type = Activity.get_type_id('Edited Thought')
-
-            # delete preview if someone checks clear
-            if 'preview-clear' in request.POST and instance.preview:
-                lib.delete_file(instance.preview.name)
-
-            # keep track of images to see if we need to delete some later
-            original_preview = instance.preview
-            inline_images = [os.path.basename(i) for i in instance.get_image_urls()]
         except Thought.DoesNotExist:
             # received new thought request, create new Thought
             instance = None
-            original_preview = None
-            inline_images = []
 
             # determine whether we are saving a draft or publishing a thought (for Activity Feed)
             if request.POST['is_draft']:
@@ -1241,22 +947,17 @@ class FormThoughtView(View):
 
         thought_form = ThoughtForm(request.POST, request.FILES, instance=instance)
         if thought_form.is_valid():
-            thought = thought_form.save()
+            if instance:
+                thought = thought_form.save()
+            else:
+                # the slug can be taken by someone else before the insert
+                thought = lib.save_with_unique_slug(thought_form.save(commit=False), slug_source)
+                slug = thought.slug
 
-            activity.url = reverse('dashboard-author') + "?id=" + request.POST['slug']
+            activity.url = reverse('dashboard-author') + "?id=" + thought.slug
             activity.store_tokens({'length': 1, 'title': request.POST['title']})
             activity.save()
 
-            # check if new preview image is uploaded (or clear is checked) and delete old preview
-            if original_preview and thought.preview and original_preview.name != thought.preview.name:
-                lib.delete_file(original_preview.name)
-
-            # check if we need to delete any inline images
-            new_inline_images = [os.path.basename(i) for i in thought.get_image_urls()]
-            for image in inline_images:
-                if image not in new_inline_images:
-                    lib.delete_file(os.path.join(paths.MEDIA_IMAGE_DIR, image))
-
             if callback:
                 if request.POST['is_draft']:
                     messages.add_message(request, messages.WARNING, "Saved draft '%s' for later." % slug)
@@ -1324,14 +1025,8 @@ class FormHighlightView(View):
 
             # log activity in database
             activity.type = Activity.get_type_id('Edited Highlight')
-
-            # keep track of highlight icon
-            if 'icon-clear' in request.POST and instance.icon:
-                lib.delete_file(instance.icon.name)
-            original_icon = instance.icon
         except Highlight.DoesNotExist:
             instance = None
-            original_icon = None
 
             # log activity in database
             activity.type = Activity.get_type_id('Added New Highlight')
@@ -1344,19 +1039,21 @@ class FormHighlightView(View):
 
             try:
                 # do a check to see if there is a backlog of highlights and if there is
-                # schedule this highlight to be published in the future
-                unpublished_highlights = Highlight.objects.filter(is_published=False).exclude(title=highlight.title)
+                # schedule this highlight to be published in the future (the
+                # publish_scheduled task publishes it once publish_at has passed)
+                unpublished_highlights = Highlight.objects.filter(is_published=False).exclude(id=highlight.id).count()
                 latest_highlight = Highlight.objects.filter(is_published=True).order_by('-date_published')[:1][0]
 
-                last_published = latest_highlight.date_published.replace(tzinfo=None)
+                last_published = latest_highlight.date_published
 
+                if highlight.is_published or highlight.publish_at:
+                    # an edit of a published or already scheduled highlight
+                    pass
                 # if there are highlights that are unpublished or the last published highlight was < 24 hours ago
-                if len(unpublished_highlights) > 0 or (datetime.now() - last_published) < timedelta(2):
+                elif unpublished_highlights > 0 or (timezone.now() - last_published) < timedelta(2):
                     # calculate publish date by multiplying 2 by number of unpublished highlights including the current one (+/- some random jitter)
                     jitter = timedelta(hours=random.randint(-6, 6), minutes=random.randint(-30, 30))
-                    time_to_publish = last_published + timedelta(days=(1.25 * (len(unpublished_highlights) + 1))) + jitter
-
-                    publish_highlight.apply_async((highlight.id,), eta=time_to_publish)
+                    highlight.publish_at = last_published + timedelta(days=(1.25 * (unpublished_highlights + 1))) + jitter
                 else:
                     highlight.is_published = True
             except IndexError as e:
@@ -1368,10 +1065,6 @@ class FormHighlightView(View):
             activity.url = reverse('dashboard-highlights') + "?id=" + str(highlight.id)
             activity.save()
 
-            # remove old icon file if necessary
-            if original_icon and highlight.icon and original_icon.name != highlight.icon.name:
-                lib.delete_file(original_icon.name)
-
             if callback:
                 messages.add_message(request, messages.SUCCESS, msg)
                 return redirect(callback)
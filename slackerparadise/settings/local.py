@@ -79,6 +79,18 @@ USE_L10N = True
 USE_TZ = True
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'slackerparadise',
+    }
+}
+
+# anonymous page cache (see blog/pagecache.py)
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
 # Flash Message settings
 MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
 
@@ -118,3 +130,15 @@ TEMPLATES = [
 CELERY_BROKER_URL=os.environ['REDIS_URL']
 CELERY_RESULT_BACKEND=os.environ['REDIS_URL']
 CELERY_TASK_SERIALIZER="json"
+CELERY_BEAT_SCHEDULE = {
+    # publish the Highlights and drafts that are due (see blog/bulk.py)
+    'publish-scheduled': {
+        'task': 'blog.tasks.publish_scheduled',
+        'schedule': 60,
+    },
+    # delete media files nothing refers to anymore (see blog/media.py)
+    'collect-orphaned-media': {
+        'task': 'blog.tasks.collect_orphaned_media',
+        'schedule': 60 * 60 * 24,
+    },
+}